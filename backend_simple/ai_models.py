@@ -1,37 +1,287 @@
+"""
+Model loading and the shared inference backend.
+
+TensorFlow (and onnxruntime) are only imported when the models load, which the API does on a
+background warmup task (start_warmup) so it can serve auth, CRUD and health checks meanwhile.
+`ready` flips to True once the backend exists and every inference path has run on a dummy input.
+"""
+
 import os
-import tensorflow as tf
+import time
+import asyncio
+import hashlib
+import threading
+import numpy as np
+
+from .analysis_executor import AnalysisOverloaded
+from .inference_batcher import MicroBatcher
+from .app_simple.xai_simple import classify_with_grad_cam
+from .app_simple.ai_pipeline_simple import NO_TUMOR_INDEX
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 CLASSIFICATION_MODEL_PATH = os.path.join(BASE_DIR, "models", "model.h5")
 SEGMENTATION_MODEL_PATH = os.path.join(BASE_DIR, "models", "segmentation_model.h5")
+RUNTIME_MODEL_DIRS = {
+    "tflite": os.path.join(BASE_DIR, "models", "tflite"),
+    "onnx": os.path.join(BASE_DIR, "models", "onnx"),
+}
+
+# Which inference backend serves the models (see inference_backends.py):
+#   keras   the .h5 files
+#   tflite  models/tflite/<name>_<TFLITE_VARIANT>.tflite written by export_models.py
+#   onnx    models/onnx/<name>.onnx written by export_models.py --onnx (requirements-onnx.txt)
+#   random  tiny random stand-ins, for tests and benchmarks without model files
+# tflite and onnx keep the Keras classifier loaded, but only run it for Grad-CAM on tumor predictions.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras").lower()
+TFLITE_VARIANT = os.getenv("TFLITE_VARIANT", "dynamic")  # "dynamic" or "int8"
+TFLITE_THREADS = int(os.getenv("TFLITE_THREADS", str(os.cpu_count() or 1)))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", str(os.cpu_count() or 1)))
+RANDOM_BACKEND_SEED = int(os.getenv("RANDOM_BACKEND_SEED", "0"))
+# Batch-of-one calls timed at startup to report model.predict() vs. compiled-call overhead (0 = skip).
+INFERENCE_OVERHEAD_RUNS = int(os.getenv("INFERENCE_OVERHEAD_RUNS", "5"))
+
+# Micro-batching knobs: trade p50 latency (wait window) against throughput (batch size).
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+BATCH_QUEUE_DEPTH = int(os.getenv("BATCH_QUEUE_DEPTH", "64"))
 
 classification_model = None
 segmentation_model = None
+backend = None
+classification_batcher = None
+segmentation_batcher = None
+
+# Per-model startup cost, filled in by load_models(): {name: {"path", "load_seconds", "weights_mb", "params", "sha256"}}
+model_stats = {}
+
+# Content hash of the loaded model files; part of every analysis cache key.
+model_version = ""
+
+# Filled in by load_models(): {"load_seconds", "warmup_ms": {path: ms}, "call_overhead": {model: {"predict_ms", "compiled_ms", "overhead_ms"}}}
+inference_stats = {}
+
+# Readiness: set once the models are loaded and the inference graphs have been traced.
+ready = False
+load_error = None
+warmup_task = None
+_load_lock = threading.Lock()
+
+
+class ModelsWarmingUp(AnalysisOverloaded):
+    """Raised while the startup warmup is still loading the models (503 + Retry-After)."""
+
+
+def dice_loss(y_true, y_pred, smooth=1e-6):
+    import tensorflow as tf
+
+    y_true_f = tf.keras.layers.Flatten()(y_true)
+    y_pred_f = tf.keras.layers.Flatten()(y_pred)
+    inter = tf.reduce_sum(y_true_f * y_pred_f)
+    return 1.0 - ((2.0 * inter + smooth) / (tf.reduce_sum(y_true_f) + tf.reduce_sum(y_pred_f) + smooth))
+
+CUSTOM_OBJECTS = {"dice_loss": dice_loss}
+
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_one(name, path, custom_objects=None):
+    """Loads a single .h5 model and records how long it took and how much memory its weights use."""
+    if not os.path.exists(path):
+        print(f"❌ Error: File not found at {path}")
+        return None
+
+    import tensorflow as tf
+
+    start = time.perf_counter()
+    model = tf.keras.models.load_model(path, custom_objects=custom_objects, compile=False)
+    elapsed = time.perf_counter() - start
+
+    weight_bytes = sum(int(np.prod(w.shape)) * np.dtype(w.dtype).itemsize for w in model.weights)
+    model_stats[name] = {
+        "path": path,
+        "load_seconds": round(elapsed, 3),
+        "weights_mb": round(weight_bytes / (1024 * 1024), 1),
+        "params": int(model.count_params()),
+        "backend": "keras",
+        "sha256": _file_sha256(path),
+    }
+    print(f"✅ {name} model loaded in {elapsed:.2f}s ({model_stats[name]['weights_mb']} MB weights): {path}")
+    return model
+
+
+def _load_runtime(kind, name):
+    """Opens an exported <name> model for the "tflite" / "onnx" backend, or returns None if there is none."""
+    from .inference_backends import RUNTIME_EXTENSIONS, load_runtime_model
+
+    suffix = f"_{TFLITE_VARIANT}" if kind == "tflite" else ""
+    path = os.path.join(RUNTIME_MODEL_DIRS[kind], f"{name}{suffix}{RUNTIME_EXTENSIONS[kind]}")
+    if not os.path.exists(path):
+        print(f"⚠️ {name}: no {kind} export at {path} (see export_models.py).")
+        return None
+
+    threads = TFLITE_THREADS if kind == "tflite" else ONNX_THREADS
+    start = time.perf_counter()
+    model = load_runtime_model(kind, path, threads)
+    elapsed = time.perf_counter() - start
+    model_stats[f"{name}_{kind}"] = {
+        "path": path,
+        "backend": f"tflite-{TFLITE_VARIANT}" if kind == "tflite" else kind,
+        "threads": threads,
+        "load_seconds": round(elapsed, 3),
+        "weights_mb": round(os.path.getsize(path) / (1024 * 1024), 1),
+        "sha256": _file_sha256(path),
+    }
+    print(f"✅ {name} {kind} model ({threads} threads) loaded in {elapsed:.2f}s: {path}")
+    return model
+
+
+def _create_backend(kind):
+    """Builds the configured backend; returns None if the models it needs could not be loaded."""
+    global classification_model, segmentation_model
+    from .inference_backends import KerasBackend, RandomBackend, RUNTIME_BACKENDS
+
+    if kind == "random":
+        random_backend = RandomBackend(RANDOM_BACKEND_SEED)
+        classification_model, segmentation_model = random_backend.classifier, random_backend.segmenter
+        model_stats["random"] = {**random_backend.describe(), "sha256": f"random-seed-{RANDOM_BACKEND_SEED}"}
+        print(f"⚠️ Using the random stand-in backend (seed {RANDOM_BACKEND_SEED}): predictions are meaningless.")
+        return random_backend
+
+    # Every backend explains with the Keras classifier's gradients.
+    if classification_model is None:
+        classification_model = _load_one("classification", CLASSIFICATION_MODEL_PATH)
+
+    if kind in RUNTIME_BACKENDS:
+        segmenter = _load_runtime(kind, "segmentation")
+        if segmenter is not None and classification_model is not None:
+            segmentation_model = segmenter
+            return RUNTIME_BACKENDS[kind](classification_model, segmenter, _load_runtime(kind, "classification"))
+        print(f"⚠️ {kind} backend unavailable. Falling back to Keras.")
+    elif kind != "keras":
+        print(f"⚠️ Unknown INFERENCE_BACKEND '{kind}'. Falling back to Keras.")
+
+    if segmentation_model is None:
+        segmentation_model = _load_one("segmentation", SEGMENTATION_MODEL_PATH, custom_objects=CUSTOM_OBJECTS)
+    if classification_model is None or segmentation_model is None:
+        return None
+    return KerasBackend(classification_model, segmentation_model)
+
 
 def load_models():
     """
-    Loads the .h5 files into memory so the AI can run.
+    Loads the models, builds the configured inference backend and warms it up.
+    Safe to call repeatedly and from several threads: models are loaded once per process and
+    shared by every route.
     """
-    global classification_model, segmentation_model
+    global backend, model_version, ready, load_error
+
+    with _load_lock:
+        if backend is not None:
+            return
+
+        print(f"⏳ Loading AI models from disk ({INFERENCE_BACKEND} backend)...")
+        start = time.perf_counter()
+        try:
+            active = _create_backend(INFERENCE_BACKEND)
+            if active is None:
+                load_error = "Model files are missing or failed to load."
+                return
+            _warm_up(active)
+            model_version = hashlib.sha256(
+                "|".join(f"{name}:{stats['sha256']}" for name, stats in sorted(model_stats.items())).encode()
+            ).hexdigest()[:16]
+            inference_stats["load_seconds"] = round(time.perf_counter() - start, 3)
+            backend, ready, load_error = active, True, None
+            print(f"✅ Models ready in {inference_stats['load_seconds']:.2f}s.")
+        except Exception as e:
+            load_error = str(e)
+            print(f"🔥 Error loading models: {e}")
+
+
+async def start_warmup():
+    """
+    Loads and warms the models on a worker thread so startup doesn't wait for TensorFlow.
+    Returns the task; requests that need the models get ModelsWarmingUp until it finishes.
+    """
+    global warmup_task
+    if warmup_task is None:
+        warmup_task = asyncio.create_task(asyncio.to_thread(load_models))
+    return warmup_task
 
-    if classification_model is not None and segmentation_model is not None:
-        return  
 
-    print("⏳ Loading AI models from disk...")
+def readiness():
+    return {
+        "ready": ready,
+        "warming_up": warmup_task is not None and not warmup_task.done(),
+        "backend": INFERENCE_BACKEND,
+        "error": load_error,
+        "load_seconds": inference_stats.get("load_seconds"),
+    }
+
+
+def _warm_up(active):
+    """Traces every compiled inference path once, then measures what predict() would have cost per call."""
+    inference_stats["warmup_ms"] = active.warmup()
+    print(f"🔥 Inference paths traced: {inference_stats['warmup_ms']} ms")
+    if INFERENCE_OVERHEAD_RUNS > 0 and hasattr(active, "measure_call_overhead"):
+        inference_stats["call_overhead"] = active.measure_call_overhead(INFERENCE_OVERHEAD_RUNS)
+        for name, stats in inference_stats["call_overhead"].items():
+            print(f"   {name}: predict() {stats['predict_ms']} ms vs compiled {stats['compiled_ms']} ms per image")
+
+
+def get_backend():
+    """
+    Returns the shared inference backend. While the startup warmup is running this raises
+    ModelsWarmingUp instead of blocking; without a warmup (scripts) the models load on first use.
+    None if a model file is missing or failed to load.
+    """
+    if ready:
+        return backend
+    if warmup_task is not None and not warmup_task.done():
+        raise ModelsWarmingUp("AI models are still loading. Try again shortly.")
+    load_models()
+    return backend
+
+
+def _make_batcher(name, predict_fn):
+    return MicroBatcher(
+        name,
+        predict_fn,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        max_queue_depth=BATCH_QUEUE_DEPTH,
+    )
+
+
+def get_batchers():
+    """
+    Returns the shared (classification_batcher, segmentation_batcher) pair sitting in front of
+    the inference backend. Both are None when the models are not loaded.
+
+    The classification batcher classifies the whole batch in one pass and runs Grad-CAM only
+    for the images a tumor class won, so each caller gets (probabilities, heatmap) for its image;
+    the heatmap is all zero for no-tumor images.
+    """
+    global classification_batcher, segmentation_batcher
+    active = get_backend()
 
-    try:
-        if os.path.exists(CLASSIFICATION_MODEL_PATH):
-            classification_model = tf.keras.models.load_model(CLASSIFICATION_MODEL_PATH, compile=False)
-            print(f"✅ Classification model loaded: {CLASSIFICATION_MODEL_PATH}")
-        else:
-            print(f"❌ Error: File not found at {CLASSIFICATION_MODEL_PATH}")
+    if classification_batcher is None and active is not None:
+        classification_batcher = _make_batcher("classification", lambda batch: classify_with_grad_cam(active, batch, NO_TUMOR_INDEX))
+    if segmentation_batcher is None and active is not None:
+        segmentation_batcher = _make_batcher("segmentation", active.segment)
+    return classification_batcher, segmentation_batcher
 
-        if os.path.exists(SEGMENTATION_MODEL_PATH):
-            segmentation_model = tf.keras.models.load_model(SEGMENTATION_MODEL_PATH, compile=False)
-            print(f"✅ Segmentation model loaded: {SEGMENTATION_MODEL_PATH}")
-        else:
-            print(f"❌ Error: File not found at {SEGMENTATION_MODEL_PATH}")
 
-    except Exception as e:
-        print(f"🔥 Error loading models: {e}")
\ No newline at end of file
+def batcher_stats():
+    return {
+        name: batcher.stats()
+        for name, batcher in (("classification", classification_batcher), ("segmentation", segmentation_batcher))
+        if batcher is not None
+    }
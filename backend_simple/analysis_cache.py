@@ -0,0 +1,134 @@
+"""
+Content-addressed cache of analysis results.
+
+Key = SHA-256 of the decoded image pixels (shape + BGR bytes) plus the loaded model version,
+so the same slice uploaded twice, under any filename or container format, maps to one entry.
+Tier 1 is an in-process LRU bounded by approximate size; tier 2 is the Mongo
+`analysis_cache` collection, shared by all API processes and kept across restarts.
+
+Entries store the prediction, ai_facts and the overlay URLs. On a hit the overlays are copied
+to the new analysis's own file names (see run_simple_analysis), so studies never share files.
+An entry whose overlay files have been removed from disk is treated as a miss.
+"""
+
+import copy
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .database import db
+from . import ai_models
+
+ANALYSIS_CACHE_MAX_MB = float(os.getenv("ANALYSIS_CACHE_MAX_MB", "32"))
+ANALYSIS_CACHE_PERSIST = os.getenv("ANALYSIS_CACHE_PERSIST", "1") == "1"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class AnalysisResultCache:
+    def __init__(self, max_bytes: int, collection=None):
+        self.max_bytes = max_bytes
+        self.collection = collection
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(image: np.ndarray) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{image.shape}|{image.dtype}|".encode())
+        digest.update(np.ascontiguousarray(image).tobytes())
+        digest.update(f"|{ai_models.model_version}".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _artifacts_exist(entry: Dict[str, Any]) -> bool:
+        for url in entry["image_paths"].values():
+            if url and url != "null" and not os.path.exists(os.path.join(BASE_DIR, url.lstrip("/"))):
+                return False
+        return True
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        size = len(json.dumps(entry, default=str))
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (entry, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _forget(self, key: str):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns a copy of the cached entry, or None on a miss."""
+        cached = self._entries.get(key)
+        if cached is not None:
+            entry = cached[0]
+            if self._artifacts_exist(entry):
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(entry)
+            self._forget(key)
+            self.stale += 1
+
+        if self.collection is not None:
+            doc = await self.collection.find_one({"_id": key})
+            if doc is not None:
+                entry = doc["entry"]
+                if self._artifacts_exist(entry):
+                    self._remember(key, entry)
+                    self.persistent_hits += 1
+                    return copy.deepcopy(entry)
+                await self.collection.delete_one({"_id": key})
+                self.stale += 1
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, entry: Dict[str, Any]):
+        entry = copy.deepcopy(entry)
+        self._remember(key, entry)
+        if self.collection is not None:
+            try:
+                await self.collection.replace_one(
+                    {"_id": key},
+                    {"_id": key, "entry": entry, "model_version": ai_models.model_version, "created_at": datetime.utcnow()},
+                    upsert=True,
+                )
+            except Exception as e:
+                print(f"⚠️ Failed to persist analysis cache entry: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.persistent_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+result_cache = AnalysisResultCache(
+    max_bytes=int(ANALYSIS_CACHE_MAX_MB * 1024 * 1024),
+    collection=db.analysis_cache if ANALYSIS_CACHE_PERSIST else None,
+)
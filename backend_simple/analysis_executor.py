@@ -0,0 +1,65 @@
+"""
+Bounded worker pool for the CPU-bound analysis stages (image decode, Grad-CAM, mask
+post-processing, overlay writes), so they never run on the uvicorn event loop.
+
+Admission is per analysis: a request takes a slot before any work starts and is rejected
+with AnalysisOverloaded once ANALYSIS_MAX_PENDING analyses are already running or queued.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", "8"))
+ANALYSIS_RETRY_AFTER_SECONDS = 5
+
+
+class AnalysisOverloaded(Exception):
+    """Raised when the analysis pool cannot accept more work; routes answer 503."""
+
+
+class AnalysisExecutor:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis")
+        # Only touched from the event loop thread, so plain counters are enough.
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Reserves room for one analysis or raises AnalysisOverloaded immediately."""
+        if self.in_flight >= self.max_pending:
+            self.rejected += 1
+            raise AnalysisOverloaded(
+                f"Analysis queue is full ({self.in_flight}/{self.max_pending} in progress). Retry shortly."
+            )
+        self.in_flight += 1
+        self.accepted += 1
+        try:
+            yield self
+        finally:
+            self.in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs a blocking callable on the pool and awaits its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }
+
+
+analysis_executor = AnalysisExecutor(ANALYSIS_WORKERS, ANALYSIS_MAX_PENDING)
@@ -1,16 +1,23 @@
-import tensorflow as tf
 import numpy as np
 import cv2
 import os
-from typing import Dict, Any
+import shutil
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Union
 from .reasoner_simple import simple_reasoner
-from .xai_simple import generate_grad_cam, save_grad_cam_overlay, save_segmentation_overlay
+from .xai_simple import (
+    classify_with_grad_cam, grad_cam_all_classes, save_grad_cam_overlay, save_segmentation_overlay
+)
 
-print("AI pipeline module imported. Models will be provided at runtime by the caller.")
+print("AI pipeline module imported. An inference backend will be provided at runtime by the caller.")
 
 IMAGE_SIZE_CLASSIFY = (128, 128)  
 IMAGE_SIZE_SEGMENT = (256, 256)   
 CLASSES = ["glioma", "meningioma", "notumor", "pituitary"]
+NO_TUMOR_INDEX = CLASSES.index("notumor")
 LAST_CONV_LAYER_NAME = "block5_conv3"
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
@@ -18,8 +25,8 @@ XAI_OUTPUT_DIR = os.path.join(UPLOADS_DIR, "xai_outputs")
 
 os.makedirs(XAI_OUTPUT_DIR, exist_ok=True)
 
-def preprocess_image(image_path: str, size: tuple) -> np.ndarray:
-    """Loads and preprocesses image for a given model size."""
+def load_image(image_path: str) -> np.ndarray:
+    """Decodes an image file once into a 3-channel BGR uint8 array."""
     img = cv2.imread(image_path)
     if img is None:
         raise ValueError(f"Could not read image: {image_path}")
@@ -28,12 +35,19 @@ def preprocess_image(image_path: str, size: tuple) -> np.ndarray:
         img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
     elif img.shape[2] == 4:
         img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
 
+def preprocess_array(img: np.ndarray, size: tuple) -> np.ndarray:
+    """Turns a decoded BGR image into a (1, H, W, 3) model tensor for the given size."""
     img = cv2.resize(img, size)
     img_array = img / 255.0
     img_array = np.expand_dims(img_array, axis=0)
     return img_array
 
+def preprocess_image(image_path: str, size: tuple) -> np.ndarray:
+    """Loads and preprocesses image for a given model size."""
+    return preprocess_array(load_image(image_path), size)
+
 def extract_facts_from_mask(mask: np.ndarray) -> Dict[str, Any]:
     """Bridge from neural output to symbolic facts."""
     print("Extracting real facts from mask...")
@@ -72,20 +86,136 @@ def extract_facts_from_mask(mask: np.ndarray) -> Dict[str, Any]:
         "shape_irregularity": round(irregularity, 2),
     }
 
-async def run_simple_analysis(
-    image_path: str,
-    original_filename: str,
-    clf_model,
-    seg_model
-) -> Dict[str, Any]:
-    
-    if clf_model is None or seg_model is None:
-        raise Exception("AI Models are not loaded. Server configuration error.")
+def refine_unet_mask(mask_2d: np.ndarray) -> np.ndarray:
+    """Thresholds the raw U-Net output and keeps only the largest cleaned-up tumor region."""
+    mask_norm = cv2.normalize(mask_2d, None, 0, 255, cv2.NORM_MINMAX)
+    final_mask_uint8 = mask_norm.astype(np.uint8)
+    _, final_mask_uint8 = cv2.threshold(final_mask_uint8, 100, 255, cv2.THRESH_BINARY)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_CLOSE, kernel)
+    final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_OPEN, kernel)
 
-    print("--- Running 2-Stage Neurosymbolic Pipeline ---")
+    contours, _ = cv2.findContours(final_mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        final_mask_uint8 = np.zeros_like(final_mask_uint8)
+        cv2.drawContours(final_mask_uint8, [largest_contour], -1, 255, -1)
+        print(f"   Refined to largest tumor region (area: {cv2.contourArea(largest_contour):.0f} pixels)")
+    return final_mask_uint8
+
+def mask_from_grad_cam(heatmap: np.ndarray) -> np.ndarray:
+    """Fallback mask when the U-Net is blank: the hottest Grad-CAM region, cleaned up."""
+    grad_cam_resized = cv2.resize(heatmap, (256, 256))
+
+    if len(grad_cam_resized.shape) == 3:
+        grad_cam_resized = cv2.cvtColor(grad_cam_resized, cv2.COLOR_BGR2GRAY)
+    grad_cam_resized = cv2.normalize(grad_cam_resized, None, 0, 255, cv2.NORM_MINMAX)
+    grad_cam_uint8 = grad_cam_resized.astype(np.uint8)
+    _, final_mask_uint8 = cv2.threshold(grad_cam_uint8, 180, 255, cv2.THRESH_BINARY)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_CLOSE, kernel)
+    final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_OPEN, kernel)
+    contours, _ = cv2.findContours(final_mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        final_mask_uint8 = np.zeros_like(final_mask_uint8)
+        cv2.drawContours(final_mask_uint8, [largest_contour], -1, 255, -1)
+        print(f"   Extracted tumor core from Grad-CAM (area: {cv2.contourArea(largest_contour):.0f} pixels)")
+    return final_mask_uint8
+
+def _refine_mask(mask, heatmap) -> np.ndarray:
+    """Morphology stage: U-Net output (or the Grad-CAM fallback) -> final uint8 tumor mask."""
+    mask_2d = np.squeeze(mask[0])
+    print(f"DEBUG: Mask Min={mask_2d.min():.4f}, Max={mask_2d.max():.4f}")
+
+    if mask_2d.max() > 0.01:
+        print("✅ U-Net found a tumor region.")
+        return refine_unet_mask(mask_2d)
+    print("⚠️ U-Net returned blank. Falling back to Grad-CAM attention mask.")
+    return mask_from_grad_cam(heatmap)
+
+def _write_mask_overlay(image, final_mask_uint8, output_path):
+    try:
+        save_segmentation_overlay(
+            image=image,
+            mask=final_mask_uint8,
+            output_path=output_path,
+            alpha=0.5,  
+            use_red_overlay=True  
+        )
+        print(f"✅ Colored segmentation overlay saved to {output_path}")
+    except Exception as e:
+        print(f"⚠️ Failed to create colored overlay, falling back to plain mask: {e}")
+        cv2.imwrite(output_path, final_mask_uint8)
+
+def explain_classes(backend, image: Union[str, np.ndarray], original_filename: str, top_k: int = len(CLASSES)):
+    """
+    Grad-CAM overlays for the top-k classes of one stored image (a path, or an already decoded
+    BGR array), computed in a single batched pass. Returns [{class, probability, grad_cam}] by probability.
+    """
+    if isinstance(image, str):
+        image = load_image(image)
+    predictions, heatmaps = grad_cam_all_classes(backend, preprocess_array(image, IMAGE_SIZE_CLASSIFY))
+    ranked = np.argsort(predictions[0])[::-1][:max(1, top_k)]
+
+    results = []
+    for class_index in ranked:
+        class_name = CLASSES[class_index]
+        filename = f"gradcam_{class_name}_{original_filename}"
+        save_grad_cam_overlay(image, heatmaps[0, class_index], os.path.join(XAI_OUTPUT_DIR, filename))
+        results.append({
+            "class": class_name,
+            "probability": float(predictions[0, class_index]),
+            "grad_cam": f"/uploads/xai_outputs/{filename}",
+        })
+    return results
+
+class StageClock:
+    """Collects wall-clock milliseconds per named pipeline stage."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+async def _offload(executor, fn, *args):
+    """Runs a blocking stage off the event loop (on `executor`, or the loop's default pool)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args))
+
+async def _segment(backend, batcher, img_array: np.ndarray, executor=None) -> np.ndarray:
+    """Runs a batch-of-one segmentation, through the shared micro-batcher when one is provided."""
+    if batcher is not None:
+        row = await batcher.submit(img_array[0])
+        return np.expand_dims(row, axis=0)
+    return await _offload(executor, backend.segment, img_array)
+
+async def _classify(backend, batcher, img_array: np.ndarray, executor=None):
+    """
+    Classification + Grad-CAM from one forward pass; the heatmap's gradient is only computed
+    when a tumor class wins. Returns (predictions (1, C), heatmap (h, w)).
+    """
+    if batcher is not None:
+        row, heatmap = await batcher.submit(img_array[0])
+        return np.expand_dims(row, axis=0), heatmap
+    predictions, heatmaps = await _offload(executor, classify_with_grad_cam, backend, img_array, NO_TUMOR_INDEX)
+    return predictions, heatmaps[0]
+
+async def _run_models(clock, image, original_filename, backend, clf_batcher, seg_batcher, executor):
+    """Stages 1-2 on a decoded image. Returns (prediction_results, ai_facts, image_paths)."""
     print("Stage 1: Running Classification...")
-    img_array_classify = preprocess_image(image_path, IMAGE_SIZE_CLASSIFY)
-    predictions = clf_model.predict(img_array_classify)
+    with clock.stage("preprocess_classify"):
+        img_array_classify = await _offload(executor, preprocess_array, image, IMAGE_SIZE_CLASSIFY)
+    with clock.stage("classification"):
+        # The heatmap reuses the forward pass's conv maps and is only computed if a tumor class wins.
+        predictions, heatmap = await _classify(backend, clf_batcher, img_array_classify, executor)
     confidence = float(np.max(predictions))
     predicted_class_index = int(np.argmax(predictions))
     predicted_class = CLASSES[predicted_class_index]
@@ -107,86 +237,112 @@ async def run_simple_analysis(
     }
 
     if predicted_class != "notumor":
-        print("Generating Grad-CAM...")
-        heatmap = generate_grad_cam(
-            clf_model, img_array_classify, LAST_CONV_LAYER_NAME, pred_index=predicted_class_index
-        )
         grad_cam_filename = f"gradcam_{original_filename}"
         grad_cam_output_path = os.path.join(XAI_OUTPUT_DIR, grad_cam_filename)
-        save_grad_cam_overlay(image_path, heatmap, grad_cam_output_path)
+        with clock.stage("grad_cam_overlay"):
+            await _offload(executor, save_grad_cam_overlay, image, heatmap, grad_cam_output_path)
         grad_cam_path_url = f"/uploads/xai_outputs/{grad_cam_filename}"
         
-        img_array_segment = preprocess_image(image_path, IMAGE_SIZE_SEGMENT)
-        mask = seg_model.predict(img_array_segment)
-        mask_2d = np.squeeze(mask[0])
-
-        print(f"DEBUG: Mask Min={mask_2d.min():.4f}, Max={mask_2d.max():.4f}")
-
-        final_mask_uint8 = None
-
-        if mask_2d.max() > 0.01:
-            print("✅ U-Net found a tumor region.")
-            mask_norm = cv2.normalize(mask_2d, None, 0, 255, cv2.NORM_MINMAX)
-            final_mask_uint8 = mask_norm.astype(np.uint8)
-            _, final_mask_uint8 = cv2.threshold(final_mask_uint8, 100, 255, cv2.THRESH_BINARY)
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-            final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_CLOSE, kernel)
-            final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_OPEN, kernel)
-            
-            contours, _ = cv2.findContours(final_mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            if contours:
-                largest_contour = max(contours, key=cv2.contourArea)
-                final_mask_uint8 = np.zeros_like(final_mask_uint8)
-                cv2.drawContours(final_mask_uint8, [largest_contour], -1, 255, -1)
-                print(f"   Refined to largest tumor region (area: {cv2.contourArea(largest_contour):.0f} pixels)")
-            
-        else:
-            print("⚠️ U-Net returned blank. Falling back to Grad-CAM attention mask.")
-            
-            grad_cam_resized = cv2.resize(heatmap, (256, 256))
-
-            if len(grad_cam_resized.shape) == 3:
-                grad_cam_resized = cv2.cvtColor(grad_cam_resized, cv2.COLOR_BGR2GRAY)
-            grad_cam_resized = cv2.normalize(grad_cam_resized, None, 0, 255, cv2.NORM_MINMAX)
-            grad_cam_uint8 = grad_cam_resized.astype(np.uint8)
-            _, final_mask_uint8 = cv2.threshold(grad_cam_uint8, 180, 255, cv2.THRESH_BINARY)
-            
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
-            final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_CLOSE, kernel)
-            final_mask_uint8 = cv2.morphologyEx(final_mask_uint8, cv2.MORPH_OPEN, kernel)
-            contours, _ = cv2.findContours(final_mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            if contours:
-                largest_contour = max(contours, key=cv2.contourArea)
-                final_mask_uint8 = np.zeros_like(final_mask_uint8)
-                cv2.drawContours(final_mask_uint8, [largest_contour], -1, 255, -1)
-                print(f"   Extracted tumor core from Grad-CAM (area: {cv2.contourArea(largest_contour):.0f} pixels)")
+        with clock.stage("preprocess_segment"):
+            img_array_segment = await _offload(executor, preprocess_array, image, IMAGE_SIZE_SEGMENT)
+        with clock.stage("segmentation"):
+            mask = await _segment(backend, seg_batcher, img_array_segment, executor)
 
         seg_mask_filename = f"segmask_{original_filename}"
         seg_mask_output_path = os.path.join(XAI_OUTPUT_DIR, seg_mask_filename)
-        
-        try:
-            save_segmentation_overlay(
-                image_path=image_path,
-                mask=final_mask_uint8,
-                output_path=seg_mask_output_path,
-                alpha=0.5,  
-                use_red_overlay=True  
-            )
-            print(f"✅ Colored segmentation overlay saved to {seg_mask_output_path}")
-        except Exception as e:
-            print(f"⚠️ Failed to create colored overlay, falling back to plain mask: {e}")
-            cv2.imwrite(seg_mask_output_path, final_mask_uint8)
-        
+        with clock.stage("mask_morphology"):
+            final_mask_uint8 = await _offload(executor, _refine_mask, mask, heatmap)
+        with clock.stage("mask_overlay"):
+            await _offload(executor, _write_mask_overlay, image, final_mask_uint8, seg_mask_output_path)
+        with clock.stage("fact_extraction"):
+            real_facts = await _offload(executor, extract_facts_from_mask, final_mask_uint8)
         seg_mask_path_url = f"/uploads/xai_outputs/{seg_mask_filename}"
-        real_facts = extract_facts_from_mask(final_mask_uint8)
         ai_facts.update(real_facts)
 
     else:
         print("No tumor predicted. Skipping segmentation.")
 
+    return prediction_results, ai_facts, {"grad_cam": grad_cam_path_url, "seg_mask": seg_mask_path_url}
+
+def _copy_cached_overlays(xai_paths: Dict[str, str], original_filename: str) -> Dict[str, str]:
+    """
+    Copies a cache hit's overlays to this analysis's own names (gradcam_/segmask_<filename>),
+    so studies built from identical pixels never share, and later edit or delete, one file.
+    Copies rather than hard links: overlays are rewritten in place, which a link would share.
+    """
+    owned = {}
+    for key, prefix in (("grad_cam", "gradcam_"), ("seg_mask", "segmask_")):
+        url = xai_paths[key]
+        if url == "null":
+            owned[key] = url
+            continue
+        filename = f"{prefix}{original_filename}"
+        source = os.path.join(XAI_OUTPUT_DIR, os.path.basename(url))
+        target = os.path.join(XAI_OUTPUT_DIR, filename)
+        if os.path.abspath(source) != os.path.abspath(target):
+            shutil.copyfile(source, target)
+        owned[key] = f"/uploads/xai_outputs/{filename}"
+    return owned
+
+async def run_simple_analysis(
+    image_path: str,
+    original_filename: str,
+    backend,
+    clf_batcher=None,
+    seg_batcher=None,
+    executor=None,
+    cache=None,
+    image: Optional[np.ndarray] = None
+) -> Dict[str, Any]:
+    """
+    Classification -> Grad-CAM -> segmentation -> symbolic reasoning for one image.
+    Models run through `backend` (see inference_backends.py), or its micro-batchers when given.
+    Every blocking stage runs on `executor` (a concurrent.futures pool) so the event loop stays free.
+
+    Pass `image` (BGR uint8, e.g. a windowed DICOM frame) to skip decoding `image_path`;
+    `image_path` is then only echoed back as image_paths["original"].
+
+    `cache` (optional) is a content-addressed result cache with key_for(image)/get(key)/put(key, entry);
+    on a hit the stored prediction and facts are reused, the stored overlays are copied to this
+    analysis's file names, and no model is run.
+    """
+    if backend is None:
+        raise Exception("AI Models are not loaded. Server configuration error.")
+
+    clock = StageClock()
+    print("--- Running 2-Stage Neurosymbolic Pipeline ---")
+    # Decode once; both model tensors and both overlays are derived from this array.
+    if image is None:
+        with clock.stage("decode"):
+            image = await _offload(executor, load_image, image_path)
+
+    cached = None
+    if cache is not None:
+        with clock.stage("cache_lookup"):
+            cache_key = await _offload(executor, cache.key_for, image)
+            cached = await cache.get(cache_key)
+
+    if cached is not None:
+        print("♻️ Analysis cache hit. Reusing stored prediction and overlays.")
+        try:
+            with clock.stage("cache_copy"):
+                xai_paths = await _offload(executor, _copy_cached_overlays, cached["image_paths"], original_filename)
+            prediction_results, ai_facts = cached["prediction"], cached["ai_facts"]
+        except FileNotFoundError:
+            # An overlay was removed after the lookup checked it; analyze from scratch.
+            cached = None
+
+    if cached is None:
+        prediction_results, ai_facts, xai_paths = await _run_models(
+            clock, image, original_filename, backend, clf_batcher, seg_batcher, executor
+        )
+        if cache is not None:
+            await cache.put(cache_key, {"prediction": prediction_results, "ai_facts": ai_facts, "image_paths": xai_paths})
+
     print("Stage 3: Running Symbolic Reasoning...")
-    explanation = simple_reasoner.generate_explanation(ai_facts)
-    treatment_plan = simple_reasoner.generate_treatment_plan(ai_facts)
+    with clock.stage("reasoning"):
+        explanation = simple_reasoner.generate_explanation(ai_facts)
+        treatment_plan = simple_reasoner.generate_treatment_plan(ai_facts)
 
     return {
         "prediction": prediction_results,
@@ -195,7 +351,9 @@ async def run_simple_analysis(
         "ai_facts": ai_facts,
         "image_paths": {
             "original": image_path,
-            "grad_cam": grad_cam_path_url,
-            "seg_mask": seg_mask_path_url,
+            "grad_cam": xai_paths["grad_cam"],
+            "seg_mask": xai_paths["seg_mask"],
         },
-    }
\ No newline at end of file
+        "cache_hit": cached is not None,
+        "timings_ms": clock.timings,
+    }
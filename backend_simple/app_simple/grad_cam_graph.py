@@ -0,0 +1,151 @@
+"""
+Grad-CAM graphs for Keras classifiers. This is the only part of the XAI code that needs
+TensorFlow; inference_backends imports it when the models load.
+"""
+
+import threading
+from typing import Dict, Tuple
+import tensorflow as tf
+
+
+class _GradCamGraph:
+    """
+    Grad-CAM graph for one (model, conv layer) pair, built once and reused.
+
+    The classifier is split at the conv layer into `features` (input -> conv maps) and
+    `head` (conv maps -> class probabilities), so gradients only flow back through the head.
+    """
+
+    def __init__(self, model, last_conv_layer_name: str):
+        self.model = model
+        self.features, self.head = _split_at_layer(model, last_conv_layer_name)
+        image_spec = tf.TensorSpec(shape=(None,) + tuple(model.input_shape[1:]), dtype=tf.float32)
+        class_spec = tf.TensorSpec(shape=(), dtype=tf.int32)
+        self.features_and_grads_fn = tf.function(self._features_and_grads, input_signature=[image_spec, class_spec])
+        self.classify_with_features_fn = tf.function(self._classify_with_features, input_signature=[image_spec])
+        conv_spec = tf.TensorSpec(shape=(None,) + tuple(self.features.output.shape[1:]), dtype=tf.float32)
+        classes_spec = tf.TensorSpec(shape=(None,), dtype=tf.int32)
+        self.explain_features_fn = tf.function(self._explain_features, input_signature=[conv_spec, classes_spec])
+        self.explain_fn = tf.function(self._explain, input_signature=[image_spec, classes_spec])
+        self.all_classes_fn = tf.function(self._all_classes, input_signature=[image_spec])
+
+    @property
+    def heatmap_shape(self) -> Tuple[int, int]:
+        return tuple(int(d) for d in self.features.output.shape[1:3])
+
+    def _features_and_grads(self, images, class_index):
+        """
+        Conv maps, the gradient of one class score per image w.r.t. them, and the class
+        probabilities. class_index < 0 means each image's own top class.
+        """
+        conv_outputs = self.features(images, training=False)
+        with tf.GradientTape() as tape:
+            tape.watch(conv_outputs)
+            predictions = self.head(conv_outputs, training=False)
+            top_class = tf.argmax(predictions, axis=1, output_type=tf.int32)
+            classes = tf.where(class_index < 0, top_class, tf.fill(tf.shape(top_class), class_index))
+            scores = tf.gather(predictions, classes, axis=1, batch_dims=1)
+
+        return conv_outputs, tape.gradient(scores, conv_outputs), predictions
+
+    def _classify_with_features(self, images):
+        """
+        Untaped forward pass: class probabilities plus the conv maps, so Grad-CAM for the images
+        that need it only has to differentiate the head (see _explain_features).
+        """
+        conv_outputs = self.features(images, training=False)
+        return self.head(conv_outputs, training=False), conv_outputs
+
+    def _explain_features(self, conv_outputs, classes):
+        """
+        Grad-CAM heatmaps (B, h, w) from conv maps, one per row for `classes[row]`. Only the
+        head is re-run under the tape; images are independent at inference, so the gradient of
+        the summed scores gives every row its own gradients.
+        """
+        with tf.GradientTape() as tape:
+            tape.watch(conv_outputs)
+            predictions = self.head(conv_outputs, training=False)
+            scores = tf.gather(predictions, classes, axis=1, batch_dims=1)
+
+        grads = tape.gradient(scores, conv_outputs)
+        pooled_grads = tf.reduce_mean(grads, axis=(1, 2))
+        channels = tf.cast(tf.shape(conv_outputs)[-1], tf.float32)
+        heatmaps = tf.einsum("bhwc,bc->bhw", conv_outputs, pooled_grads) / channels
+        return _normalize_heatmaps(heatmaps, axis=(1, 2))
+
+    def _explain(self, images, classes):
+        """Grad-CAM heatmaps straight from images, for callers that classified elsewhere."""
+        return self._explain_features(self.features(images, training=False), classes)
+
+    def _all_classes(self, images):
+        """
+        Heatmaps for every class of every image from one forward pass: the per-image Jacobian
+        of the class scores w.r.t. the conv maps gives all class gradients at once.
+        """
+        conv_outputs = self.features(images, training=False)
+        with tf.GradientTape() as tape:
+            tape.watch(conv_outputs)
+            predictions = self.head(conv_outputs, training=False)
+
+        jacobian = tape.batch_jacobian(predictions, conv_outputs)  # (B, K, h, w, c)
+        pooled_grads = tf.reduce_mean(jacobian, axis=(2, 3))  # (B, K, c)
+        channels = tf.cast(tf.shape(conv_outputs)[-1], tf.float32)
+        heatmaps = tf.einsum("bhwc,bkc->bkhw", conv_outputs, pooled_grads) / channels
+        return predictions, _normalize_heatmaps(heatmaps, axis=(2, 3))
+
+
+def _normalize_heatmaps(heatmaps, axis):
+    """ReLU, then scale each heatmap to [0, 1] (all-zero maps stay zero)."""
+    heatmaps = tf.maximum(heatmaps, 0)
+    max_val = tf.reduce_max(heatmaps, axis=axis, keepdims=axis is not None)
+    return heatmaps / tf.where(max_val > 0, max_val, tf.ones_like(max_val))
+
+
+def _split_at_layer(model, layer_name: str):
+    """
+    Rebuilds a linear classifier as two functional models split after `layer_name`.
+    Handles both flat models and Sequential models wrapping an inner base such as 'vgg16'.
+    """
+    try:
+        base_model = model.get_layer('vgg16')
+        idx = model.layers.index(base_model)
+        layers = model.layers[:idx] + base_model.layers + model.layers[idx + 1:]
+        print("XAI: Found inner base model 'vgg16'")
+    except Exception:
+        layers = model.layers
+        print("XAI: Using model directly")
+
+    chain = [layer for layer in layers if not isinstance(layer, tf.keras.layers.InputLayer)]
+    names = [layer.name for layer in chain]
+    if layer_name not in names:
+        raise ValueError(f"Layer '{layer_name}' not found in model")
+    split = names.index(layer_name)
+
+    image_input = tf.keras.Input(shape=tuple(model.input_shape[1:]))
+    x = image_input
+    for layer in chain[:split + 1]:
+        x = layer(x)
+    features = tf.keras.Model(image_input, x)
+
+    conv_input = tf.keras.Input(shape=tuple(x.shape[1:]))
+    y = conv_input
+    for layer in chain[split + 1:]:
+        y = layer(y)
+    head = tf.keras.Model(conv_input, y)
+    return features, head
+
+
+_grad_cam_cache: Dict[Tuple[int, str], _GradCamGraph] = {}
+_grad_cam_lock = threading.Lock()
+
+
+def get_grad_cam_graph(model, last_conv_layer_name: str) -> _GradCamGraph:
+    key = (id(model), last_conv_layer_name)
+    with _grad_cam_lock:
+        graph = _grad_cam_cache.get(key)
+        # id() can be reused after a model is freed, so confirm it is the same object.
+        if graph is None or graph.model is not model:
+            print(f"XAI: Building Grad-CAM graph for layer '{last_conv_layer_name}'")
+            graph = _GradCamGraph(model, last_conv_layer_name)
+            _grad_cam_cache[key] = graph
+        return graph
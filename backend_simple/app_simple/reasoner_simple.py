@@ -32,11 +32,16 @@ class AdvancedSymbolicReasoner:
         pred_class = ai_facts.get("predicted_class", "notumor").lower()
         confidence = ai_facts.get("confidence", 0) * 100
         volume = ai_facts.get("tumor_volume_cm2", 0)
+        # Volumes and series also report the segmented 3D volume. It is only described here:
+        # the treatment thresholds are calibrated for the single-slice cm² estimate.
+        volume_cm3 = ai_facts.get("tumor_volume_cm3")
         
         explanation = f"Diagnosis: {pred_class.capitalize()}. Confidence: {confidence:.1f}%. "
         
         if pred_class != "notumor":
             explanation += f"Tumor volume is {volume} cm². "
+            if volume_cm3 is not None:
+                explanation += f"Segmented 3D tumor volume is {volume_cm3} cm³. "
             explanation += self.medical_context.get(pred_class, {}).get("behavior", "") + " "
         
         if genetics:
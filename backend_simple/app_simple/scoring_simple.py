@@ -0,0 +1,171 @@
+"""
+Quiz scoring: compares student drawings with AI segmentation masks.
+
+AI masks are decoded and binarized once, then kept bit-packed in an LRU keyed by file path
+(and invalidated when the file's mtime changes). Metrics are computed over stacks of
+same-shaped masks in one numpy pass, so a grading run of hundreds of drawings costs a
+handful of array operations per mask shape instead of a loop of per-drawing calls.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+BINARY_THRESHOLD = 10
+BOUNDARY_TOLERANCE_PX = 2
+
+
+def binarize(gray: np.ndarray) -> np.ndarray:
+    """Same rule the scorer has always used: any pixel brighter than BINARY_THRESHOLD is tumor."""
+    return gray > BINARY_THRESHOLD
+
+
+def decode_drawing(content: bytes, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+    """Decodes an uploaded drawing to a boolean mask resized to `shape` (h, w); None if undecodable."""
+    gray = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    if gray.shape != shape:
+        gray = cv2.resize(gray, (shape[1], shape[0]))
+    return binarize(gray)
+
+
+class MaskCache:
+    """LRU of binarized AI masks, stored with np.packbits (1 bit per pixel)."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Tuple[int, Tuple[int, int], np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> Optional[np.ndarray]:
+        """Returns the boolean mask for `path`, decoding it only on first use or after it changed."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == mtime:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                _, shape, packed = cached
+                return np.unpackbits(packed, count=shape[0] * shape[1]).reshape(shape).astype(bool)
+
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return None
+        mask = binarize(gray)
+
+        with self._lock:
+            self.misses += 1
+            self._entries[path] = (mtime, mask.shape, np.packbits(mask, axis=None))
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return mask
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "packed_bytes": sum(packed.nbytes for _, _, packed in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _dilate(masks: np.ndarray, radius: int) -> np.ndarray:
+    """Square binary dilation of a (N, H, W) stack, done with array shifts across the whole batch."""
+    out = masks.copy()
+    for _ in range(radius):
+        grown = out.copy()
+        grown[:, 1:, :] |= out[:, :-1, :]
+        grown[:, :-1, :] |= out[:, 1:, :]
+        grown[:, :, 1:] |= out[:, :, :-1]
+        grown[:, :, :-1] |= out[:, :, 1:]
+        grown[:, 1:, 1:] |= out[:, :-1, :-1]
+        grown[:, 1:, :-1] |= out[:, :-1, 1:]
+        grown[:, :-1, 1:] |= out[:, 1:, :-1]
+        grown[:, :-1, :-1] |= out[:, 1:, 1:]
+        out = grown
+    return out
+
+
+def _boundaries(masks: np.ndarray) -> np.ndarray:
+    # A pixel is on the boundary if it is set and any 8-neighbour (or the image edge) is not.
+    padded = np.pad(masks, ((0, 0), (1, 1), (1, 1)), constant_values=False)
+    eroded = ~_dilate(~padded, 1)[:, 1:-1, 1:-1]
+    return masks & ~eroded
+
+
+def _safe_ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    return np.divide(num, den, out=np.zeros(num.shape, dtype=np.float64), where=den > 0)
+
+
+def score_stack(ai: np.ndarray, student: np.ndarray, tolerance: int = BOUNDARY_TOLERANCE_PX) -> Dict[str, np.ndarray]:
+    """
+    IoU, Dice and boundary F-score for N pairs of boolean (N, H, W) masks.
+
+    The boundary F-score matches boundary pixels within `tolerance` px of each other
+    (precision over the student's outline, recall over the AI's). Empty denominators score 0.
+    """
+    axes = (1, 2)
+    intersection = np.count_nonzero(ai & student, axis=axes)
+    union = np.count_nonzero(ai | student, axis=axes)
+    ai_area = np.count_nonzero(ai, axis=axes)
+    student_area = np.count_nonzero(student, axis=axes)
+
+    ai_edge = _boundaries(ai)
+    student_edge = _boundaries(student)
+    precision = _safe_ratio(
+        np.count_nonzero(student_edge & _dilate(ai_edge, tolerance), axis=axes),
+        np.count_nonzero(student_edge, axis=axes),
+    )
+    recall = _safe_ratio(
+        np.count_nonzero(ai_edge & _dilate(student_edge, tolerance), axis=axes),
+        np.count_nonzero(ai_edge, axis=axes),
+    )
+
+    return {
+        "iou": _safe_ratio(intersection, union),
+        "dice": _safe_ratio(2 * intersection, ai_area + student_area),
+        "boundary_f1": _safe_ratio(2 * precision * recall, precision + recall),
+    }
+
+
+def score_pairs(pairs: Sequence[Tuple[np.ndarray, np.ndarray]]) -> List[Dict[str, float]]:
+    """
+    Scores (ai_mask, student_mask) pairs, stacking pairs of equal shape into one vectorized pass.
+    Results come back in input order.
+    """
+    results: List[Optional[Dict[str, float]]] = [None] * len(pairs)
+    by_shape: Dict[Tuple[int, int], List[int]] = {}
+    for i, (ai, _) in enumerate(pairs):
+        by_shape.setdefault(ai.shape, []).append(i)
+
+    for indices in by_shape.values():
+        scores = score_stack(
+            np.stack([pairs[i][0] for i in indices]),
+            np.stack([pairs[i][1] for i in indices]),
+        )
+        for row, i in enumerate(indices):
+            results[i] = {name: float(values[row]) for name, values in scores.items()}
+    return results
+
+
+def feedback_for(accuracy: float) -> str:
+    if accuracy > 60:
+        return "Excellent! Your diagnosis aligns closely with the AI."
+    elif accuracy > 30:
+        return "Good effort. You found the general area, but check the boundaries."
+    elif accuracy > 5:
+        return "You found the lesion, but the coverage is partial."
+    return "Missed the location. Compare with the AI result."
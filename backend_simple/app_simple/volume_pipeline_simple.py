@@ -0,0 +1,346 @@
+"""
+Multi-slice analysis: 3D NIfTI volumes and DICOM series.
+
+NIfTI (BraTS-style .nii / .nii.gz): the volume is never loaded whole. Axial slices are read
+through nibabel's array proxy in chunks of `batch_size`, normalized to the same
+uint8 -> [0, 1] float32 tensors the U-Net was trained on (see preprocess_brats.py /
+train_segmentation.py), and segmented one chunk per model call. Blank slices are skipped
+without touching the model.
+
+The predicted mask is kept as a uint8 (X, Y, Z) array and saved as a compressed .nii.gz with
+the input's affine, and the tumor volume is computed in cm³ from the header voxel spacing.
+The slice with the largest tumor cross-section is rendered as the study image and classified.
+
+DICOM series: frames stream in from dicom_io and are classified and segmented a batch at a
+time; results are reported per slice and aggregated over the series. Grad-CAM runs once, for
+the representative slice.
+"""
+
+import itertools
+import os
+from typing import Any, Dict, Iterator, Tuple
+
+import cv2
+import nibabel as nib
+import numpy as np
+
+from ..dicom_io import to_bgr
+from .ai_pipeline_simple import (
+    CLASSES, NO_TUMOR_INDEX, IMAGE_SIZE_CLASSIFY, IMAGE_SIZE_SEGMENT, UPLOADS_DIR, XAI_OUTPUT_DIR,
+    StageClock, _offload, extract_facts_from_mask, preprocess_array,
+)
+from .reasoner_simple import simple_reasoner
+from .xai_simple import classify_with_grad_cam, save_grad_cam_overlay, save_segmentation_overlay
+
+VOLUME_MASK_THRESHOLD = 0.5
+NIFTI_EXTENSIONS = (".nii", ".nii.gz")
+
+
+def is_nifti(filename: str) -> bool:
+    return filename.lower().endswith(NIFTI_EXTENSIONS)
+
+
+def _normalize_slices(chunk: np.ndarray) -> np.ndarray:
+    """Per-slice min-max to uint8 for an (X, Y, n) chunk, as preprocess_brats.normalize does per slice."""
+    lo = chunk.min(axis=(0, 1), keepdims=True)
+    hi = chunk.max(axis=(0, 1), keepdims=True)
+    scaled = (chunk - lo) / (hi - lo + 1e-9)
+    return (scaled * 255).astype(np.uint8)
+
+
+def _read_chunk(volume, z0: int, z1: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads slices [z0, z1) and returns (indices of the non-blank slices in the chunk,
+    float32 model batch (k, 256, 256, 3) for those slices).
+    """
+    # Only this chunk is materialized; the proxy applies scl_slope/inter on the way out.
+    chunk = np.asarray(volume.dataobj[..., z0:z1], dtype=np.float32)
+    slices = _normalize_slices(chunk)
+    non_blank = np.flatnonzero(slices.max(axis=(0, 1)) > 0)
+
+    batch = np.empty((len(non_blank),) + IMAGE_SIZE_SEGMENT + (3,), dtype=np.float32)
+    for row, i in enumerate(non_blank):
+        resized = cv2.resize(np.ascontiguousarray(slices[:, :, i]), IMAGE_SIZE_SEGMENT, interpolation=cv2.INTER_AREA)
+        batch[row] = (resized / 255.0)[..., np.newaxis]
+    return non_blank, batch
+
+
+def _write_chunk_mask(mask_volume: np.ndarray, z0: int, non_blank: np.ndarray, predictions: np.ndarray):
+    """Thresholds the U-Net output and writes it back at the volume's in-plane size."""
+    height, width = mask_volume.shape[:2]
+    for row, i in enumerate(non_blank):
+        slice_mask = (np.squeeze(predictions[row]) > VOLUME_MASK_THRESHOLD).astype(np.uint8)
+        mask_volume[:, :, z0 + i] = cv2.resize(slice_mask, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+def _iter_chunks(depth: int, batch_size: int) -> Iterator[Tuple[int, int]]:
+    for z0 in range(0, depth, batch_size):
+        yield z0, min(z0 + batch_size, depth)
+
+
+def _save_volume_mask(mask_volume: np.ndarray, volume, output_path: str):
+    mask_img = nib.Nifti1Image(mask_volume, volume.affine)
+    mask_img.set_data_dtype(np.uint8)
+    nib.save(mask_img, output_path)
+
+
+def _slice_as_bgr(volume, z: int) -> np.ndarray:
+    slice_2d = np.asarray(volume.dataobj[..., z], dtype=np.float32)
+    gray = np.ascontiguousarray(_normalize_slices(slice_2d[..., np.newaxis])[..., 0])
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+async def run_volume_analysis(
+    volume_path: str,
+    original_filename: str,
+    backend,
+    executor=None,
+    batch_size: int = 32
+) -> Dict[str, Any]:
+    """
+    Segments every axial slice of a NIfTI volume in batches, measures the tumor in cm³ and
+    classifies the slice with the largest tumor cross-section.
+
+    Returns the same shape as run_simple_analysis, plus image_paths["volume_mask"] and
+    ai_facts["tumor_volume_cm3"].
+    """
+    if backend is None:
+        raise Exception("AI Models are not loaded. Server configuration error.")
+
+    clock = StageClock()
+    print("--- Running 3D Volume Pipeline ---")
+    with clock.stage("load_header"):
+        volume = await _offload(executor, nib.load, volume_path)
+        if len(volume.shape) < 3:
+            raise ValueError(f"Expected a 3D volume, got shape {volume.shape}")
+        if len(volume.shape) > 3:
+            volume = volume.slicer[..., 0]
+        width_x, width_y, depth = volume.shape
+        voxel_mm3 = float(np.prod(volume.header.get_zooms()[:3]))
+
+    mask_volume = np.zeros((width_x, width_y, depth), dtype=np.uint8)
+    segmented = 0
+    read_ms = predict_ms = 0.0
+    print(f"Stage 1: Segmenting {depth} axial slices in batches of {batch_size}...")
+    for z0, z1 in _iter_chunks(depth, batch_size):
+        chunk_clock = StageClock()
+        with chunk_clock.stage("read"):
+            non_blank, batch = await _offload(executor, _read_chunk, volume, z0, z1)
+        if len(non_blank) == 0:
+            read_ms += chunk_clock.timings["read"]
+            continue
+        with chunk_clock.stage("predict"):
+            predictions = await _offload(executor, backend.segment, batch)
+            _write_chunk_mask(mask_volume, z0, non_blank, predictions)
+        read_ms += chunk_clock.timings["read"]
+        predict_ms += chunk_clock.timings["predict"]
+        segmented += len(non_blank)
+    clock.timings["slice_read"] = round(read_ms, 2)
+    clock.timings["segmentation"] = round(predict_ms, 2)
+
+    base_name = original_filename
+    for ext in NIFTI_EXTENSIONS[::-1]:
+        if base_name.lower().endswith(ext):
+            base_name = base_name[:-len(ext)]
+            break
+
+    with clock.stage("volume_mask_write"):
+        volume_mask_filename = f"volmask_{base_name}.nii.gz"
+        await _offload(executor, _save_volume_mask, mask_volume, volume, os.path.join(XAI_OUTPUT_DIR, volume_mask_filename))
+
+    tumor_voxels_per_slice = mask_volume.sum(axis=(0, 1), dtype=np.int64)
+    tumor_voxels = int(tumor_voxels_per_slice.sum())
+    representative = int(np.argmax(tumor_voxels_per_slice)) if tumor_voxels else depth // 2
+
+    print(f"Stage 2: Classifying representative slice z={representative}...")
+    with clock.stage("classification"):
+        slice_image = await _offload(executor, _slice_as_bgr, volume, representative)
+        image_filename = f"{base_name}_z{representative}.png"
+        await _offload(executor, cv2.imwrite, os.path.join(UPLOADS_DIR, image_filename), slice_image)
+        img_array = await _offload(executor, preprocess_array, slice_image, IMAGE_SIZE_CLASSIFY)
+        predictions, heatmaps = await _offload(executor, classify_with_grad_cam, backend, img_array)
+
+    confidence = float(np.max(predictions))
+    predicted_class = CLASSES[int(np.argmax(predictions))]
+    prediction_results = {"predicted_class": predicted_class, "confidence": confidence}
+
+    with clock.stage("overlays"):
+        grad_cam_filename = f"gradcam_{image_filename}"
+        await _offload(executor, save_grad_cam_overlay, slice_image, heatmaps[0], os.path.join(XAI_OUTPUT_DIR, grad_cam_filename))
+        slice_mask = mask_volume[:, :, representative] * 255
+        seg_mask_filename = f"segmask_{image_filename}"
+        await _offload(executor, save_segmentation_overlay, slice_image, slice_mask, os.path.join(XAI_OUTPUT_DIR, seg_mask_filename))
+        slice_facts = await _offload(executor, extract_facts_from_mask, cv2.resize(slice_mask, IMAGE_SIZE_SEGMENT, interpolation=cv2.INTER_NEAREST))
+
+    ai_facts = {
+        "predicted_class": predicted_class,
+        "confidence": confidence,
+        **slice_facts,
+        "tumor_volume_cm3": round(tumor_voxels * voxel_mm3 / 1000.0, 2),
+        "tumor_voxels": tumor_voxels,
+        "voxel_volume_mm3": round(voxel_mm3, 4),
+        "slices_with_tumor": int(np.count_nonzero(tumor_voxels_per_slice)),
+        "slices_segmented": segmented,
+        "slices_total": depth,
+        "representative_slice": representative,
+    }
+    print(f"Volume result: {prediction_results}, {ai_facts['tumor_volume_cm3']} cm³")
+
+    with clock.stage("reasoning"):
+        explanation = simple_reasoner.generate_explanation(ai_facts)
+        treatment_plan = simple_reasoner.generate_treatment_plan(ai_facts)
+
+    return {
+        "prediction": prediction_results,
+        "explanation": explanation,
+        "treatment": treatment_plan,
+        "ai_facts": ai_facts,
+        "image_paths": {
+            "original": f"/uploads/{image_filename}",
+            "grad_cam": f"/uploads/xai_outputs/{grad_cam_filename}",
+            "seg_mask": f"/uploads/xai_outputs/{seg_mask_filename}",
+            "volume_mask": f"/uploads/xai_outputs/{volume_mask_filename}",
+        },
+        "timings_ms": clock.timings,
+    }
+
+
+def _read_series_batch(frames: Iterator, size: int):
+    """
+    Pulls up to `size` decoded frames from the series iterator and builds both model batches.
+    Returns (frames, classifier batch (n, 128, 128, 3), U-Net batch (n, 256, 256, 3)).
+    """
+    taken = list(itertools.islice(frames, size))
+    images = [to_bgr(f.image) for f in taken]
+    if not images:
+        return taken, images, None, None
+    clf_batch = np.stack([preprocess_array(img, IMAGE_SIZE_CLASSIFY)[0] for img in images]).astype(np.float32)
+    seg_batch = np.stack([preprocess_array(img, IMAGE_SIZE_SEGMENT)[0] for img in images]).astype(np.float32)
+    return taken, images, clf_batch, seg_batch
+
+
+async def run_series_analysis(
+    frames: Iterator,
+    series_meta: Dict[str, Any],
+    original_filename: str,
+    backend,
+    executor=None,
+    batch_size: int = 32
+) -> Dict[str, Any]:
+    """
+    Classifies and segments a DICOM series slice by slice, `batch_size` slices per model call.
+
+    `frames` yields objects with .index, .instance_number and a uint8 .image in slice order
+    (see dicom_io.iter_series_frames); only one batch plus the current representative slice
+    are held at a time. Returns the run_simple_analysis shape plus a per-slice list and series
+    aggregates; tumor_volume_cm3 is reported when the headers give pixel and slice spacing.
+    """
+    if backend is None:
+        raise Exception("AI Models are not loaded. Server configuration error.")
+
+    clock = StageClock()
+    print("--- Running DICOM Series Pipeline ---")
+    notumor_index = NO_TUMOR_INDEX
+    probability_sum = np.zeros(len(CLASSES), dtype=np.float64)
+    votes = np.zeros(len(CLASSES), dtype=np.int64)
+    slices = []
+    tumor_pixels_total = 0
+    best = None  # (score, image, classifier input, top class, mask_uint8, slice index)
+    timings = {"decode": 0.0, "classification": 0.0, "segmentation": 0.0}
+
+    pixel_spacing = series_meta.get("pixel_spacing_mm")
+    mask_pixel_mm2 = None
+    if pixel_spacing:
+        mask_pixel_mm2 = (series_meta["rows"] * pixel_spacing[0] / IMAGE_SIZE_SEGMENT[1]) * \
+            (series_meta["columns"] * pixel_spacing[1] / IMAGE_SIZE_SEGMENT[0])
+
+    while True:
+        batch_clock = StageClock()
+        with batch_clock.stage("decode"):
+            taken, images, clf_batch, seg_batch = await _offload(executor, _read_series_batch, frames, batch_size)
+        timings["decode"] += batch_clock.timings["decode"]
+        if not taken:
+            break
+        with batch_clock.stage("classification"):
+            predictions = await _offload(executor, backend.classify, clf_batch)
+        with batch_clock.stage("segmentation"):
+            masks = await _offload(executor, backend.segment, seg_batch)
+        timings["classification"] += batch_clock.timings["classification"]
+        timings["segmentation"] += batch_clock.timings["segmentation"]
+
+        binary = np.squeeze(masks, axis=-1) > VOLUME_MASK_THRESHOLD
+        tumor_pixels = binary.sum(axis=(1, 2))
+        probability_sum += predictions.sum(axis=0)
+        np.add.at(votes, predictions.argmax(axis=1), 1)
+
+        for row, frame in enumerate(taken):
+            class_index = int(np.argmax(predictions[row]))
+            pixels = int(tumor_pixels[row])
+            tumor_pixels_total += pixels
+            slices.append({
+                "index": frame.index,
+                "instance_number": frame.instance_number,
+                "predicted_class": CLASSES[class_index],
+                "confidence": float(predictions[row, class_index]),
+                "tumor_pixels": pixels,
+                "tumor_area_mm2": round(pixels * mask_pixel_mm2, 2) if mask_pixel_mm2 else None,
+            })
+            score = (pixels, 1.0 - float(predictions[row, notumor_index]))
+            if best is None or score > best[0]:
+                best = (score, images[row], clf_batch[row], class_index, binary[row].astype(np.uint8) * 255, frame.index)
+
+    if best is None:
+        raise ValueError("DICOM series contains no decodable frames")
+    clock.timings.update({name: round(ms, 2) for name, ms in timings.items()})
+
+    mean_probabilities = probability_sum / len(slices)
+    predicted_index = int(np.argmax(mean_probabilities))
+    predicted_class = CLASSES[predicted_index]
+    prediction_results = {"predicted_class": predicted_class, "confidence": float(mean_probabilities[predicted_index])}
+
+    # Grad-CAM is only needed for the representative slice, so it runs once here rather than per batch.
+    _, image, clf_input, class_index, mask, representative = best
+    with clock.stage("grad_cam"):
+        heatmap = (await _offload(executor, backend.explain, clf_input[np.newaxis], np.array([class_index], dtype=np.int32)))[0]
+    base_name = os.path.splitext(original_filename)[0]
+    image_filename = f"{base_name}_s{representative}.png"
+    with clock.stage("overlays"):
+        await _offload(executor, cv2.imwrite, os.path.join(UPLOADS_DIR, image_filename), image)
+        grad_cam_filename = f"gradcam_{image_filename}"
+        await _offload(executor, save_grad_cam_overlay, image, heatmap, os.path.join(XAI_OUTPUT_DIR, grad_cam_filename))
+        seg_mask_filename = f"segmask_{image_filename}"
+        await _offload(executor, save_segmentation_overlay, image, mask, os.path.join(XAI_OUTPUT_DIR, seg_mask_filename))
+        slice_facts = await _offload(executor, extract_facts_from_mask, mask)
+
+    ai_facts = {
+        "predicted_class": predicted_class,
+        "confidence": prediction_results["confidence"],
+        **slice_facts,
+        "class_probabilities": {cls: round(float(p), 4) for cls, p in zip(CLASSES, mean_probabilities)},
+        "slice_votes": {cls: int(v) for cls, v in zip(CLASSES, votes)},
+        "slices_total": len(slices),
+        "slices_with_tumor": sum(1 for s in slices if s["tumor_pixels"] > 0),
+        "representative_slice": representative,
+    }
+    slice_spacing = series_meta.get("slice_spacing_mm")
+    if mask_pixel_mm2 and slice_spacing:
+        ai_facts["tumor_volume_cm3"] = round(tumor_pixels_total * mask_pixel_mm2 * slice_spacing / 1000.0, 2)
+    print(f"Series result: {prediction_results} over {len(slices)} slices")
+
+    with clock.stage("reasoning"):
+        explanation = simple_reasoner.generate_explanation(ai_facts)
+        treatment_plan = simple_reasoner.generate_treatment_plan(ai_facts)
+
+    return {
+        "prediction": prediction_results,
+        "explanation": explanation,
+        "treatment": treatment_plan,
+        "ai_facts": ai_facts,
+        "slices": slices,
+        "image_paths": {
+            "original": f"/uploads/{image_filename}",
+            "grad_cam": f"/uploads/xai_outputs/{grad_cam_filename}",
+            "seg_mask": f"/uploads/xai_outputs/{seg_mask_filename}",
+        },
+        "timings_ms": clock.timings,
+    }
@@ -1,59 +1,33 @@
 import traceback
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Union
 import numpy as np
-import tensorflow as tf
 import cv2
 import os
 
 
-def generate_grad_cam(model, img_array, last_conv_layer_name='block5_conv3', pred_index=None):
-    import traceback
-    import numpy as np
-    import tensorflow as tf
-    import cv2
+def _as_batch(img_batch: np.ndarray) -> np.ndarray:
+    if img_batch.ndim == 3:
+        img_batch = np.expand_dims(img_batch, axis=0)
+    return img_batch.astype(np.float32)
 
-    print("XAI: Starting generate_grad_cam...")
 
+def heatmaps_from_grads(conv_outputs: np.ndarray, grads: np.ndarray) -> np.ndarray:
+    """
+    Grad-CAM from a backend's conv_features_and_grads(): each channel is weighted by its
+    spatially pooled gradient. Returns (B, h, w) heatmaps in [0, 1].
+    """
+    pooled_grads = grads.mean(axis=(1, 2))
+    heatmaps = np.einsum("bhwc,bc->bhw", conv_outputs, pooled_grads) / conv_outputs.shape[-1]
+    heatmaps = np.maximum(heatmaps, 0)
+    max_val = heatmaps.max(axis=(1, 2), keepdims=True)
+    return (heatmaps / np.where(max_val > 0, max_val, 1)).astype(np.float32)
+
+
+def generate_grad_cam(backend, img_array, pred_index=None):
     try:
-        if img_array.ndim == 3:
-            img_array = np.expand_dims(img_array, axis=0)
-        img_array = img_array.astype(np.float32)
-
-        try:
-            base_model = model.get_layer('vgg16')
-            print("XAI: Found inner base model 'vgg16'")
-        except Exception:
-            base_model = model
-            print("XAI: Using model directly")
-
-        last_conv_layer = base_model.get_layer(last_conv_layer_name)
-        print(f"XAI: Using conv layer '{last_conv_layer_name}'")
-        grad_model = tf.keras.models.Model(
-            inputs=base_model.input,
-            outputs=[last_conv_layer.output, base_model.output]
-        )
-
-        print("XAI: grad_model ready, running forward pass...")
-        with tf.GradientTape() as tape:
-            conv_outputs, predictions = grad_model(img_array, training=False)
-
-            if pred_index is None:
-                pred_index = tf.argmax(predictions[0])
-            class_channel = predictions[:, pred_index]
-
-        grads = tape.gradient(class_channel, conv_outputs)
-        pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-
-        conv_outputs = conv_outputs[0].numpy()
-        pooled_grads = pooled_grads.numpy()
-
-        for i in range(pooled_grads.shape[-1]):
-            conv_outputs[:, :, i] *= pooled_grads[i]
-
-        heatmap = np.mean(conv_outputs, axis=-1)
-        heatmap = np.maximum(heatmap, 0)
-        heatmap /= np.max(heatmap) if np.max(heatmap) != 0 else 1
-        heatmap = np.float32(heatmap)
+        img_array = _as_batch(img_array)[:1]
+        conv_outputs, grads, _ = backend.conv_features_and_grads(img_array, pred_index)
+        heatmap = heatmaps_from_grads(conv_outputs, grads)[0]
 
         print("XAI: Grad-CAM heatmap generated successfully!")
         return heatmap
@@ -64,9 +38,52 @@ def generate_grad_cam(model, img_array, last_conv_layer_name='block5_conv3', pre
         raise
 
 
+def classify_with_grad_cam(backend, img_batch, skip_class: Optional[int] = None):
+    """
+    Classification + Grad-CAM through an inference backend: one forward pass for every image,
+    gradients only for images whose top class is not `skip_class` (pass the no-tumor class so
+    clear scans pay for inference alone). Skipped rows get an all-zero heatmap.
+
+    Returns (predictions (B, num_classes), heatmaps (B, h, w) in [0, 1] for each image's top class).
+    """
+    return backend.classify_and_explain(_as_batch(img_batch), skip_class)
+
+
+def grad_cam_all_classes(backend, img_batch):
+    """
+    Batched multi-class Grad-CAM: one Jacobian pass on backends with a fused graph, otherwise
+    one conv_features_and_grads() call per class.
+
+    Returns (predictions (B, K), heatmaps (B, K, h, w) in [0, 1]), one heatmap per class per image.
+    """
+    img_batch = _as_batch(img_batch)
+    graph = backend.grad_cam_graph
+    if graph is not None:
+        predictions, heatmaps = graph.all_classes_fn(img_batch)
+        return predictions.numpy(), heatmaps.numpy().astype(np.float32)
+
+    conv_outputs, grads, predictions = backend.conv_features_and_grads(img_batch, 0)
+    heatmaps = [heatmaps_from_grads(conv_outputs, grads)]
+    for class_index in range(1, predictions.shape[1]):
+        conv_outputs, grads, _ = backend.conv_features_and_grads(img_batch, class_index)
+        heatmaps.append(heatmaps_from_grads(conv_outputs, grads))
+    return predictions, np.stack(heatmaps, axis=1)
+
+
+def _as_bgr_image(image: Union[str, np.ndarray]) -> np.ndarray:
+    """Accepts an already-decoded BGR array, or a path that is decoded here."""
+    if isinstance(image, np.ndarray):
+        return image
+    if not os.path.exists(image):
+        raise FileNotFoundError(f"Original image not found: {image}")
+    img = cv2.imread(image)
+    if img is None:
+        raise ValueError(f"cv2.imread failed for: {image}")
+    return img
+
 
 def save_grad_cam_overlay(
-    image_path: str,
+    image: Union[str, np.ndarray],
     heatmap: np.ndarray,
     output_path: str,
     alpha: float = 0.5,
@@ -76,7 +93,7 @@ def save_grad_cam_overlay(
     Save heatmap overlayed on original image.
 
     Args:
-        image_path: path to the original image file (used for overlay and size reference).
+        image: decoded BGR array of the original image, or a path to it (used for overlay and size reference).
         heatmap: 2D numpy array in [0,1].
         output_path: where to save the overlayed image.
         alpha: blending factor.
@@ -90,12 +107,7 @@ def save_grad_cam_overlay(
     """
     print("XAI: Starting save_grad_cam_overlay...")
     try:
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Original image not found: {image_path}")
-
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"cv2.imread failed for: {image_path}")
+        img = _as_bgr_image(image)
 
         if resize_to is not None:
             img = cv2.resize(img, resize_to)
@@ -125,7 +137,7 @@ def save_grad_cam_overlay(
 
 
 def save_segmentation_overlay(
-    image_path: str,
+    image: Union[str, np.ndarray],
     mask: np.ndarray,
     output_path: str,
     alpha: float = 0.5,
@@ -135,7 +147,7 @@ def save_segmentation_overlay(
     Save tumor segmentation mask overlayed on original MRI image with prominent red coloring.
     
     Args:
-        image_path: path to the original MRI image file.
+        image: decoded BGR array of the original MRI, or a path to it.
         mask: 2D binary mask (0-255 uint8) where white=tumor region.
         output_path: where to save the overlayed image.
         alpha: blending factor (0.5 = 50% tumor color, 50% original image).
@@ -146,11 +158,7 @@ def save_segmentation_overlay(
     """
     print("XAI: Starting save_segmentation_overlay...")
     try:
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Original image not found: {image_path}")
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"cv2.imread failed for: {image_path}")
+        img = _as_bgr_image(image)
         
         h, w = img.shape[:2]
     
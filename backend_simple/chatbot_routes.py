@@ -4,7 +4,6 @@ from typing import Optional
 from dotenv import load_dotenv
 from pathlib import Path
 import os
-import google.generativeai as genai
 import base64
 import re
 
@@ -17,8 +16,18 @@ api_key = os.getenv("GOOGLE_API_KEY")
 if not api_key:
     print("⚠️ WARNING: GOOGLE_API_KEY is not set in chatbot_routes.")
 else:
-    genai.configure(api_key=api_key)
-    print("✅ Google Gemini API configured successfully")
+    print("✅ Google Gemini API key found (client loads on the first chat request)")
+
+_genai = None
+
+def _get_genai():
+    """google.generativeai is slow to import, so it is imported and configured on first use."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _genai = genai
+    return _genai
 
 class ChatRequest(BaseModel):
     question: str
@@ -71,7 +80,7 @@ async def edu_chat(payload: ChatRequest):
     try:
         if not api_key:
             raise HTTPException(status_code=500, detail="Google API key not configured")
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        model = _get_genai().GenerativeModel('gemini-2.5-flash')
         full_prompt = f"{SYSTEM_PROMPT}\n\nUser Question: {payload.question}"
         if payload.image:
             mime_type, image_data = extract_base64_image(payload.image)
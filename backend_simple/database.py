@@ -51,11 +51,13 @@ class Study(BaseModel):
     mri_image_path: str
     seg_mask_path: Optional[str] = None
     grad_cam_path: Optional[str] = None
+    volume_mask_path: Optional[str] = None
     
     ai_facts: Dict[str, Any]
     final_explanation: str
     doctor_notes: Optional[str] = ""
     treatment: Optional[Dict[str, Any]] = None 
+    job_id: Optional[str] = None  # set for studies written by a background job
 
     model_config = ConfigDict(
         json_encoders={ObjectId: str},
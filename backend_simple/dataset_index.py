@@ -0,0 +1,104 @@
+"""
+In-memory index of a class-per-folder image dataset (e.g. "MRI Images/Testing").
+
+Built once at startup; afterwards `refresh()` only stats the root and class folders and
+rescans a class folder when its mtime changed. refresh() touches the filesystem, so callers
+run it on a worker thread (the quiz pool does before each build); sample() only reads the
+in-memory index and is safe on the event loop.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import quote
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+class DatasetImage(NamedTuple):
+    path: str
+    label: str
+    filename: str
+    size: int
+
+
+class DatasetIndex:
+    def __init__(self, root: str, url_prefix: str, refresh_interval: float = 5.0):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        self.refresh_interval = refresh_interval
+        self._by_class: Dict[str, List[DatasetImage]] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.rescans = 0
+
+    @staticmethod
+    def _scan_class(class_path: str, label: str) -> List[DatasetImage]:
+        images = []
+        with os.scandir(class_path) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append(DatasetImage(entry.path, label, entry.name, entry.stat().st_size))
+        return images
+
+    def refresh(self, force: bool = False):
+        """Rescans only the class folders whose mtime changed since the last refresh."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.refresh_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            if not os.path.isdir(self.root):
+                self._by_class, self._mtimes = {}, {}
+                return
+
+            by_class = dict(self._by_class)
+            mtimes = dict(self._mtimes)
+            with os.scandir(self.root) as entries:
+                class_dirs = {entry.name: entry.path for entry in entries if entry.is_dir()}
+
+            for label in list(by_class):
+                if label not in class_dirs:
+                    del by_class[label]
+                    mtimes.pop(label, None)
+
+            for label, class_path in class_dirs.items():
+                mtime = os.stat(class_path).st_mtime_ns
+                if mtimes.get(label) != mtime:
+                    by_class[label] = self._scan_class(class_path, label)
+                    mtimes[label] = mtime
+                    self.rescans += 1
+
+            # Swap in whole dicts so readers never see a half-updated index.
+            self._by_class, self._mtimes = by_class, mtimes
+
+    def classes(self) -> List[str]:
+        return sorted(label for label, images in self._by_class.items() if images)
+
+    def sample(self, classes: Optional[Iterable[str]] = None, label: Optional[str] = None) -> Optional[DatasetImage]:
+        """
+        Stratified O(1) sample: a class uniformly among `classes` (or all), then an image in it.
+        Pass `label` to sample from one class.
+        """
+        by_class = self._by_class
+        if label is None:
+            candidates = [c for c in (classes if classes is not None else by_class) if by_class.get(c)]
+            if not candidates:
+                return None
+            label = random.choice(candidates)
+        images = by_class.get(label)
+        return random.choice(images) if images else None
+
+    def url_for(self, image: DatasetImage) -> str:
+        return f"{self.url_prefix}/{quote(image.label)}/{quote(image.filename)}"
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "root": self.root,
+            "classes": {label: len(images) for label, images in self._by_class.items()},
+            "total_bytes": sum(img.size for images in self._by_class.values() for img in images),
+            "rescans": self.rescans,
+        }
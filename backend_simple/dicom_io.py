@@ -0,0 +1,231 @@
+"""
+DICOM input: single-instance uploads, and series given as a zip of single- or multi-frame
+instances or as one multi-frame file.
+
+Headers are read first with stop_before_pixels so instances can be sorted by position along
+the slice normal (ImagePositionPatient / ImageOrientationPatient), falling back to
+InstanceNumber. Pixel data is then decoded lazily, one frame at a time, with
+pydicom.pixels.iter_pixels; at most one instance's bytes are held in memory.
+
+Pixels go straight from the decoded frame to a windowed uint8 display array (modality LUT,
+then WindowCenter / WindowWidth), which is what the models consume; PNGs are only rendered
+for viewers.
+"""
+
+import io
+import zipfile
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+import pydicom
+from pydicom.errors import InvalidDicomError
+from pydicom.multival import MultiValue
+from pydicom.pixels import apply_modality_lut, iter_pixels
+
+
+class SeriesSource(NamedTuple):
+    path: str
+    member: Optional[str]          # zip member name, None for a standalone file
+    frames: int
+    instance_number: Optional[int]
+    position: Optional[float]      # distance along the slice normal, in mm
+
+
+class SeriesFrame(NamedTuple):
+    index: int                     # position of the frame in the sorted series
+    instance_number: Optional[int]
+    frame: int                     # frame number inside its instance
+    image: np.ndarray              # windowed uint8 (rows, cols), or (rows, cols, 3) for color
+
+
+def header_metadata(ds) -> Dict[str, Any]:
+    """The study fields the app records for a DICOM upload."""
+    return {
+        "patient_name": str(ds.get("PatientName", "Unknown")),
+        "patient_id": str(ds.get("PatientID", "Unknown")),
+        "modality": str(ds.get("Modality", "MR")),
+        "study_date": str(ds.get("StudyDate", "Unknown")),
+    }
+
+
+def read_header(source) -> Any:
+    """
+    Header-only parse (stops before PixelData), for listing and validation.
+    `source` is a path, a file-like object or raw bytes.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    ds = pydicom.dcmread(source, stop_before_pixels=True)
+    if "Rows" not in ds or "Columns" not in ds:
+        raise ValueError("DICOM file has no image")
+    return ds
+
+
+def _first(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, MultiValue):  # several windows may be listed; the first is the default
+        value = value[0] if len(value) else None
+    return float(value) if value is not None else None
+
+
+def to_display_uint8(ds, pixels: np.ndarray) -> np.ndarray:
+    """
+    Stored values -> 0-255 display values: modality LUT (RescaleSlope / RescaleIntercept),
+    then the header's WindowCenter / WindowWidth (DICOM linear VOI function). Without a
+    window the full modality range is used. MONOCHROME1 is inverted.
+    """
+    values = apply_modality_lut(pixels, ds).astype(np.float32, copy=False)
+    center, width = _first(ds.get("WindowCenter")), _first(ds.get("WindowWidth"))
+
+    if center is not None and width is not None and width >= 1:
+        if width > 1:
+            scaled = ((values - (center - 0.5)) / (width - 1) + 0.5) * 255.0
+        else:
+            scaled = np.where(values > center - 0.5, 255.0, 0.0)
+    else:
+        lo, hi = float(values.min()), float(values.max())
+        scaled = (values - lo) * (255.0 / (hi - lo)) if hi > lo else np.zeros_like(values)
+
+    display = np.clip(scaled, 0, 255).astype(np.uint8)
+    if str(ds.get("PhotometricInterpretation", "")) == "MONOCHROME1":
+        display = 255 - display
+    return display
+
+
+def to_bgr(display: np.ndarray) -> np.ndarray:
+    """Display frame -> the 3-channel BGR layout the pipeline decodes images into."""
+    if display.ndim == 2:
+        return cv2.cvtColor(display, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(display, cv2.COLOR_RGB2BGR)
+
+
+def load_dicom_image(source) -> np.ndarray:
+    """
+    Decodes the first frame of a DICOM file straight to a windowed BGR uint8 array, ready for
+    preprocess_array: no PNG encode/decode round trip. `source` is a path or raw bytes.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    ds = pydicom.dcmread(source)
+    if "PixelData" not in ds:
+        raise ValueError("DICOM file has no pixel data.")
+    pixels = ds.pixel_array
+    if int(ds.get("NumberOfFrames", 1) or 1) > 1:
+        pixels = pixels[0]
+    if str(ds.get("PhotometricInterpretation", "")).startswith("MONOCHROME"):
+        return to_bgr(to_display_uint8(ds, pixels))
+    return to_bgr(pixels.astype(np.uint8))
+
+
+def _slice_position(ds) -> Optional[float]:
+    position = ds.get("ImagePositionPatient")
+    orientation = ds.get("ImageOrientationPatient")
+    if position is None:
+        return None
+    if orientation is None or len(orientation) != 6:
+        return float(position[2])
+    normal = np.cross(np.asarray(orientation[:3], dtype=float), np.asarray(orientation[3:], dtype=float))
+    return float(np.dot(normal, np.asarray(position, dtype=float)))
+
+
+def _source_from_header(path: str, member: Optional[str], ds) -> SeriesSource:
+    instance_number = ds.get("InstanceNumber")
+    return SeriesSource(
+        path=path,
+        member=member,
+        frames=int(ds.get("NumberOfFrames", 1) or 1),
+        instance_number=int(instance_number) if instance_number is not None else None,
+        position=_slice_position(ds),
+    )
+
+
+def _sort_key(source: SeriesSource) -> Tuple:
+    if source.position is not None:
+        return (0, source.position, source.instance_number or 0)
+    if source.instance_number is not None:
+        return (1, source.instance_number, 0)
+    return (2, 0, 0)
+
+
+def read_series_headers(path: str) -> Tuple[List[SeriesSource], Dict[str, Any]]:
+    """
+    Reads headers only (no pixel data) and returns (sources in slice order, series metadata).
+    Non-DICOM zip members (DICOMDIR aside) are skipped.
+    """
+    headers = []
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or member.filename.upper().endswith("DICOMDIR"):
+                    continue
+                try:
+                    with archive.open(member) as fp:
+                        ds = pydicom.dcmread(fp, stop_before_pixels=True)
+                except (InvalidDicomError, EOFError):
+                    continue
+                if "Rows" not in ds:
+                    continue
+                headers.append((member.filename, ds))
+    else:
+        headers.append((None, pydicom.dcmread(path, stop_before_pixels=True)))
+
+    if not headers:
+        raise ValueError("No DICOM images found in upload")
+
+    sources = sorted((_source_from_header(path, member, ds) for member, ds in headers), key=_sort_key)
+    first = headers[0][1]
+    spacing = first.get("PixelSpacing")
+    metadata = {
+        **header_metadata(first),
+        "series_description": str(first.get("SeriesDescription", "")),
+        "rows": int(first.Rows),
+        "columns": int(first.Columns),
+        "pixel_spacing_mm": [float(v) for v in spacing] if spacing else None,
+        "slice_spacing_mm": _slice_spacing(first, sources),
+        "instances": len(sources),
+        "frames": sum(source.frames for source in sources),
+    }
+    return sources, metadata
+
+
+def _slice_spacing(ds, sources: List[SeriesSource]) -> Optional[float]:
+    positions = [s.position for s in sources if s.position is not None]
+    if len(positions) > 1:
+        gaps = np.diff(positions)
+        gaps = gaps[gaps > 0]
+        if len(gaps):
+            return float(np.median(gaps))
+    for keyword in ("SpacingBetweenSlices", "SliceThickness"):
+        value = ds.get(keyword)
+        if value:
+            return float(value)
+    return None
+
+
+def iter_series_frames(sources: List[SeriesSource]) -> Iterator[SeriesFrame]:
+    """Decodes frames in slice order, one at a time, windowed per instance header; the caller decides how many to keep."""
+    index = 0
+    archive = None
+    try:
+        for source in sources:
+            if source.member is not None:
+                if archive is None:
+                    archive = zipfile.ZipFile(source.path)
+                buffer = io.BytesIO(archive.read(source.member))
+            else:
+                buffer = open(source.path, "rb")
+            try:
+                ds = pydicom.dcmread(buffer, stop_before_pixels=True)
+                buffer.seek(0)
+                monochrome = str(ds.get("PhotometricInterpretation", "")).startswith("MONOCHROME")
+                for frame_number, pixels in enumerate(iter_pixels(buffer)):
+                    image = to_display_uint8(ds, pixels) if monochrome else pixels.astype(np.uint8)
+                    yield SeriesFrame(index, source.instance_number, frame_number, image)
+                    index += 1
+            finally:
+                buffer.close()
+    finally:
+        if archive is not None:
+            archive.close()
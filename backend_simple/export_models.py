@@ -0,0 +1,236 @@
+# export_models.py
+"""
+Exports the classifier (models/model.h5) and the U-Net (models/segmentation_model.h5) for
+CPU serving, then compares every format against the float Keras models.
+
+For each model it writes:
+    models/saved/<name>/                    SavedModel
+    models/tflite/<name>_dynamic.tflite     dynamic-range quantization (int8 weights)
+    models/tflite/<name>_int8.tflite        full int8 post-training quantization, calibrated on
+                                            real inputs (float32 in/out, so callers don't change)
+    models/onnx/<name>.onnx                 with --onnx: the SavedModel converted by tf2onnx
+                                            (pip install -r requirements-onnx.txt)
+
+Calibration and evaluation images go through the same decode + preprocess as the API.
+The classifier is calibrated on 'MRI Images/Training' and scored (accuracy) on
+'MRI Images/Testing'; the U-Net is calibrated and scored (Dice) on slices from data_2d.
+
+Serve the exports with INFERENCE_BACKEND=tflite or onnx (see ai_models.py and inference_backends.py).
+
+Usage:
+    python export_models.py --calibration 200 --eval 400 --threads 4 [--onnx]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import subprocess
+from glob import glob
+import numpy as np
+import cv2
+import tensorflow as tf
+
+from app_simple.ai_pipeline_simple import (
+    load_image, preprocess_array, IMAGE_SIZE_CLASSIFY, IMAGE_SIZE_SEGMENT, CLASSES
+)
+from keras_inference import CompiledKerasModel
+from tflite_backend import TFLiteModel
+from onnx_backend import OnnxModel
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+SEG_THRESHOLD = 0.5
+
+
+# --- 1. Sample Data ---
+def classifier_samples(data_dir, count, seed):
+    """(paths, labels) drawn evenly-ish at random from <data_dir>/<class>/ (labels follow CLASSES)."""
+    items = []
+    for label, class_name in enumerate(CLASSES):
+        class_dir = os.path.join(data_dir, class_name)
+        if os.path.isdir(class_dir):
+            items += [(os.path.join(class_dir, f), label) for f in sorted(os.listdir(class_dir))
+                      if f.lower().endswith(IMAGE_EXTENSIONS)]
+    random.Random(seed).shuffle(items)
+    items = items[:count]
+    return [p for p, _ in items], np.array([l for _, l in items], dtype=np.int64)
+
+
+def segmentation_samples(data_path, count, seed):
+    """(image paths, mask paths) for random slices of a data_2d folder written by preprocess_brats.py."""
+    masks = {os.path.basename(p): p for p in glob(os.path.join(data_path, "masks", "*.png"))}
+    pairs = [(p, masks[os.path.basename(p)]) for p in sorted(glob(os.path.join(data_path, "images", "*.png")))
+             if os.path.basename(p) in masks]
+    random.Random(seed).shuffle(pairs)
+    pairs = pairs[:count]
+    return [p for p, _ in pairs], [m for _, m in pairs]
+
+
+def load_inputs(paths, size):
+    """Decodes and preprocesses like the API does; returns a float32 (N, H, W, 3) array."""
+    return np.concatenate([preprocess_array(load_image(p), size) for p in paths]).astype(np.float32)
+
+
+def load_masks(paths, size):
+    """Ground-truth masks as a bool (N, H, W) array at the U-Net's output size."""
+    return np.stack([
+        cv2.resize(cv2.imread(p, cv2.IMREAD_GRAYSCALE), size, interpolation=cv2.INTER_NEAREST) for p in paths
+    ]) > 127
+
+
+# --- 2. Export ---
+def export_saved_model(model, path):
+    model.export(path, format="tf_saved_model")
+    return path
+
+
+def convert_tflite(saved_model_dir, path, calibration=None):
+    """Dynamic-range quantization, or full int8 when a calibration array is given."""
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if calibration is not None:
+        def representative_dataset():
+            for sample in calibration:
+                yield [sample[np.newaxis]]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    return path
+
+
+def convert_onnx(saved_model_dir, path, opset):
+    """SavedModel -> ONNX through the tf2onnx command line (its documented SavedModel entry point)."""
+    subprocess.run(
+        [sys.executable, "-m", "tf2onnx.convert", "--saved-model", saved_model_dir,
+         "--output", path, "--opset", str(opset)],
+        check=True,
+    )
+    return path
+
+
+# --- 3. Compare ---
+def predict_all(model, inputs, batch_size):
+    return np.concatenate([model.predict(inputs[i:i + batch_size], verbose=0)
+                           for i in range(0, len(inputs), batch_size)])
+
+
+def latency_ms(model, sample, runs):
+    """Median and p95 of batch-of-one calls (what a single API request pays)."""
+    for _ in range(3):
+        model.predict(sample, verbose=0)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(sample, verbose=0)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times)), float(np.percentile(times, 95))
+
+
+def dice_scores(truth, predictions):
+    predicted = np.squeeze(predictions, axis=-1) > SEG_THRESHOLD
+    inter = np.logical_and(truth, predicted).sum(axis=(1, 2))
+    total = truth.sum(axis=(1, 2)) + predicted.sum(axis=(1, 2))
+    return np.where(total == 0, 1.0, 2.0 * inter / np.maximum(total, 1))
+
+
+def compare(name, candidates, inputs, score_fn, metric, batch_size, runs):
+    print(f"\n--- {name}: {len(inputs)} evaluation images ---")
+    print(f"{'format':<10} {'size MB':>8} {metric:>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, model, size_mb in candidates:
+        score = score_fn(predict_all(model, inputs, batch_size))
+        p50, p95 = latency_ms(model, inputs[:1], runs)
+        print(f"{label:<10} {size_mb:>8.1f} {score:>9.4f} {p50:>8.2f} {p95:>8.2f}")
+
+
+def _size_mb(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 2**20
+    return os.path.getsize(path) / 2**20
+
+
+def export_and_compare(name, model_path, calib_inputs, eval_inputs, score_fn, metric, args):
+    if not os.path.exists(model_path):
+        print(f"Skipping {name}: '{model_path}' not found.")
+        return
+    print(f"\nExporting {name} from {model_path}...")
+    model = tf.keras.models.load_model(model_path, compile=False)
+
+    saved_dir = export_saved_model(model, os.path.join(args.output, "saved", name))
+    tflite_dir = os.path.join(args.output, "tflite")
+    os.makedirs(tflite_dir, exist_ok=True)
+    dynamic_path = convert_tflite(saved_dir, os.path.join(tflite_dir, f"{name}_dynamic.tflite"))
+    int8_path = convert_tflite(saved_dir, os.path.join(tflite_dir, f"{name}_int8.tflite"), calib_inputs)
+    print(f"Wrote {saved_dir}, {dynamic_path}, {int8_path}")
+    onnx_path = None
+    if args.onnx:
+        os.makedirs(os.path.join(args.output, "onnx"), exist_ok=True)
+        onnx_path = convert_onnx(saved_dir, os.path.join(args.output, "onnx", f"{name}.onnx"), args.opset)
+        print(f"Wrote {onnx_path}")
+
+    if eval_inputs is None:
+        return
+    candidates = [
+        # Keras is timed through the same compiled tf.function the API serves with, not predict().
+        ("keras", CompiledKerasModel(model), _size_mb(model_path)),
+        ("dynamic", TFLiteModel(dynamic_path, args.threads), _size_mb(dynamic_path)),
+        ("int8", TFLiteModel(int8_path, args.threads), _size_mb(int8_path)),
+    ]
+    if onnx_path is not None:
+        candidates.append(("onnx", OnnxModel(onnx_path, args.threads), _size_mb(onnx_path)))
+    compare(name, candidates, eval_inputs, score_fn, metric, args.batch_size, args.runs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the models to SavedModel / TFLite and compare formats.")
+    parser.add_argument("--classifier", default="models/model.h5")
+    parser.add_argument("--segmenter", default="models/segmentation_model.h5")
+    parser.add_argument("--train-dir", default="MRI Images/Training/", help="Classifier calibration images.")
+    parser.add_argument("--test-dir", default="MRI Images/Testing/", help="Classifier evaluation images.")
+    parser.add_argument("--seg-data", default="../data_2d", help="data_2d folder from preprocess_brats.py.")
+    parser.add_argument("--output", default="models")
+    parser.add_argument("--calibration", type=int, default=200, help="Calibration images per model.")
+    parser.add_argument("--eval", type=int, default=400, help="Evaluation images per model (0 = skip comparison).")
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size for the accuracy/Dice pass.")
+    parser.add_argument("--runs", type=int, default=50, help="Timed batch-of-one calls per format.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="TFLite / ONNX Runtime threads.")
+    parser.add_argument("--onnx", action="store_true", help="Also export ONNX with tf2onnx (requirements-onnx.txt).")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset for --onnx.")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # --- Classifier ---
+    calib_paths, _ = classifier_samples(args.train_dir, args.calibration, args.seed)
+    eval_paths, eval_labels = classifier_samples(args.test_dir, args.eval, args.seed)
+    if not calib_paths:
+        print(f"Skipping classifier: no calibration images under '{args.train_dir}'.")
+    else:
+        export_and_compare(
+            "classification", args.classifier,
+            load_inputs(calib_paths, IMAGE_SIZE_CLASSIFY),
+            load_inputs(eval_paths, IMAGE_SIZE_CLASSIFY) if eval_paths else None,
+            lambda probs: float(np.mean(probs.argmax(axis=1) == eval_labels)), "accuracy", args,
+        )
+
+    # --- U-Net ---
+    # Calibration and evaluation slices come from disjoint halves of one shuffled sample.
+    seg_images, seg_masks = segmentation_samples(args.seg_data, args.calibration + args.eval, args.seed)
+    if not seg_images:
+        print(f"Skipping segmentation: no image/mask slices under '{args.seg_data}'.")
+        return
+    eval_images, eval_masks = seg_images[args.calibration:], seg_masks[args.calibration:]
+    eval_truth = load_masks(eval_masks, IMAGE_SIZE_SEGMENT) if eval_images else None
+    export_and_compare(
+        "segmentation", args.segmenter,
+        load_inputs(seg_images[:args.calibration], IMAGE_SIZE_SEGMENT),
+        load_inputs(eval_images, IMAGE_SIZE_SEGMENT) if eval_images else None,
+        lambda predictions: float(np.mean(dice_scores(eval_truth, predictions))), "dice", args,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Liveness and readiness probes under /health.
+
+/health/live answers as soon as the process serves requests. /health/ready returns 200 only
+after the models have loaded and a dummy inference has traced every graph; until then it
+returns 503 with the warmup state, so load balancers hold traffic that needs the models.
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from . import ai_models
+from .analysis_executor import ANALYSIS_RETRY_AFTER_SECONDS
+
+router = APIRouter()
+
+@router.get("/live")
+async def liveness():
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness():
+    state = ai_models.readiness()
+    if not state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content=state,
+            headers={"Retry-After": str(ANALYSIS_RETRY_AFTER_SECONDS)},
+        )
+    return state
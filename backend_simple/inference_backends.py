@@ -0,0 +1,284 @@
+"""
+Inference backends: the one interface the analysis pipeline, Grad-CAM and the routes use to
+run the classifier and the U-Net, whatever runtime executes them.
+
+    classify(batch)                          float32 (B, 128, 128, 3) -> class probabilities (B, K)
+    segment(batch)                           float32 (B, 256, 256, 3) -> tumor probabilities (B, 256, 256, 1)
+    explain(batch, classes)                  -> Grad-CAM heatmaps (B, h, w) in [0, 1], row i for classes[i]
+    classify_and_explain(batch, skip_class)  -> (probabilities, heatmaps for each top class); rows whose
+                                             top class is `skip_class` get a zero heatmap, no gradients
+    conv_features_and_grads(batch, class)    -> (conv maps (B, h, w, c), d score / d conv maps, probabilities)
+                                             for `class`, or each image's top class when it is None
+
+Implementations (picked with INFERENCE_BACKEND, see ai_models.py):
+    KerasBackend   the .h5 models
+    TFLiteBackend  exported .tflite files (export_models.py) through tf.lite.Interpreter
+    OnnxBackend    .onnx files through ONNX Runtime (optional dependency, imported on use)
+    RandomBackend  tiny randomly initialized Keras models, for tests and benchmarks
+
+TFLite and ONNX graphs have no gradients, so those backends classify and segment on their own
+runtime and keep the Keras classifier only to explain tumor predictions (Grad-CAM).
+
+Keras models are never called through model.predict(), which builds a data adapter and a
+step function on every call. Each model is wrapped in a tf.function with a fixed float32
+(None, H, W, 3) TensorSpec, traced once by warmup() and then called directly.
+"""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+import tensorflow as tf
+
+from .app_simple.grad_cam_graph import get_grad_cam_graph
+from .app_simple.ai_pipeline_simple import LAST_CONV_LAYER_NAME, IMAGE_SIZE_CLASSIFY, IMAGE_SIZE_SEGMENT, CLASSES
+from .keras_inference import compile_inference
+from .tflite_backend import TFLiteModel
+from .onnx_backend import OnnxModel
+
+
+class InferenceBackend:
+    """Interface. Backends built on a Keras classifier also expose `grad_cam_graph` (multi-class Grad-CAM)."""
+
+    name = "base"
+    grad_cam_graph = None
+
+    def classify(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def segment(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def explain(self, batch: np.ndarray, classes: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    @property
+    def heatmap_shape(self) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def classify_and_explain(
+        self, batch: np.ndarray, skip_class: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """classify(), then explain() only the rows whose top class is not `skip_class`."""
+        predictions = np.asarray(self.classify(batch))
+        return predictions, _explain_top_classes(predictions, skip_class, self.heatmap_shape,
+                                                 lambda rows, classes: self.explain(batch[rows], classes))
+
+    def conv_features_and_grads(
+        self, batch: np.ndarray, class_index: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+    def warmup(self) -> Dict[str, float]:
+        """
+        One call of every inference path on a blank batch of one, so graphs are traced and
+        buffers allocated before the first request. Returns milliseconds per path.
+        """
+        timings = {}
+        blank_classify = np.zeros((1,) + IMAGE_SIZE_CLASSIFY + (3,), dtype=np.float32)
+        blank_segment = np.zeros((1,) + IMAGE_SIZE_SEGMENT + (3,), dtype=np.float32)
+        paths = [
+            ("classify", self.classify, blank_classify),
+            ("segment", self.segment, blank_segment),
+            ("classify_and_explain", self.classify_and_explain, blank_classify),
+        ]
+        for name, fn, blank in paths:
+            start = time.perf_counter()
+            fn(blank)
+            timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        return timings
+
+
+def _explain_top_classes(predictions, skip_class, heatmap_shape, explain_rows) -> np.ndarray:
+    """
+    Heatmaps (B, h, w) for each row's top class. `explain_rows(rows, classes)` is only called
+    for the rows that need one; rows whose top class is `skip_class` stay all zero.
+    """
+    top_classes = predictions.argmax(axis=1).astype(np.int32)
+    rows = np.flatnonzero(top_classes != skip_class) if skip_class is not None else np.arange(len(top_classes))
+    heatmaps = np.zeros((len(predictions),) + tuple(heatmap_shape), dtype=np.float32)
+    if len(rows):
+        heatmaps[rows] = np.asarray(explain_rows(rows, top_classes[rows]))
+    return heatmaps
+
+
+def _median_call_ms(fn, sample, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(sample)
+        times.append((time.perf_counter() - start) * 1000)
+    return round(float(np.median(times)), 2)
+
+
+class KerasBackend(InferenceBackend):
+    name = "keras"
+
+    def __init__(self, classifier, segmenter, last_conv_layer_name: str = LAST_CONV_LAYER_NAME):
+        self.classifier = classifier
+        self.segmenter = segmenter
+        self.last_conv_layer_name = last_conv_layer_name
+        self._classify_fn = compile_inference(classifier)
+        # Runtime backends pass a TFLite / ONNX segmenter, which is called as-is.
+        self._segment_fn = compile_inference(segmenter) if isinstance(segmenter, tf.keras.Model) else None
+
+    @property
+    def grad_cam_graph(self):
+        # Built once per (model, layer) and cached in grad_cam_graph.
+        return get_grad_cam_graph(self.classifier, self.last_conv_layer_name)
+
+    @property
+    def heatmap_shape(self):
+        return self.grad_cam_graph.heatmap_shape
+
+    def classify(self, batch):
+        return self._classify_fn(tf.constant(np.asarray(batch, dtype=np.float32))).numpy()
+
+    def explain(self, batch, classes):
+        return self.grad_cam_graph.explain_fn(
+            tf.constant(np.asarray(batch, dtype=np.float32)), tf.constant(classes, dtype=tf.int32)
+        ).numpy()
+
+    def classify_and_explain(self, batch, skip_class=None):
+        """
+        One untaped forward pass keeps the conv maps; only rows that need a heatmap then pay for
+        the gradient, and only through the classifier head.
+        """
+        predictions, conv_outputs = self.grad_cam_graph.classify_with_features_fn(
+            tf.constant(np.asarray(batch, dtype=np.float32))
+        )
+        predictions, conv_outputs = predictions.numpy(), conv_outputs.numpy()
+        return predictions, _explain_top_classes(
+            predictions, skip_class, self.heatmap_shape,
+            lambda rows, classes: self.grad_cam_graph.explain_features_fn(
+                tf.constant(conv_outputs[rows]), tf.constant(classes, dtype=tf.int32)
+            ).numpy(),
+        )
+
+    def segment(self, batch):
+        return self._segment_fn(tf.constant(np.asarray(batch, dtype=np.float32))).numpy()
+
+    def measure_call_overhead(self, runs: int = 5) -> Dict[str, Dict[str, float]]:
+        """
+        Median milliseconds for a batch of one through model.predict() vs. the compiled
+        function, per Keras model. The difference is the per-call cost predict() used to add.
+        """
+        report = {}
+        for name, model, fn, size in (
+            ("classification", self.classifier, self._classify_fn, IMAGE_SIZE_CLASSIFY),
+            ("segmentation", self.segmenter, self._segment_fn, IMAGE_SIZE_SEGMENT),
+        ):
+            if fn is None:
+                continue
+            sample = np.zeros((1,) + size + (3,), dtype=np.float32)
+            predict_ms = _median_call_ms(lambda x: model.predict(x, verbose=0), sample, runs)
+            compiled_ms = _median_call_ms(lambda x: fn(tf.constant(x)).numpy(), sample, runs)
+            report[name] = {
+                "predict_ms": predict_ms,
+                "compiled_ms": compiled_ms,
+                "overhead_ms": round(predict_ms - compiled_ms, 2),
+            }
+        return report
+
+    def conv_features_and_grads(self, batch, class_index=None):
+        class_index = -1 if class_index is None else int(class_index)
+        features, grads, predictions = self.grad_cam_graph.features_and_grads_fn(
+            tf.constant(np.asarray(batch, dtype=np.float32)), tf.constant(class_index, dtype=tf.int32)
+        )
+        return features.numpy(), grads.numpy(), predictions.numpy()
+
+
+class TFLiteBackend(KerasBackend):
+    """
+    U-Net and classifier through TFLite. The Keras classifier only runs Grad-CAM, for the rows
+    a tumor class won; without a classifier export it also classifies.
+    """
+
+    name = "tflite"
+
+    def __init__(self, keras_classifier, segmenter, classifier=None):
+        super().__init__(keras_classifier, segmenter)
+        self.runtime_classifier = classifier
+
+    def classify(self, batch):
+        if self.runtime_classifier is None:
+            return super().classify(batch)
+        return self.runtime_classifier.predict(batch)
+
+    def classify_and_explain(self, batch, skip_class=None):
+        if self.runtime_classifier is None:
+            return super().classify_and_explain(batch, skip_class)
+        # Runtime probabilities for every row; Keras forward + backward only for explained rows.
+        return InferenceBackend.classify_and_explain(self, batch, skip_class)
+
+    def segment(self, batch):
+        return self.segmenter.predict(batch)
+
+    def describe(self):
+        return {
+            "backend": self.name,
+            "segmenter": getattr(self.segmenter, "model_path", None),
+            "classifier": getattr(self.runtime_classifier, "model_path", None) or "keras",
+            "grad_cam": "keras",
+        }
+
+
+class OnnxBackend(TFLiteBackend):
+    """Same split as TFLiteBackend, with ONNX Runtime sessions instead of interpreters."""
+
+    name = "onnx"
+
+
+class RandomBackend(KerasBackend):
+    """
+    Tiny randomly initialized stand-ins with the real input/output shapes and a conv layer named
+    like the VGG16 one, so every code path (batching, Grad-CAM, overlays) runs without model files.
+    Predictions are meaningless; the same seed always gives the same weights.
+    """
+
+    name = "random"
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        super().__init__(self._tiny_classifier(seed), self._tiny_segmenter(seed + 1))
+
+    @staticmethod
+    def _tiny_classifier(seed):
+        init = tf.keras.initializers.GlorotUniform(seed=seed)
+        inputs = tf.keras.Input(shape=IMAGE_SIZE_CLASSIFY + (3,))
+        x = tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu", kernel_initializer=init)(inputs)
+        x = tf.keras.layers.Conv2D(16, 3, strides=4, activation="relu", kernel_initializer=init,
+                                   name=LAST_CONV_LAYER_NAME)(x)
+        x = tf.keras.layers.GlobalAveragePooling2D()(x)
+        outputs = tf.keras.layers.Dense(len(CLASSES), activation="softmax", kernel_initializer=init)(x)
+        return tf.keras.Model(inputs, outputs, name="random_classifier")
+
+    @staticmethod
+    def _tiny_segmenter(seed):
+        init = tf.keras.initializers.GlorotUniform(seed=seed)
+        inputs = tf.keras.Input(shape=IMAGE_SIZE_SEGMENT + (3,))
+        x = tf.keras.layers.Conv2D(4, 3, padding="same", activation="relu", kernel_initializer=init)(inputs)
+        outputs = tf.keras.layers.Conv2D(1, 1, activation="sigmoid", kernel_initializer=init)(x)
+        return tf.keras.Model(inputs, outputs, name="random_segmenter")
+
+    def describe(self):
+        return {
+            "backend": self.name,
+            "seed": self.seed,
+            "params": int(self.classifier.count_params() + self.segmenter.count_params()),
+        }
+
+
+def load_runtime_model(kind: str, path: str, num_threads: int):
+    """Opens an exported model file for the "tflite" or "onnx" backend."""
+    if kind == "tflite":
+        return TFLiteModel(path, num_threads=num_threads)
+    if kind == "onnx":
+        return OnnxModel(path, num_threads=num_threads)
+    raise ValueError(f"Unknown runtime '{kind}'")
+
+
+RUNTIME_BACKENDS = {"tflite": TFLiteBackend, "onnx": OnnxBackend}
+RUNTIME_EXTENSIONS = {"tflite": ".tflite", "onnx": ".onnx"}
@@ -0,0 +1,125 @@
+"""
+In-process micro-batching scheduler for model inference.
+
+Concurrent callers submit single samples; a background task collects them for up to
+`max_wait_ms` (or until `max_batch_size` is reached), runs one batched forward pass
+on a dedicated thread, and resolves each caller's future with its own row of the output.
+If `predict_fn` returns a tuple of arrays, each caller receives a tuple of its rows.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional
+import numpy as np
+
+from .analysis_executor import AnalysisOverloaded
+
+
+class BatchQueueFull(AnalysisOverloaded):
+    """Raised when a batcher already holds `max_queue_depth` pending samples."""
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        name: str,
+        predict_fn: Callable[[np.ndarray], Any],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        max_queue_depth: int = 64,
+    ):
+        self.name = name
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.max_queue_depth = max(1, int(max_queue_depth))
+
+        # One forward pass at a time; the model itself uses TF's intra-op threads.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"batcher-{name}")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_samples = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, sample: np.ndarray) -> np.ndarray:
+        """Queues one sample (no batch dimension) and waits for its prediction row."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((sample, future))
+        except asyncio.QueueFull:
+            raise BatchQueueFull(f"{self.name} batcher queue is full ({self.max_queue_depth} pending)")
+        self.requests += 1
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (cancelled) don't need a slot in the forward pass.
+            batch = [(sample, fut) for sample, fut in batch if not fut.done()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                inputs = np.stack([sample for sample, _ in batch]).astype(np.float32)
+                outputs = await loop.run_in_executor(self._executor, self.predict_fn, inputs)
+            except Exception as e:
+                print(f"🔥 {self.name} batch of {len(batch)} failed: {e}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.batched_samples += len(batch)
+            self.last_batch_size = len(batch)
+            self.last_batch_seconds = time.perf_counter() - start
+            for i, (_, fut) in enumerate(batch):
+                if not fut.done():
+                    if isinstance(outputs, tuple):
+                        fut.set_result(tuple(output[i] for output in outputs))
+                    else:
+                        fut.set_result(outputs[i])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_samples / self.batches, 2) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_seconds * 1000, 2),
+        }
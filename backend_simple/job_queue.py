@@ -0,0 +1,210 @@
+"""
+Mongo-backed job queue for background analyses.
+
+Jobs live in the `jobs` collection, so they survive restarts and can be shared by several
+API processes. Workers claim jobs atomically with find_one_and_update and hold a lease that
+they renew while working; a job whose worker died is re-claimed once its lease expires.
+"""
+
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from .database import db
+from .analysis_executor import AnalysisOverloaded
+from . import metrics
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+_worker_tasks: List[asyncio.Task] = []
+
+
+async def enqueue(kind: str, payload: Dict[str, Any], timings_ms: Optional[Dict[str, float]] = None) -> str:
+    """Persists a new queued job and returns its id."""
+    job = {
+        "kind": kind,
+        "status": STATUS_QUEUED,
+        "payload": payload,
+        "created_at": datetime.utcnow(),
+        "started_at": None,
+        "finished_at": None,
+        "attempts": 0,
+        "worker_id": None,
+        "lease_expires_at": None,
+        "timings_ms": timings_ms or {},
+        "result": None,
+        "error": None,
+    }
+    result = await db.jobs.insert_one(job)
+    return str(result.inserted_id)
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        obj_id = ObjectId(job_id)
+    except Exception:
+        return None
+    return await db.jobs.find_one({"_id": obj_id})
+
+
+async def claim(worker_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Atomically moves the oldest claimable job to 'running' and returns it.
+    Claimable = queued, or running with an expired lease (its worker died) and attempts left.
+    """
+    now = datetime.utcnow()
+    return await db.jobs.find_one_and_update(
+        {
+            "$or": [
+                {"status": STATUS_QUEUED},
+                {"status": STATUS_RUNNING, "lease_expires_at": {"$lt": now}, "attempts": {"$lt": JOB_MAX_ATTEMPTS}},
+            ]
+        },
+        {
+            "$set": {
+                "status": STATUS_RUNNING,
+                "worker_id": worker_id,
+                "started_at": now,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def fail_exhausted():
+    """Marks jobs whose lease expired after their last allowed attempt as failed."""
+    await db.jobs.update_many(
+        {"status": STATUS_RUNNING, "lease_expires_at": {"$lt": datetime.utcnow()}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}},
+        {"$set": {"status": STATUS_FAILED, "error": "Worker lost too many times", "finished_at": datetime.utcnow()}},
+    )
+
+
+async def _renew_lease(job_id, worker_id: str):
+    """
+    Extends the lease every JOB_LEASE_SECONDS / 3 and returns once it is lost: another worker
+    took the job over, or renewals kept failing until the lease would have run out.
+    """
+    lease_expires = time.monotonic() + JOB_LEASE_SECONDS
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            result = await db.jobs.update_one(
+                {"_id": job_id, "worker_id": worker_id, "status": STATUS_RUNNING},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}},
+            )
+        except Exception as e:
+            print(f"⚠️ Job {job_id}: lease renewal failed: {e}")
+            # Give up before the next attempt would land after expiry, when another worker may claim it.
+            if time.monotonic() + JOB_LEASE_SECONDS / 3 >= lease_expires:
+                print(f"⚠️ Job {job_id}: lease expired while Mongo was unreachable")
+                return
+            continue
+        if result.matched_count == 0:
+            print(f"⚠️ Job {job_id}: lease taken over by another worker")
+            return
+        lease_expires = time.monotonic() + JOB_LEASE_SECONDS
+
+
+async def _finish(job_id, worker_id: str, fields: Dict[str, Any]):
+    # Guarded by worker_id so a worker whose lease was taken over can't overwrite the new owner.
+    fields["finished_at"] = datetime.utcnow()
+    fields["lease_expires_at"] = None
+    await db.jobs.update_one({"_id": job_id, "worker_id": worker_id}, {"$set": fields})
+
+
+async def _run_job(job: Dict[str, Any], worker_id: str, handler: JobHandler):
+    job_id = job["_id"]
+    queue_wait_ms = round((job["started_at"] - job["created_at"]).total_seconds() * 1000, 2)
+    work = asyncio.create_task(handler(job))
+    renewer = asyncio.create_task(_renew_lease(job_id, worker_id))
+    try:
+        await asyncio.wait({work, renewer}, return_when=asyncio.FIRST_COMPLETED)
+        if not work.done():
+            # The lease is gone, so the job may already be running elsewhere: stop and leave
+            # the job document to its new owner. Handlers must be safe to re-run (see _save_study).
+            work.cancel()
+            await asyncio.gather(work, return_exceptions=True)
+            print(f"⚠️ Job {job_id} abandoned after losing its lease")
+            return
+        outcome = work.result()
+    except AnalysisOverloaded:
+        # Not the job's fault: hand it back to the queue and let the caller back off.
+        await db.jobs.update_one(
+            {"_id": job_id, "worker_id": worker_id},
+            {"$set": {"status": STATUS_QUEUED, "worker_id": None, "lease_expires_at": None}, "$inc": {"attempts": -1}},
+        )
+        raise
+    except Exception as e:
+        print(f"🔥 Job {job_id} failed: {e}")
+        await _finish(job_id, worker_id, {"status": STATUS_FAILED, "error": str(e)})
+    else:
+        stage_timings = {"queue_wait": queue_wait_ms, **outcome.pop("timings_ms", {})}
+        metrics.observe_stages(f"{job.get('kind', 'unknown')}_job", stage_timings)
+        timings = dict(job.get("timings_ms") or {})
+        timings.update(stage_timings)
+        await _finish(job_id, worker_id, {"status": STATUS_DONE, "result": outcome, "timings_ms": timings})
+        print(f"✅ Job {job_id} done")
+    finally:
+        renewer.cancel()
+        work.cancel()
+
+
+async def _worker_loop(worker_id: str, handler: JobHandler):
+    print(f"Job worker {worker_id} started.")
+    while True:
+        try:
+            job = await claim(worker_id)
+            if job is None:
+                await fail_exhausted()
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+            await _run_job(job, worker_id, handler)
+        except asyncio.CancelledError:
+            raise
+        except AnalysisOverloaded:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+        except Exception as e:
+            print(f"🔥 Job worker {worker_id} error: {e}")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+async def start_workers(handler: JobHandler):
+    """Starts JOB_WORKERS polling workers in this process."""
+    await db.jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    # Backs the job_id upsert that keeps a re-run job from writing a second Study.
+    await db.studies.create_index(
+        "job_id", unique=True, partialFilterExpression={"job_id": {"$type": "string"}}
+    )
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(JOB_WORKERS):
+        _worker_tasks.append(asyncio.create_task(_worker_loop(f"{prefix}:{i}", handler)))
+
+
+async def stop_workers():
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+
+
+async def queue_depth() -> int:
+    return await db.jobs.count_documents({"status": STATUS_QUEUED})
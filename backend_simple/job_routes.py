@@ -0,0 +1,35 @@
+"""
+Handles the /jobs endpoints used to poll background analyses.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from .auth import get_current_user
+from . import job_queue
+
+router = APIRouter(
+    tags=["Jobs"],
+    dependencies=[Depends(get_current_user)]
+)
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Reports a background job as queued, running, done or failed, with per-stage timings (ms).
+    """
+    job = await job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "timings_ms": job.get("timings_ms") or {},
+        "result": job.get("result"),
+        "error": job.get("error"),
+    }
@@ -0,0 +1,38 @@
+"""
+Compiled Keras inference: the call path KerasBackend serves with (see inference_backends.py).
+
+compile_inference() wraps a model in a tf.function with a fixed float32 (None, H, W, C)
+signature, so it is traced once and called without model.predict()'s per-call setup.
+CompiledKerasModel puts that function behind the same `predict(batch)` call as TFLiteModel,
+so export_models.py times Keras exactly as the API runs it.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+
+def compile_inference(model):
+    """
+    model(images, training=False) as a tf.function with a fixed float32 (None, H, W, C)
+    signature: traced once (any batch size), no per-call predict() setup.
+    """
+    spec = tf.TensorSpec(shape=(None,) + tuple(model.input_shape[1:]), dtype=tf.float32)
+
+    @tf.function(input_signature=[spec])
+    def infer(images):
+        return model(images, training=False)
+
+    return infer
+
+
+class CompiledKerasModel:
+    def __init__(self, model):
+        self.model = model
+        self._infer = compile_inference(model)
+
+    def predict(self, batch, batch_size=None, verbose=0) -> np.ndarray:
+        """Same contract as keras Model.predict for a single input; `verbose` is ignored."""
+        batch = np.asarray(batch, dtype=np.float32)
+        step = batch_size or len(batch)
+        outputs = [self._infer(tf.constant(batch[i:i + step])).numpy() for i in range(0, len(batch), step)]
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
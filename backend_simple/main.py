@@ -1,19 +1,61 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 from pathlib import Path
+from dotenv import load_dotenv
+import importlib
+import time
 import os
 
-from . import auth
-from . import patient_routes
-from . import chatbot_routes  
-from . import quiz_routes
+# Load .env before the route modules read their tuning knobs at import time.
+load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env")
+
+# Heavy ML libraries (TensorFlow, google.generativeai) are imported on first use, not here;
+# each module's import time is logged so a regression shows up at startup.
+import_times_ms = {}
+
+def _timed_import(name):
+    start = time.perf_counter()
+    module = importlib.import_module(f".{name}", __package__)
+    import_times_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+    return module
+
+auth = _timed_import("auth")
+patient_routes = _timed_import("patient_routes")
+chatbot_routes = _timed_import("chatbot_routes")
+quiz_routes = _timed_import("quiz_routes")
+system_routes = _timed_import("system_routes")
+job_routes = _timed_import("job_routes")
+viewer_routes = _timed_import("viewer_routes")
+health_routes = _timed_import("health_routes")
+metrics_routes = _timed_import("metrics_routes")
+metrics = _timed_import("metrics")
+job_queue = _timed_import("job_queue")
+ai_models = _timed_import("ai_models")
+from .analysis_executor import AnalysisOverloaded, ANALYSIS_RETRY_AFTER_SECONDS
+
+# Shared dependencies are counted against the first module that imports them.
+print("Module import times (ms): " + ", ".join(f"{name}={ms}" for name, ms in import_times_ms.items()))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models load and warm up in the background; until /health/ready is true, routes that need
+    # them answer 503 + Retry-After while auth, CRUD and health checks are served normally.
+    await ai_models.start_warmup()
+    await job_queue.start_workers(patient_routes.process_analysis_job)
+    await quiz_routes.start_quiz_services()
+    yield
+    await quiz_routes.case_pool.stop()
+    await job_queue.stop_workers()
 
 app = FastAPI(
     title="Neurosymbolic AI API",
     description="API for brain tumor diagnosis, segmentation, and educational support.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -24,24 +66,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    # Latency per route template (not raw path, so IDs don't explode the label set). Stages the
+    # handler observes via metrics.observe_stages() come back as a Server-Timing header on demand.
+    timings = metrics.start_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    if metrics.SERVER_TIMING_HEADER or request.headers.get("x-debug-timings") == "1":
+        response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed * 1000)
+    return response
+
+@app.exception_handler(AnalysisOverloaded)
+async def analysis_overloaded_handler(request: Request, exc: AnalysisOverloaded):
+    # Backpressure: tell clients to retry instead of queueing unbounded work.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(ANALYSIS_RETRY_AFTER_SECONDS)},
+    )
+
 print("Plugging in authentication router...")
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 
 print("Plugging in patient & study router...")
 app.include_router(patient_routes.router, tags=["Patients & Studies"])
 
+print("Plugging in job status router...")
+app.include_router(job_routes.router, tags=["Jobs"])
+
+print("Plugging in image viewer router...")
+app.include_router(viewer_routes.router, tags=["Viewer"])
+
 print("Plugging in student chat router...")
 app.include_router(chatbot_routes.router, prefix="/api", tags=["Student AI Bot"])
 
 print("Plugging in quiz router...")
 app.include_router(quiz_routes.router, prefix="/api", tags=["Quiz"])
 
+print("Plugging in system router...")
+app.include_router(system_routes.router, prefix="/system", tags=["System"])
+
+print("Plugging in health router...")
+app.include_router(health_routes.router, prefix="/health", tags=["Health"])
+
+print("Plugging in metrics router...")
+app.include_router(metrics_routes.router, tags=["Metrics"])
+
 UPLOADS_DIR = Path(__file__).resolve().parent / "uploads"
 os.makedirs(UPLOADS_DIR, exist_ok=True)  # Ensure it exists
 
 app.mount("/uploads", StaticFiles(directory=UPLOADS_DIR), name="uploads")
 print(f"Serving static files from: {UPLOADS_DIR}")
 
+# Quiz images are served straight from the dataset (read-only) instead of being copied into uploads/.
+app.mount(
+    quiz_routes.DATASET_URL_PREFIX,
+    StaticFiles(directory=quiz_routes.DATASET_DIR, check_dir=False),
+    name="dataset"
+)
+
 @app.get("/", tags=["Root"])
 async def read_root():
   return {"message": "Welcome to the Neurosymbolic AI API"}
@@ -0,0 +1,83 @@
+"""
+GET /metrics in the Prometheus text exposition format.
+
+Stage and request latency histograms are filled in as requests run (see metrics.py); the
+gauges below read the state of the executor, batchers, cache and models at scrape time.
+"""
+
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from . import ai_models, job_queue
+from .metrics import REGISTRY
+from .analysis_executor import analysis_executor
+from .analysis_cache import result_cache
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _batcher_field(field):
+    return lambda: {(name,): stats[field] for name, stats in ai_models.batcher_stats().items()}
+
+
+def _cache_lookups():
+    stats = result_cache.stats()
+    return {
+        ("memory_hit",): stats["memory_hits"],
+        ("persistent_hit",): stats["persistent_hits"],
+        ("miss",): stats["misses"],
+    }
+
+
+def _model_weight_bytes():
+    return {
+        (name,): int(stats["weights_mb"] * 1024 * 1024)
+        for name, stats in ai_models.model_stats.items() if "weights_mb" in stats
+    }
+
+
+JOB_QUEUE_DEPTH = REGISTRY.gauge("neuroai_job_queue_depth", "Background jobs waiting for a worker.")
+REGISTRY.gauge("neuroai_batcher_queue_depth", "Inference requests waiting in a micro-batcher.",
+               ("model",), collect=_batcher_field("queue_depth"))
+REGISTRY.gauge("neuroai_batcher_requests_total", "Inference requests submitted to a micro-batcher.",
+               ("model",), collect=_batcher_field("requests"), kind="counter")
+REGISTRY.gauge("neuroai_batcher_batches_total", "Batched model calls made by a micro-batcher.",
+               ("model",), collect=_batcher_field("batches"), kind="counter")
+REGISTRY.gauge("neuroai_analyses_in_flight", "Analyses holding an executor slot.",
+               collect=lambda: analysis_executor.in_flight)
+REGISTRY.gauge("neuroai_analyses_rejected_total", "Analyses rejected with 503 because the executor was full.",
+               collect=lambda: analysis_executor.rejected, kind="counter")
+REGISTRY.gauge("neuroai_analysis_cache_lookups_total", "Analysis cache lookups by outcome.",
+               ("result",), collect=_cache_lookups, kind="counter")
+REGISTRY.gauge("neuroai_analysis_cache_hit_ratio", "Analysis cache hits / lookups since start.",
+               collect=lambda: result_cache.stats()["hit_rate"])
+REGISTRY.gauge("neuroai_analysis_cache_bytes", "Bytes held by the in-memory analysis cache.",
+               collect=lambda: result_cache.stats()["memory_bytes"])
+REGISTRY.gauge("neuroai_model_weight_bytes", "Weight bytes per loaded model (file size for TFLite/ONNX exports).",
+               ("model",), collect=_model_weight_bytes)
+REGISTRY.gauge("neuroai_models_ready", "1 once the models are loaded and warmed up.",
+               collect=lambda: int(ai_models.ready))
+REGISTRY.gauge("neuroai_process_resident_bytes", "Resident set size of this API process.",
+               collect=_rss_bytes)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # The job queue lives in Mongo, so its depth is read here rather than in a callback.
+    try:
+        JOB_QUEUE_DEPTH.set(await job_queue.queue_depth())
+    except Exception as e:
+        print(f"⚠️ metrics: job queue depth unavailable: {e}")
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
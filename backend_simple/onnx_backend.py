@@ -0,0 +1,24 @@
+"""
+ONNX Runtime inference for the exported U-Net (see export_models.py --onnx).
+
+OnnxModel exposes the same `predict(batch)` call as TFLiteModel. onnxruntime is an optional
+dependency (requirements-onnx.txt) and is only imported when a model is opened.
+"""
+
+import numpy as np
+
+
+class OnnxModel:
+    def __init__(self, model_path: str, num_threads: int = 1):
+        import onnxruntime as ort  # optional: only needed for INFERENCE_BACKEND=onnx
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        # InferenceSession.run is thread-safe, so no lock is needed here.
+        return self.session.run(None, {self.input_name: np.asarray(batch, dtype=np.float32)})[0]
@@ -7,25 +7,34 @@ from fastapi import (
     APIRouter, Depends, HTTPException, status, 
     Form, File, UploadFile
 )
-from typing import List
+from fastapi.responses import JSONResponse
+from typing import List, Optional
 import os
+import time
 import aiofiles
 from bson import ObjectId
+from pymongo import ReturnDocument
 from pathlib import Path
-import tensorflow as tf
 import cv2
 import numpy as np
-import pydicom
-from PIL import Image
-import io
 from .database import db, Patient, Study, PatientDetailsResponse
 from .auth import get_current_user
-from .app_simple.ai_pipeline_simple import run_simple_analysis, extract_facts_from_mask
+from . import ai_models
+from . import job_queue
+from .analysis_executor import analysis_executor, AnalysisOverloaded
+from .analysis_cache import result_cache
+from .app_simple.ai_pipeline_simple import run_simple_analysis, extract_facts_from_mask, explain_classes, CLASSES
+from .app_simple.volume_pipeline_simple import run_volume_analysis, run_series_analysis, is_nifti
+from . import dicom_io
+from . import metrics
 
 BASE_DIR = Path(__file__).resolve().parent
-CLASSIFICATION_MODEL_PATH = BASE_DIR / "models" / "model.h5"
-SEGMENTATION_MODEL_PATH = BASE_DIR / "models" / "segmentation_model.h5"
 UPLOADS_DIR = BASE_DIR / "uploads"
+VOLUMES_DIR = UPLOADS_DIR / "volumes"
+SERIES_DIR = UPLOADS_DIR / "series"
+VOLUME_BATCH_SIZE = int(os.getenv("VOLUME_BATCH_SIZE", "32"))
+SERIES_BATCH_SIZE = int(os.getenv("SERIES_BATCH_SIZE", "16"))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
 router = APIRouter(
     tags=["Patients & Studies"],
@@ -33,43 +42,14 @@ router = APIRouter(
 )
 
 os.makedirs(UPLOADS_DIR, exist_ok=True)
+os.makedirs(VOLUMES_DIR, exist_ok=True)
+os.makedirs(SERIES_DIR, exist_ok=True)
 
-def dice_loss(y_true, y_pred, smooth=1e-6):
-    y_true_f = tf.keras.layers.Flatten()(y_true)
-    y_pred_f = tf.keras.layers.Flatten()(y_pred)
-    inter = tf.reduce_sum(y_true_f * y_pred_f)
-    return 1.0 - ((2.0 * inter + smooth) / (tf.reduce_sum(y_true_f) + tf.reduce_sum(y_pred_f) + smooth))
-
-CUSTOM_OBJECTS = {"dice_loss": dice_loss}
-
-def process_dicom(file_bytes):
-    """Reads DICOM bytes, extracts metadata, converts image to PNG bytes."""
-    try:
-        dicom_data = pydicom.dcmread(io.BytesIO(file_bytes))
-        
-        metadata = {
-            "patient_name": str(dicom_data.get("PatientName", "Unknown")),
-            "patient_id": str(dicom_data.get("PatientID", "Unknown")),
-            "modality": str(dicom_data.get("Modality", "MR")),
-            "study_date": str(dicom_data.get("StudyDate", "Unknown"))
-        }
-
-        if not hasattr(dicom_data, "pixel_array"):
-            raise ValueError("DICOM file has no pixel data.")
-
-        pixel_array = dicom_data.pixel_array.astype(float)
-        
-        scaled_image = (np.maximum(pixel_array, 0) / pixel_array.max()) * 255.0
-        scaled_image = np.uint8(scaled_image)
-
-        image = Image.fromarray(scaled_image)
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        return img_byte_arr.getvalue(), metadata
-
-    except Exception as e:
-        print(f"DICOM processing error: {e}")
-        return None, None
+def _study_image_url(unique_filename: str) -> str:
+    """DICOM uploads are kept as-is and rendered to PNG by the viewer route on first view."""
+    if unique_filename.lower().endswith(".dcm"):
+        return f"/viewer/dicom/{unique_filename}"
+    return f"/uploads/{unique_filename}"
 
 @router.post("/patients", response_model=Patient, status_code=status.HTTP_201_CREATED)
 async def create_patient(patient: Patient):
@@ -114,33 +94,24 @@ async def delete_patient(patient_id: str):
     
     return
 
-@router.post("/studies/upload", summary="Upload and analyze MRI (Supports PNG/JPG/DCM)")
-async def upload_and_analyze(
-    patient_id: str = Form(...),
-    file: UploadFile = File(...),
-    idh_status: str = Form("Unknown"),
-    mgmt_status: str = Form("Unknown")
-):
-    print("Loading AI models...")
-    try:
-        clf_model = tf.keras.models.load_model(CLASSIFICATION_MODEL_PATH)
-        seg_model = tf.keras.models.load_model(SEGMENTATION_MODEL_PATH, custom_objects=CUSTOM_OBJECTS)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Model loading failed: {e}")
-
-    filename = file.filename
-    file_bytes = await file.read()
+async def _store_upload(filename: str, file_bytes: bytes):
+    """
+    Writes the upload under a unique name. DICOM files are validated with a header-only parse
+    and stored unchanged; their pixels are decoded straight into the model tensors later.
+    """
     dicom_meta = None
-    
+    extension = ".png"
     if filename.lower().endswith(".dcm"):
-        png_bytes, metadata = process_dicom(file_bytes)
-        if png_bytes is None: raise HTTPException(400, "Invalid DICOM")
-        file_bytes = png_bytes
-        filename = filename.replace(".dcm", ".png")
-        dicom_meta = metadata
+        try:
+            header = await analysis_executor.run(dicom_io.read_header, file_bytes)
+        except Exception as e:
+            print(f"DICOM processing error: {e}")
+            raise HTTPException(400, "Invalid DICOM")
+        dicom_meta = dicom_io.header_metadata(header)
+        extension = ".dcm"
     
     base_filename, _ = os.path.splitext(filename)
-    unique_filename = f"{base_filename}_{ObjectId()}.png"
+    unique_filename = f"{base_filename}_{ObjectId()}{extension}"
     original_image_path = UPLOADS_DIR / unique_filename 
 
     try:
@@ -148,18 +119,65 @@ async def upload_and_analyze(
             await out_file.write(file_bytes)
     except Exception as e:
         raise HTTPException(500, f"Failed to save file: {e}")
+    return unique_filename, original_image_path, dicom_meta
+
+async def _analyze_and_store_study(
+    patient_id: str,
+    unique_filename: str,
+    original_image_path: Path,
+    idh_status: str,
+    mgmt_status: str,
+    dicom_meta,
+    job_id: Optional[str] = None
+):
+    """Runs the pipeline on a stored upload, inserts the Study and returns the API payload."""
+    backend = ai_models.get_backend()
+    if backend is None:
+        raise HTTPException(status_code=500, detail="AI Models not loaded.")
+    clf_batcher, seg_batcher = ai_models.get_batchers()
 
     try:
+        image = None
+        decode_ms = None
+        if unique_filename.lower().endswith(".dcm"):
+            decode_start = time.perf_counter()
+            image = await analysis_executor.run(dicom_io.load_dicom_image, str(original_image_path))
+            decode_ms = round((time.perf_counter() - decode_start) * 1000, 2)
         analysis_results = await run_simple_analysis(
             image_path=str(original_image_path),
-            original_filename=unique_filename,
-            clf_model=clf_model,
-            seg_model=seg_model
+            original_filename=os.path.splitext(unique_filename)[0] + ".png",
+            backend=backend,
+            clf_batcher=clf_batcher,
+            seg_batcher=seg_batcher,
+            executor=analysis_executor.pool,
+            cache=result_cache,
+            image=image
         )
+        if decode_ms is not None:
+            analysis_results["timings_ms"] = {"dicom_decode": decode_ms, **analysis_results["timings_ms"]}
+    except AnalysisOverloaded:
+        raise
     except Exception as e:
         if os.path.exists(original_image_path): os.remove(original_image_path)
         raise HTTPException(500, f"AI Analysis failed: {e}")
 
+    return await _save_study(
+        patient_id, _study_image_url(unique_filename), analysis_results, idh_status, mgmt_status, dicom_meta, job_id
+    )
+
+async def _save_study(
+    patient_id: str,
+    mri_image_path: str,
+    analysis_results,
+    idh_status: str,
+    mgmt_status: str,
+    dicom_meta,
+    job_id: Optional[str] = None
+):
+    """
+    Adds the genetics-aware explanation and treatment plan, inserts the Study and returns the API payload.
+    With a job_id the insert is an upsert on it, so a job re-run after a lost lease reuses its Study.
+    """
     from .app_simple.reasoner_simple import simple_reasoner
     
     genetic_data = {"idh_status": idh_status, "mgmt_status": mgmt_status}
@@ -173,23 +191,286 @@ async def upload_and_analyze(
 
     study_doc = Study(
         patient_id=patient_id,
-        mri_image_path=f"/uploads/{unique_filename}",
+        mri_image_path=mri_image_path,
         seg_mask_path=analysis_results["image_paths"]["seg_mask"],
         grad_cam_path=analysis_results["image_paths"]["grad_cam"],
+        volume_mask_path=analysis_results["image_paths"].get("volume_mask"),
         ai_facts=analysis_results["ai_facts"],
         final_explanation=full_explanation,  
         doctor_notes=doctor_notes,
-        treatment=treatment_plan
+        treatment=treatment_plan,
+        job_id=job_id
     )
 
-    await db.studies.insert_one(study_doc.model_dump(by_alias=True, exclude={"id"}))
+    timings = dict(analysis_results["timings_ms"])
+    insert_start = time.perf_counter()
+    study_fields = study_doc.model_dump(by_alias=True, exclude={"id"})
+    if job_id is None:
+        study_id = (await db.studies.insert_one(study_fields)).inserted_id
+    else:
+        saved = await db.studies.find_one_and_update(
+            {"job_id": job_id},
+            {"$setOnInsert": study_fields},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        study_id = saved["_id"]
+    timings["db_insert"] = round((time.perf_counter() - insert_start) * 1000, 2)
     
     return {
+        "study_id": str(study_id),
         "image_paths": study_doc.mri_image_path,
         "prediction": analysis_results["prediction"],
-        "explanation": full_explanation
+        "explanation": full_explanation,
+        "timings_ms": timings
+    }
+
+async def process_analysis_job(job):
+    """Job-queue handler for uploads accepted with background=true."""
+    payload = job["payload"]
+    async with analysis_executor.slot():
+        return await _analyze_and_store_study(
+            patient_id=payload["patient_id"],
+            unique_filename=payload["unique_filename"],
+            original_image_path=UPLOADS_DIR / payload["unique_filename"],
+            idh_status=payload["idh_status"],
+            mgmt_status=payload["mgmt_status"],
+            dicom_meta=payload["dicom_meta"],
+            job_id=str(job["_id"])
+        )
+
+@router.post("/studies/upload", summary="Upload and analyze MRI (Supports PNG/JPG/DCM)")
+async def upload_and_analyze(
+    patient_id: str = Form(...),
+    file: UploadFile = File(...),
+    idh_status: str = Form("Unknown"),
+    mgmt_status: str = Form("Unknown"),
+    background: bool = Form(False)
+):
+    """
+    With background=false (default) the analysis runs inside the request.
+    With background=true the upload is stored, a job is queued and 202 + job id is returned;
+    poll GET /jobs/{job_id} for the result.
+    """
+    filename = file.filename
+    read_start = time.perf_counter()
+    file_bytes = await file.read()
+    read_ms = round((time.perf_counter() - read_start) * 1000, 2)
+
+    if background:
+        write_start = time.perf_counter()
+        unique_filename, _, dicom_meta = await _store_upload(filename, file_bytes)
+        upload_ms = round((time.perf_counter() - write_start) * 1000, 2)
+        metrics.observe_stages("upload", {"upload_read": read_ms, "upload_write": upload_ms})
+        job_id = await job_queue.enqueue(
+            "analysis",
+            {
+                "patient_id": patient_id,
+                "unique_filename": unique_filename,
+                "idh_status": idh_status,
+                "mgmt_status": mgmt_status,
+                "dicom_meta": dicom_meta,
+            },
+            timings_ms={"upload_write": upload_ms},
+        )
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"job_id": job_id, "status": job_queue.STATUS_QUEUED, "status_url": f"/jobs/{job_id}"},
+        )
+
+    backend = ai_models.get_backend()
+    if backend is None:
+        raise HTTPException(status_code=500, detail="AI Models not loaded.")
+
+    # Reserve an analysis slot up front so an overloaded server rejects before doing any work.
+    async with analysis_executor.slot():
+        write_start = time.perf_counter()
+        unique_filename, original_image_path, dicom_meta = await _store_upload(filename, file_bytes)
+        write_ms = round((time.perf_counter() - write_start) * 1000, 2)
+        try:
+            result = await _analyze_and_store_study(
+                patient_id, unique_filename, original_image_path, idh_status, mgmt_status, dicom_meta
+            )
+        except AnalysisOverloaded:
+            if os.path.exists(original_image_path): os.remove(original_image_path)
+            raise
+
+    metrics.observe_stages("upload", {"upload_read": read_ms, "upload_write": write_ms, **result.pop("timings_ms", {})})
+    return result
+
+@router.post("/studies/upload-volume", summary="Upload and analyze a 3D NIfTI volume (.nii / .nii.gz)")
+async def upload_and_analyze_volume(
+    patient_id: str = Form(...),
+    file: UploadFile = File(...),
+    idh_status: str = Form("Unknown"),
+    mgmt_status: str = Form("Unknown")
+):
+    """
+    Segments every axial slice of the volume in batches and reports the tumor volume in cm³
+    from the header voxel spacing. The 3D mask is stored as a uint8 .nii.gz (volume_mask_path);
+    the slice with the largest tumor cross-section becomes the study image.
+    """
+    filename = file.filename or "volume.nii.gz"
+    if not is_nifti(filename):
+        raise HTTPException(400, "Expected a .nii or .nii.gz volume")
+
+    backend = ai_models.get_backend()
+    if backend is None:
+        raise HTTPException(status_code=500, detail="AI Models not loaded.")
+
+    extension = ".nii.gz" if filename.lower().endswith(".nii.gz") else ".nii"
+    base_filename = os.path.basename(filename)[:-len(extension)]
+    unique_filename = f"{base_filename}_{ObjectId()}{extension}"
+    volume_path = VOLUMES_DIR / unique_filename
+
+    async with analysis_executor.slot():
+        try:
+            # Volumes are large; copy the upload to disk in chunks instead of reading it whole.
+            async with aiofiles.open(volume_path, 'wb') as out_file:
+                while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                    await out_file.write(chunk)
+        except Exception as e:
+            raise HTTPException(500, f"Failed to save file: {e}")
+
+        try:
+            analysis_results = await run_volume_analysis(
+                volume_path=str(volume_path),
+                original_filename=unique_filename,
+                backend=backend,
+                executor=analysis_executor.pool,
+                batch_size=VOLUME_BATCH_SIZE
+            )
+        except Exception as e:
+            if os.path.exists(volume_path): os.remove(volume_path)
+            raise HTTPException(500, f"Volume analysis failed: {e}")
+
+    result = await _save_study(
+        patient_id, analysis_results["image_paths"]["original"], analysis_results, idh_status, mgmt_status, None
+    )
+    metrics.observe_stages("volume", result.pop("timings_ms", {}))
+    result["volume_mask_path"] = analysis_results["image_paths"]["volume_mask"]
+    result["ai_facts"] = analysis_results["ai_facts"]
+    return result
+
+@router.post("/studies/upload-series", summary="Upload and analyze a DICOM series (.zip of instances or multi-frame .dcm)")
+async def upload_and_analyze_series(
+    patient_id: str = Form(...),
+    file: UploadFile = File(...),
+    idh_status: str = Form("Unknown"),
+    mgmt_status: str = Form("Unknown")
+):
+    """
+    Instances are sorted by position along the slice normal (or InstanceNumber) from their
+    headers, then decoded one frame at a time and classified + segmented SERIES_BATCH_SIZE
+    slices per model call, so memory is bounded by the batch, not the series.
+    Returns per-slice results and series-level aggregates.
+    """
+    filename = file.filename or "series.zip"
+    backend = ai_models.get_backend()
+    if backend is None:
+        raise HTTPException(status_code=500, detail="AI Models not loaded.")
+
+    base_filename, extension = os.path.splitext(os.path.basename(filename))
+    unique_filename = f"{base_filename}_{ObjectId()}{extension or '.zip'}"
+    series_path = SERIES_DIR / unique_filename
+
+    async with analysis_executor.slot():
+        try:
+            async with aiofiles.open(series_path, 'wb') as out_file:
+                while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                    await out_file.write(chunk)
+        except Exception as e:
+            raise HTTPException(500, f"Failed to save file: {e}")
+
+        try:
+            sources, series_meta = await analysis_executor.run(dicom_io.read_series_headers, str(series_path))
+        except Exception as e:
+            if os.path.exists(series_path): os.remove(series_path)
+            raise HTTPException(400, f"Invalid DICOM series: {e}")
+
+        try:
+            analysis_results = await run_series_analysis(
+                frames=dicom_io.iter_series_frames(sources),
+                series_meta=series_meta,
+                original_filename=unique_filename,
+                backend=backend,
+                executor=analysis_executor.pool,
+                batch_size=SERIES_BATCH_SIZE
+            )
+        except Exception as e:
+            if os.path.exists(series_path): os.remove(series_path)
+            raise HTTPException(500, f"Series analysis failed: {e}")
+
+    result = await _save_study(
+        patient_id, analysis_results["image_paths"]["original"], analysis_results, idh_status, mgmt_status, series_meta
+    )
+    metrics.observe_stages("series", result.pop("timings_ms", {}))
+    result["series"] = series_meta
+    result["ai_facts"] = analysis_results["ai_facts"]
+    result["slices"] = analysis_results["slices"]
+    return result
+
+@router.post("/studies/dicom/inspect", summary="Read DICOM metadata without decoding pixels")
+async def inspect_dicom(file: UploadFile = File(...)):
+    """
+    Header-only parse (stop_before_pixels) for listing and validating DICOM files before upload.
+    """
+    file_bytes = await file.read()
+    try:
+        header = await analysis_executor.run(dicom_io.read_header, file_bytes)
+    except Exception as e:
+        raise HTTPException(400, f"Invalid DICOM: {e}")
+    return {
+        **dicom_io.header_metadata(header),
+        "rows": int(header.Rows),
+        "columns": int(header.Columns),
+        "frames": int(header.get("NumberOfFrames", 1) or 1),
+        "photometric_interpretation": str(header.get("PhotometricInterpretation", "")),
+        "window_center": str(header.get("WindowCenter", "")) or None,
+        "window_width": str(header.get("WindowWidth", "")) or None,
     }
 
+@router.get("/studies/{study_id}/grad-cam", summary="Grad-CAM heatmaps for the top-k classes of a study")
+async def get_study_class_heatmaps(study_id: str, top_k: int = len(CLASSES)):
+    """
+    Per-class Grad-CAM overlays (e.g. glioma vs meningioma on borderline cases),
+    computed for all classes in one batched forward/Jacobian pass.
+    """
+    try:
+        obj_id = ObjectId(study_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid ID")
+
+    study = await db.studies.find_one({"_id": obj_id})
+    if not study: raise HTTPException(404, "Study not found")
+
+    filename = os.path.basename(study["mri_image_path"])
+    image_path = UPLOADS_DIR / filename
+    if not os.path.exists(image_path):
+        raise HTTPException(404, "Study image not found")
+
+    backend = ai_models.get_backend()
+    if backend is None:
+        raise HTTPException(status_code=500, detail="AI Models not loaded.")
+
+    async with analysis_executor.slot():
+        try:
+            image = str(image_path)
+            if filename.lower().endswith(".dcm"):
+                image = await analysis_executor.run(dicom_io.load_dicom_image, image)
+            overlay_name = os.path.splitext(filename)[0] + ".png"
+            heatmaps = await analysis_executor.run(explain_classes, backend, image, overlay_name, top_k)
+        except Exception as e:
+            raise HTTPException(500, f"Grad-CAM failed: {e}")
+
+    return {"study_id": study_id, "heatmaps": heatmaps}
+
+def _save_edited_mask(contents: bytes, save_path: str):
+    nparr = np.frombuffer(contents, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    cv2.imwrite(save_path, img)
+    return extract_facts_from_mask(img)
+
 @router.post("/studies/{study_id}/update-mask")
 async def update_study_mask(study_id: str, file: UploadFile = File(...)):
     try:
@@ -200,19 +481,19 @@ async def update_study_mask(study_id: str, file: UploadFile = File(...)):
     study = await db.studies.find_one({"_id": obj_id})
     if not study: raise HTTPException(404, "Study not found")
 
-    db_path = study["seg_mask_path"]
-    filename = os.path.basename(db_path)
+    # The edited mask gets its own file, so the AI overlay it replaces stays intact (and valid
+    # for the analysis cache entry that may point at it).
+    filename = f"segmask_edited_{study_id}.png"
     save_path = UPLOADS_DIR / "xai_outputs" / filename
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
     contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-    cv2.imwrite(str(save_path), img)
-
-    new_facts = extract_facts_from_mask(img)
+    new_facts = await analysis_executor.run(_save_edited_mask, contents, str(save_path))
     updated_facts = study["ai_facts"]
     updated_facts.update(new_facts)
 
-    await db.studies.update_one({"_id": obj_id}, {"$set": {"ai_facts": updated_facts}})
+    await db.studies.update_one(
+        {"_id": obj_id},
+        {"$set": {"ai_facts": updated_facts, "seg_mask_path": f"/uploads/xai_outputs/{filename}"}}
+    )
     return {"message": "Mask updated", "new_facts": updated_facts}
\ No newline at end of file
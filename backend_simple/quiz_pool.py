@@ -0,0 +1,103 @@
+"""
+Pool of pre-analyzed quiz cases.
+
+A background task keeps `per_class` fully analyzed cases (prediction, Grad-CAM, mask,
+explanation) ready for each tumor class, so serving a case is an O(1) pop. Refill runs one
+case at a time and backs off while the analysis pool is busy, so students filling the
+pool never crowd out interactive uploads.
+
+`refresh` (optional, blocking) is run on a worker thread before each build, e.g. to pick up
+images added to the dataset without stat-ing folders on the event loop.
+"""
+
+import asyncio
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from .analysis_executor import AnalysisOverloaded
+
+QuizCaseBuilder = Callable[[str], Awaitable[Dict[str, Any]]]
+
+REFILL_BACKOFF_SECONDS = 2.0
+
+
+class QuizCasePool:
+    def __init__(self, builder: QuizCaseBuilder, per_class: int, refresh: Optional[Callable[[], None]] = None):
+        self.builder = builder
+        self.refresh = refresh
+        self.per_class = max(0, per_class)
+        self._cases: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.served_from_pool = 0
+        self.served_on_demand = 0
+        self.built = 0
+        self.build_failures = 0
+
+    def start(self, classes: List[str]):
+        if self.per_class == 0 or not classes:
+            return
+        for cls in classes:
+            self._cases.setdefault(cls, deque())
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refill_loop())
+        print(f"Quiz case pool started: {self.per_class} per class for {classes}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """Takes a ready case from a random class that has one; None if the pool is empty."""
+        stocked = [cls for cls, cases in self._cases.items() if cases]
+        if not stocked:
+            return None
+        case = self._cases[random.choice(stocked)].popleft()
+        self.served_from_pool += 1
+        self._wake.set()
+        return case
+
+    def _next_class_to_fill(self) -> Optional[str]:
+        lowest = min(self._cases.items(), key=lambda item: len(item[1]), default=None)
+        if lowest is None or len(lowest[1]) >= self.per_class:
+            return None
+        return lowest[0]
+
+    async def _refill_loop(self):
+        while True:
+            cls = self._next_class_to_fill()
+            if cls is None:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            try:
+                if self.refresh is not None:
+                    await asyncio.to_thread(self.refresh)
+                case = await self.builder(cls)
+            except asyncio.CancelledError:
+                raise
+            except AnalysisOverloaded:
+                await asyncio.sleep(REFILL_BACKOFF_SECONDS)
+                continue
+            except Exception as e:
+                self.build_failures += 1
+                print(f"⚠️ Quiz pool failed to build a {cls} case: {e}")
+                await asyncio.sleep(REFILL_BACKOFF_SECONDS)
+                continue
+            self._cases[cls].append(case)
+            self.built += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "target_per_class": self.per_class,
+            "levels": {cls: len(cases) for cls, cases in self._cases.items()},
+            "refilling": self._task is not None and not self._task.done(),
+            "served_from_pool": self.served_from_pool,
+            "served_on_demand": self.served_on_demand,
+            "built": self.built,
+            "build_failures": self.build_failures,
+        }
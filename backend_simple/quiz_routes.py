@@ -1,76 +1,166 @@
 import os
 import random
-import shutil
-import cv2
+import time
+import asyncio
 import numpy as np
+from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 
-from . import ai_models 
+from . import ai_models, metrics
+from .analysis_executor import analysis_executor, AnalysisOverloaded
+from .analysis_cache import result_cache
 from .app_simple.ai_pipeline_simple import run_simple_analysis
+from .quiz_pool import QuizCasePool
+from .dataset_index import DatasetIndex
+from .app_simple.scoring_simple import MaskCache, decode_drawing, feedback_for, score_pairs
 
 router = APIRouter()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATASET_DIR = os.path.join(BASE_DIR, "MRI Images", "Testing") 
 UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
+QUIZ_POOL_PER_CLASS = int(os.getenv("QUIZ_POOL_PER_CLASS", "3"))
+DATASET_REFRESH_SECONDS = float(os.getenv("DATASET_REFRESH_SECONDS", "5"))
+QUIZ_MASK_CACHE_ENTRIES = int(os.getenv("QUIZ_MASK_CACHE_ENTRIES", "256"))
 
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-@router.get("/quiz/next-case")
-async def get_next_quiz_case():
+DATASET_URL_PREFIX = "/dataset"
+dataset_index = DatasetIndex(DATASET_DIR, DATASET_URL_PREFIX, refresh_interval=DATASET_REFRESH_SECONDS)
+
+def _available_classes():
+    return [c for c in dataset_index.classes() if not c.lower().startswith("no")]
+
+async def build_quiz_case(selected_class: str):
     """
-    Generates a random case from the 8k dataset.
+    Picks a random image of `selected_class` and runs the full neurosymbolic pipeline on it.
+    Used both by the background case pool and as the on-demand fallback.
     """
-    print(f"🔍 DEBUG: Looking for dataset in: {DATASET_DIR}")
-
-    if not os.path.exists(DATASET_DIR):
-        raise HTTPException(500, f"Dataset folder missing: {DATASET_DIR}")
-    ai_models.load_models()
+    backend = ai_models.get_backend()
     
-    if ai_models.classification_model is None:
+    if backend is None:
         raise HTTPException(500, "AI Models not loaded.")
-    available_classes = [
-        d for d in os.listdir(DATASET_DIR) 
-        if os.path.isdir(os.path.join(DATASET_DIR, d)) 
-        and not d.lower().startswith("no") 
-    ]
-
-    if not available_classes:
-        raise HTTPException(500, f"No class folders found in {DATASET_DIR}")
-    selected_class = random.choice(available_classes)
-    class_path = os.path.join(DATASET_DIR, selected_class)
-    images = [f for f in os.listdir(class_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    
-    if not images:
+    clf_batcher, seg_batcher = ai_models.get_batchers()
+
+    image = dataset_index.sample(label=selected_class)
+    if image is None:
         raise HTTPException(500, f"No images in {selected_class}")
-    
-    random_image_name = random.choice(images)
-    original_full_path = os.path.join(class_path, random_image_name)
-    new_filename = f"quiz_{random.randint(1000,9999)}_{random_image_name}"
-    destination_path = os.path.join(UPLOADS_DIR, new_filename)
-    shutil.copy(original_full_path, destination_path)
+
+    # The dataset image is analyzed in place (served read-only under /dataset); overlay
+    # names are derived from it, so repeated picks reuse the same files instead of piling up.
+    xai_filename = f"quiz_{image.label}_{image.filename}"
 
     try:
-        analysis_result = await run_simple_analysis(
-            image_path=destination_path,
-            original_filename=new_filename,
-            clf_model=ai_models.classification_model,
-            seg_model=ai_models.segmentation_model
-        )
+        async with analysis_executor.slot():
+            analysis_result = await run_simple_analysis(
+                image_path=image.path,
+                original_filename=xai_filename,
+                backend=backend,
+                clf_batcher=clf_batcher,
+                seg_batcher=seg_batcher,
+                executor=analysis_executor.pool,
+                cache=result_cache
+            )
+    except AnalysisOverloaded:
+        raise
     except Exception as e:
         print(f"🔥 PIPELINE ERROR: {e}")
         raise HTTPException(500, f"AI Analysis failed: {str(e)}")
+    metrics.observe_stages("quiz_case", analysis_result["timings_ms"])
 
     return {
-        "id": random.randint(100, 999),
         "type": selected_class.capitalize(),
         "ai_prediction": analysis_result["prediction"]["predicted_class"],
         "confidence": analysis_result["prediction"]["confidence"],
         "explanation": analysis_result["explanation"],
-        "imageUri": f"/uploads/{new_filename}",
+        "imageUri": dataset_index.url_for(image),
         "gradCamUri": analysis_result["image_paths"]["grad_cam"],
         "maskUri": analysis_result["image_paths"]["seg_mask"]
     }
 
+mask_cache = MaskCache(max_entries=QUIZ_MASK_CACHE_ENTRIES)
+
+case_pool = QuizCasePool(build_quiz_case, per_class=QUIZ_POOL_PER_CLASS, refresh=dataset_index.refresh)
+
+async def start_quiz_services():
+    """Builds the dataset index and starts quiz case precomputation (called from the app lifespan)."""
+    if not os.path.exists(DATASET_DIR):
+        print(f"⚠️ Quiz dataset missing, case pool disabled: {DATASET_DIR}")
+        return
+    await asyncio.to_thread(dataset_index.refresh, True)
+    print(f"Quiz dataset indexed: {dataset_index.stats()['classes']}")
+    case_pool.start(_available_classes())
+
+@router.get("/quiz/next-case")
+async def get_next_quiz_case():
+    """
+    Serves a precomputed case from the pool; falls back to analyzing one on demand when empty.
+    """
+    case = case_pool.pop()
+    if case is None:
+        print(f"🔍 DEBUG: Quiz pool empty, building case from: {DATASET_DIR}")
+
+        if not os.path.exists(DATASET_DIR):
+            raise HTTPException(500, f"Dataset folder missing: {DATASET_DIR}")
+        # The index rescan stats the dataset folders; keep it off the event loop.
+        await asyncio.to_thread(dataset_index.refresh)
+        available_classes = _available_classes()
+
+        if not available_classes:
+            raise HTTPException(500, f"No class folders found in {DATASET_DIR}")
+        case = await build_quiz_case(random.choice(available_classes))
+        case_pool.served_on_demand += 1
+
+    return {"id": random.randint(100, 999), **case}
+
+def _resolve_mask_path(mask_url: str) -> Optional[str]:
+    filename = os.path.basename(mask_url)
+    for candidate in (os.path.join(UPLOADS_DIR, "xai_outputs", filename), os.path.join(UPLOADS_DIR, filename)):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def _load_ai_mask(mask_url: str) -> np.ndarray:
+    ai_mask_path = _resolve_mask_path(mask_url)
+    if ai_mask_path is None:
+        print(f"❌ Mask not found for: {mask_url}")
+        raise HTTPException(404, "Original AI mask not found for scoring")
+    ai_mask = mask_cache.get(ai_mask_path)
+    if ai_mask is None:
+        raise HTTPException(500, "Failed to read AI mask image")
+    return ai_mask
+
+def _score_result(scores: Dict[str, float]) -> Dict[str, Any]:
+    accuracy = round(scores["iou"] * 100, 1)
+    return {**scores, "accuracy": accuracy, "feedback": feedback_for(accuracy)}
+
+def _score_submissions(mask_urls: List[str], contents: List[bytes]) -> List[Dict[str, Any]]:
+    """Decodes every drawing against its AI mask and scores all of them in one batched pass."""
+    start = time.perf_counter()
+    pairs, results = [], []
+    for mask_url, content in zip(mask_urls, contents):
+        try:
+            ai_mask = _load_ai_mask(mask_url)
+        except HTTPException as e:
+            results.append({"mask_url": mask_url, "error": e.detail, "status_code": e.status_code})
+            continue
+        student_mask = decode_drawing(content, ai_mask.shape)
+        if student_mask is None:
+            results.append({"mask_url": mask_url, "error": "Failed to read student drawing", "status_code": 500})
+            continue
+        results.append({"mask_url": mask_url, "pair": len(pairs)})
+        pairs.append((ai_mask, student_mask))
+
+    decoded = time.perf_counter()
+    scores = score_pairs(pairs)
+    for result in results:
+        if "pair" in result:
+            result.update(_score_result(scores[result.pop("pair")]))
+    metrics.observe_stages("quiz_score", {
+        "decode": round((decoded - start) * 1000, 2),
+        "score": round((time.perf_counter() - decoded) * 1000, 2),
+    })
+    return results
+
 @router.post("/quiz/score")
 async def score_drawing(
     mask_url: str = Form(...), 
@@ -78,62 +168,59 @@ async def score_drawing(
 ):
     """
     Compares Student Drawing vs AI Mask using IoU (Intersection over Union).
+    Dice and boundary F-score are returned alongside.
     """
     try:
-        filename = os.path.basename(mask_url)
-        ai_mask_path = os.path.join(UPLOADS_DIR, "xai_outputs", filename)
-        
-        if not os.path.exists(ai_mask_path):
-            ai_mask_path = os.path.join(UPLOADS_DIR, filename)
-            
-        if not os.path.exists(ai_mask_path):
-            print(f"❌ Mask not found at: {ai_mask_path}")
-            raise HTTPException(404, "Original AI mask not found for scoring")
-
-        ai_mask = cv2.imread(ai_mask_path, cv2.IMREAD_GRAYSCALE)
-        
         content = await drawing.read()
-        nparr = np.frombuffer(content, np.uint8)
-        student_mask = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-
-        if ai_mask is None:
-            raise HTTPException(500, "Failed to read AI mask image")
-        if student_mask is None:
-            raise HTTPException(500, "Failed to read student drawing")
-
-        if student_mask.shape != ai_mask.shape:
-            student_mask = cv2.resize(student_mask, (ai_mask.shape[1], ai_mask.shape[0]))
-
-        _, ai_bin = cv2.threshold(ai_mask, 10, 1, cv2.THRESH_BINARY)
-        _, stu_bin = cv2.threshold(student_mask, 10, 1, cv2.THRESH_BINARY)
-
-        intersection = np.logical_and(ai_bin, stu_bin)
-        union = np.logical_or(ai_bin, stu_bin)
-        
-        intersection_area = np.sum(intersection)
-        union_area = np.sum(union)
-        
-        iou_score = 0.0
-        if union_area > 0:
-            iou_score = intersection_area / union_area
-        
-        accuracy = round(iou_score * 100, 1)
-        
-        if accuracy > 60:
-            feedback = "Excellent! Your diagnosis aligns closely with the AI."
-        elif accuracy > 30:
-            feedback = "Good effort. You found the general area, but check the boundaries."
-        elif accuracy > 5:
-             feedback = "You found the lesion, but the coverage is partial."
-        else:
-            feedback = "Missed the location. Compare with the AI result."
+        result = (await asyncio.to_thread(_score_submissions, [mask_url], [content]))[0]
+        if "error" in result:
+            raise HTTPException(result["status_code"], result["error"])
 
         return {
-            "iou": iou_score,
-            "accuracy": accuracy,
-            "feedback": feedback
+            "iou": result["iou"],
+            "dice": result["dice"],
+            "boundary_f1": result["boundary_f1"],
+            "accuracy": result["accuracy"],
+            "feedback": result["feedback"]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Scoring Error: {e}")
-        raise HTTPException(500, f"Scoring failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(500, f"Scoring failed: {str(e)}")
+
+@router.post("/quiz/score-batch")
+async def score_drawings_batch(
+    mask_urls: List[str] = Form(...),
+    drawings: List[UploadFile] = File(...)
+):
+    """
+    Grades many drawings in one request (e.g. end-of-class runs).
+    Pass one mask_url to grade every drawing against the same case, or one per drawing.
+    Drawings that cannot be scored (unreadable drawing, missing mask) get an `error` entry
+    instead of failing the whole batch.
+    """
+    if len(mask_urls) == 1:
+        mask_urls = mask_urls * len(drawings)
+    if len(mask_urls) != len(drawings):
+        raise HTTPException(400, "Provide one mask_url, or exactly one per drawing.")
+
+    contents = [await drawing.read() for drawing in drawings]
+    try:
+        results = await asyncio.to_thread(_score_submissions, mask_urls, contents)
+    except Exception as e:
+        print(f"Batch Scoring Error: {e}")
+        raise HTTPException(500, f"Scoring failed: {str(e)}")
+
+    for drawing, result in zip(drawings, results):
+        result["filename"] = drawing.filename
+    scored = [r for r in results if "error" not in r]
+    summary = {
+        "count": len(results),
+        "scored": len(scored),
+        "mean_iou": round(float(np.mean([r["iou"] for r in scored])), 4) if scored else 0.0,
+        "mean_dice": round(float(np.mean([r["dice"] for r in scored])), 4) if scored else 0.0,
+        "mean_boundary_f1": round(float(np.mean([r["boundary_f1"] for r in scored])), 4) if scored else 0.0,
+    }
+    return {"results": results, "summary": summary}
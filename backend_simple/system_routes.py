@@ -0,0 +1,77 @@
+"""
+Handles operational endpoints under /system (model registry status, runtime stats).
+"""
+
+from fastapi import APIRouter
+
+from . import ai_models
+from .analysis_executor import analysis_executor
+from . import job_queue
+from .analysis_cache import result_cache
+from . import quiz_routes
+
+router = APIRouter()
+
+@router.get("/models")
+async def get_model_status():
+    """
+    Reports which models are loaded and what they cost at startup (load time, weight memory),
+    plus warmup time and the per-call cost of model.predict() vs. the compiled inference path.
+    """
+    return {
+        "classification_loaded": ai_models.classification_model is not None,
+        "segmentation_loaded": ai_models.segmentation_model is not None,
+        "backend": ai_models.backend.describe() if ai_models.backend is not None else None,
+        "model_version": ai_models.model_version,
+        "models": ai_models.model_stats,
+        "inference": ai_models.inference_stats,
+    }
+
+@router.get("/batching")
+async def get_batching_status():
+    """
+    Micro-batching configuration and live counters for the classifier and U-Net schedulers.
+    """
+    return ai_models.batcher_stats()
+
+@router.get("/executor")
+async def get_executor_status():
+    """
+    Analysis worker pool size, in-flight analyses and how many requests were turned away.
+    """
+    return analysis_executor.stats()
+
+@router.get("/jobs")
+async def get_job_queue_status():
+    """
+    Number of background analysis jobs waiting to be claimed.
+    """
+    return {"queued": await job_queue.queue_depth(), "workers_per_process": job_queue.JOB_WORKERS}
+
+@router.get("/cache")
+async def get_cache_status():
+    """
+    Analysis result cache size and hit/miss counters (memory LRU and Mongo tiers).
+    """
+    return result_cache.stats()
+
+@router.get("/quiz-pool")
+async def get_quiz_pool_status():
+    """
+    Ready quiz cases per tumor class and how many requests were served from the pool.
+    """
+    return quiz_routes.case_pool.stats()
+
+@router.get("/dataset")
+async def get_dataset_index_status():
+    """
+    Images per class in the indexed quiz dataset and how often class folders were rescanned.
+    """
+    return quiz_routes.dataset_index.stats()
+
+@router.get("/quiz-masks")
+async def get_quiz_mask_cache_status():
+    """
+    Decoded AI masks held for quiz scoring, their packed size and hit/miss counts.
+    """
+    return quiz_routes.mask_cache.stats()
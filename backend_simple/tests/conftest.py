@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def random_backend():
+    """The tiny seeded stand-in models from inference_backends (needs TensorFlow, no model files)."""
+    pytest.importorskip("tensorflow")
+    from backend_simple.inference_backends import RandomBackend
+
+    return RandomBackend(seed=0)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("motor")
+
+from backend_simple import analysis_cache
+from backend_simple.analysis_cache import AnalysisResultCache
+from backend_simple.app_simple import ai_pipeline_simple
+from backend_simple.app_simple.ai_pipeline_simple import CLASSES, run_simple_analysis
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    """Overlays under <tmp>/uploads/xai_outputs, resolved there by the cache's artifact check too."""
+    xai_dir = tmp_path / "uploads" / "xai_outputs"
+    xai_dir.mkdir(parents=True)
+    monkeypatch.setattr(ai_pipeline_simple, "XAI_OUTPUT_DIR", str(xai_dir))
+    monkeypatch.setattr(analysis_cache, "BASE_DIR", str(tmp_path))
+    return xai_dir
+
+
+def _entry(tag, overlay="null"):
+    return {"prediction": {"predicted_class": tag}, "ai_facts": {}, "image_paths": {"grad_cam": overlay, "seg_mask": "null"}}
+
+
+def test_lru_evicts_least_recently_used_entries_by_size():
+    size = len(json.dumps(_entry("a")))
+    cache = AnalysisResultCache(max_bytes=2 * size)
+
+    async def scenario():
+        await cache.put("a", _entry("a"))
+        await cache.put("b", _entry("b"))
+        assert await cache.get("a") is not None  # "a" is now the most recently used
+        await cache.put("c", _entry("c"))
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    a, b, c = asyncio.run(scenario())
+
+    assert a["prediction"] == {"predicted_class": "a"}
+    assert b is None
+    assert c["prediction"] == {"predicted_class": "c"}
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["memory_bytes"] <= 2 * size
+
+
+def test_entry_with_missing_overlay_is_a_stale_miss(uploads):
+    (uploads / "gradcam_x.png").write_bytes(b"png")
+    cache = AnalysisResultCache(max_bytes=1 << 20)
+
+    async def scenario():
+        await cache.put("key", _entry("glioma", "/uploads/xai_outputs/gradcam_x.png"))
+        hit = await cache.get("key")
+        (uploads / "gradcam_x.png").unlink()
+        return hit, await cache.get("key")
+
+    hit, miss = asyncio.run(scenario())
+
+    assert hit is not None and miss is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["stale"], stats["misses"], stats["entries"]) == (1, 1, 1, 0)
+
+
+def test_hits_are_copies():
+    cache = AnalysisResultCache(max_bytes=1 << 20)
+
+    async def scenario():
+        await cache.put("key", _entry("glioma"))
+        (await cache.get("key"))["ai_facts"]["edited"] = True
+        return await cache.get("key")
+
+    assert "edited" not in asyncio.run(scenario())["ai_facts"]
+
+
+def _glioma_backend():
+    pytest.importorskip("tensorflow")
+    from backend_simple.inference_backends import RandomBackend
+
+    backend = RandomBackend(seed=0)
+    bias = np.zeros(len(CLASSES), dtype=np.float32)
+    bias[CLASSES.index("glioma")] = 8.0
+    backend.classifier.layers[-1].bias.assign(bias)
+    return backend
+
+
+def test_studies_from_identical_pixels_get_independent_artifacts(uploads):
+    backend = _glioma_backend()
+    cache = AnalysisResultCache(max_bytes=1 << 20)
+    scan = np.random.default_rng(0).integers(0, 256, size=(160, 160, 3), dtype=np.uint8)
+
+    async def analyze_twice():
+        first = await run_simple_analysis("a.png", "patient_a.png", backend, cache=cache, image=scan)
+        second = await run_simple_analysis("b.png", "patient_b.png", backend, cache=cache, image=scan.copy())
+        return first, second
+
+    first, second = asyncio.run(analyze_twice())
+
+    assert not first["cache_hit"] and second["cache_hit"]
+    assert second["prediction"] == first["prediction"]
+    for key in ("grad_cam", "seg_mask"):
+        first_file = uploads / first["image_paths"][key].rsplit("/", 1)[-1]
+        second_file = uploads / second["image_paths"][key].rsplit("/", 1)[-1]
+        assert first_file != second_file
+        assert "patient_b" in second_file.name
+        assert second_file.read_bytes() == first_file.read_bytes()
+
+        # Editing or deleting one study's overlay leaves the other study's untouched.
+        original = second_file.read_bytes()
+        first_file.write_bytes(b"edited")
+        assert second_file.read_bytes() == original
+        first_file.unlink()
+        assert second_file.exists()
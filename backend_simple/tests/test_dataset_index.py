@@ -0,0 +1,22 @@
+from backend_simple.dataset_index import DatasetIndex
+
+
+def test_sample_reads_the_index_and_refresh_picks_up_new_images(tmp_path):
+    (tmp_path / "glioma").mkdir()
+    (tmp_path / "glioma" / "a.png").write_bytes(b"png")
+    index = DatasetIndex(str(tmp_path), "/dataset", refresh_interval=0)
+    index.refresh(force=True)
+
+    (tmp_path / "pituitary").mkdir()
+    (tmp_path / "pituitary" / "b.jpg").write_bytes(b"jpg")
+
+    # sample() never touches the filesystem: the new class appears only after a refresh.
+    assert index.sample(label="pituitary") is None
+    assert index.sample(label="glioma").filename == "a.png"
+
+    index.refresh()
+
+    image = index.sample(label="pituitary")
+    assert image.filename == "b.jpg"
+    assert index.url_for(image) == "/dataset/pituitary/b.jpg"
+    assert index.classes() == ["glioma", "pituitary"]
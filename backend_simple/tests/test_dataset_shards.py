@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("tqdm")
+
+import dataset_shards
+from dataset_shards import ShardedDataset
+
+
+def _slices(count, seed, size=8):
+    rng = np.random.default_rng(seed)
+    images = rng.integers(0, 256, size=(count, size, size), dtype=np.uint8)
+    masks = (rng.random((count, size, size)) > 0.5).astype(np.uint8) * 255
+    return images, masks
+
+
+def test_shards_round_trip_through_the_index(tmp_path):
+    root = str(tmp_path)
+    b_images, b_masks = _slices(2, seed=1)
+    a_images, a_masks = _slices(3, seed=0)
+    entries = [
+        dataset_shards.write_shard(root, "P2", b_images, b_masks, [40, 41]),
+        dataset_shards.write_shard(root, "P1", a_images, a_masks, [10, 12, 15]),
+        dataset_shards.write_shard(root, "P3", *_slices(0, seed=2), []),
+    ]
+    dataset_shards.write_index(root, 8, entries)
+
+    dataset = ShardedDataset(root)
+
+    assert dataset_shards.is_sharded(root)
+    assert len(dataset) == 5
+    assert dataset.keys() == ["P1_10", "P1_12", "P1_15", "P2_40", "P2_41"]  # sorted, empty shards dropped
+    assert list(dataset.patient_ids()) == ["P1"] * 3 + ["P2"] * 2
+    assert dataset.locate(3) == (1, 0)
+    expected_images, expected_masks = np.concatenate([a_images, b_images]), np.concatenate([a_masks, b_masks])
+    for i in range(len(dataset)):
+        image, mask = dataset.get(i)
+        assert image.dtype == np.uint8 and isinstance(image.base, np.memmap)
+        np.testing.assert_array_equal(image, expected_images[i])
+        np.testing.assert_array_equal(mask, expected_masks[i])
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path / dataset_shards.SHARDS_DIR))
+
+
+def test_write_shard_rejects_mismatched_arrays(tmp_path):
+    images, masks = _slices(2, seed=0)
+    with pytest.raises(ValueError):
+        dataset_shards.write_shard(str(tmp_path), "P1", images, masks[:1], [0, 1])
+    with pytest.raises(ValueError):
+        dataset_shards.write_shard(str(tmp_path), "P1", images.astype(np.float32), masks, [0, 1])
+
+
+def test_png_folder_converts_to_the_same_slices(tmp_path):
+    data_2d = tmp_path / "data_2d"
+    (data_2d / "images").mkdir(parents=True)
+    (data_2d / "masks").mkdir()
+    images, masks = _slices(3, seed=3)
+    for z, image, mask in zip((7, 2, 5), images, masks):
+        cv2.imwrite(str(data_2d / "images" / f"BraTS2021_00001_{z}.png"), image)
+        cv2.imwrite(str(data_2d / "masks" / f"BraTS2021_00001_{z}.png"), mask)
+    cv2.imwrite(str(data_2d / "images" / "BraTS2021_00001_9.png"), images[0])  # no mask: skipped
+
+    dataset_shards.convert_png_folder(str(data_2d), str(tmp_path / "shards_out"), image_size=8)
+    dataset = ShardedDataset(str(tmp_path / "shards_out"))
+
+    assert dataset.keys() == ["BraTS2021_00001_2", "BraTS2021_00001_5", "BraTS2021_00001_7"]
+    for i, row in enumerate((1, 2, 0)):
+        image, mask = dataset.get(i)
+        np.testing.assert_array_equal(image, images[row])
+        np.testing.assert_array_equal(mask, masks[row])
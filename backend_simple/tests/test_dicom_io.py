@@ -0,0 +1,114 @@
+import io
+import zipfile
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pydicom = pytest.importorskip("pydicom")
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+from backend_simple import dicom_io
+
+
+def _instance(pixels, **header):
+    """An MR instance with uint16 MONOCHROME2 pixels, serialized to bytes."""
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = MRImageStorage
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.SOPClassUID = MRImageStorage
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = "MR"
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    for keyword, value in header.items():
+        setattr(ds, keyword, value)
+    ds.PixelData = pixels.astype(np.uint16).tobytes()
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def _series_zip(tmp_path, instances):
+    path = tmp_path / "series.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in instances.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_series_is_ordered_along_the_slice_normal_not_by_name_or_instance_number(tmp_path):
+    # Sagittal slices: the normal is +x, so ImagePositionPatient[0] sets the order and z is constant.
+    orientation = [0, 1, 0, 0, 0, 1]
+    instances = {
+        f"slice_{name}.dcm": _instance(
+            np.full((4, 4), value), InstanceNumber=number,
+            ImagePositionPatient=[x, -50.0, 20.0], ImageOrientationPatient=orientation,
+        )
+        for name, value, number, x in [("a", 30, 1, 5.0), ("b", 10, 2, -5.0), ("c", 20, 3, 0.0)]
+    }
+    path = _series_zip(tmp_path, {**instances, "README.txt": b"not dicom"})
+
+    sources, meta = dicom_io.read_series_headers(path)
+    frames = list(dicom_io.iter_series_frames(sources))
+
+    assert [s.instance_number for s in sources] == [2, 3, 1]
+    assert [s.position for s in sources] == [-5.0, 0.0, 5.0]
+    assert meta["instances"] == 3 and meta["frames"] == 3
+    assert meta["slice_spacing_mm"] == pytest.approx(5.0)
+    assert [f.index for f in frames] == [0, 1, 2]
+    assert [f.instance_number for f in frames] == [2, 3, 1]
+
+
+def test_series_without_positions_falls_back_to_instance_number(tmp_path):
+    instances = {f"{number}.dcm": _instance(np.zeros((4, 4)), InstanceNumber=number) for number in (3, 1, 2)}
+
+    sources, meta = dicom_io.read_series_headers(_series_zip(tmp_path, instances))
+
+    assert [s.instance_number for s in sources] == [1, 2, 3]
+    assert all(s.position is None for s in sources)
+    assert meta["slice_spacing_mm"] is None
+
+
+def test_header_window_and_rescale_map_stored_values_to_display():
+    # Stored 0..300 -> modality values -1000..-400 (slope 2, intercept -1000); window -700 +/- 100.
+    pixels = np.array([[0, 100, 150, 200, 300]])
+    ds = pydicom.dcmread(io.BytesIO(_instance(
+        pixels, RescaleSlope=2, RescaleIntercept=-1000, WindowCenter=-700, WindowWidth=201,
+    )))
+
+    display = dicom_io.to_display_uint8(ds, ds.pixel_array)
+
+    assert display.dtype == np.uint8
+    assert display[0, 0] == 0 and display[0, 1] == 0        # below the window
+    assert display[0, 2] == pytest.approx(128, abs=1)         # window center
+    assert display[0, 3] == 255 and display[0, 4] == 255    # above the window
+
+
+def test_without_a_window_the_full_range_is_used_and_monochrome1_is_inverted():
+    pixels = np.array([[100, 150, 200]])
+    ds = pydicom.dcmread(io.BytesIO(_instance(pixels)))
+    assert dicom_io.to_display_uint8(ds, ds.pixel_array).tolist() == [[0, 127, 255]]
+
+    ds.PhotometricInterpretation = "MONOCHROME1"
+    assert dicom_io.to_display_uint8(ds, ds.pixel_array).tolist() == [[255, 128, 0]]
+
+
+def test_load_dicom_image_returns_windowed_bgr():
+    pixels = np.arange(16).reshape(4, 4) * 100
+    data = _instance(pixels, WindowCenter=750, WindowWidth=1500)
+
+    image = dicom_io.load_dicom_image(data)
+
+    ds = pydicom.dcmread(io.BytesIO(data))
+    expected = dicom_io.to_display_uint8(ds, ds.pixel_array)
+    assert image.shape == (4, 4, 3) and image.dtype == np.uint8
+    assert all((image[..., channel] == expected).all() for channel in range(3))
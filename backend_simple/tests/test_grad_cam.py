@@ -0,0 +1,66 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("tensorflow")
+
+from backend_simple.app_simple.ai_pipeline_simple import CLASSES, NO_TUMOR_INDEX
+from backend_simple.app_simple.xai_simple import classify_with_grad_cam, generate_grad_cam
+from backend_simple.inference_backends import RandomBackend
+
+
+def _inputs(count, seed=0):
+    return np.random.default_rng(seed).random((count, 128, 128, 3), dtype=np.float32)
+
+
+def _backend_predicting(class_name):
+    backend = RandomBackend(seed=0)
+    bias = np.zeros(len(CLASSES), dtype=np.float32)
+    bias[CLASSES.index(class_name)] = 8.0
+    backend.classifier.layers[-1].bias.assign(bias)
+    return backend
+
+
+class _CountingFn:
+    def __init__(self, fn):
+        self.fn, self.calls, self.rows = fn, 0, 0
+
+    def __call__(self, conv_outputs, classes):
+        self.calls += 1
+        self.rows += int(conv_outputs.shape[0])
+        return self.fn(conv_outputs, classes)
+
+
+def test_no_tumor_rows_skip_the_gradient_pass():
+    backend = _backend_predicting("notumor")
+    graph = backend.grad_cam_graph
+    graph.explain_features_fn = counting = _CountingFn(graph.explain_features_fn)
+
+    predictions, heatmaps = classify_with_grad_cam(backend, _inputs(3), NO_TUMOR_INDEX)
+
+    assert (predictions.argmax(axis=1) == NO_TUMOR_INDEX).all()
+    assert counting.calls == 0
+    assert heatmaps.shape == (3,) + graph.heatmap_shape
+    assert not heatmaps.any()
+
+
+def test_tumor_rows_match_the_single_image_grad_cam():
+    backend = _backend_predicting("glioma")
+    graph = backend.grad_cam_graph
+    graph.explain_features_fn = counting = _CountingFn(graph.explain_features_fn)
+    images = _inputs(2)
+
+    predictions, heatmaps = classify_with_grad_cam(backend, images, NO_TUMOR_INDEX)
+
+    assert counting.calls == 1 and counting.rows == 2
+    for image, heatmap, row in zip(images, heatmaps, predictions):
+        expected = generate_grad_cam(backend, image, int(row.argmax()))
+        np.testing.assert_allclose(heatmap, expected, atol=1e-5)
+
+
+def test_without_skip_class_every_row_is_explained():
+    backend = _backend_predicting("notumor")
+
+    _, heatmaps = classify_with_grad_cam(backend, _inputs(2))
+
+    explained = backend.explain(_inputs(2), np.full(2, NO_TUMOR_INDEX, dtype=np.int32))
+    np.testing.assert_allclose(heatmaps, explained, atol=1e-5)
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from backend_simple.inference_batcher import BatchQueueFull, MicroBatcher
+from backend_simple.app_simple.ai_pipeline_simple import IMAGE_SIZE_SEGMENT
+
+
+def _segment_inputs(count):
+    rng = np.random.default_rng(0)
+    return rng.random((count,) + IMAGE_SIZE_SEGMENT + (3,), dtype=np.float32)
+
+
+def test_concurrent_submits_share_a_forward_pass(random_backend):
+    inputs = _segment_inputs(6)
+    batcher = MicroBatcher("segmentation", random_backend.segment, max_batch_size=8, max_wait_ms=50)
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(sample) for sample in inputs))
+
+    rows = asyncio.run(submit_all())
+
+    expected = random_backend.segment(inputs)
+    for row, want in zip(rows, expected):
+        np.testing.assert_allclose(row, want, rtol=1e-5, atol=1e-6)
+    assert batcher.requests == 6
+    assert batcher.batches == 1
+    assert batcher.stats()["avg_batch_size"] == 6.0
+
+
+def test_batches_are_capped_at_max_batch_size(random_backend):
+    inputs = _segment_inputs(5)
+    batcher = MicroBatcher("segmentation", random_backend.segment, max_batch_size=2, max_wait_ms=50)
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(sample) for sample in inputs))
+
+    rows = asyncio.run(submit_all())
+
+    assert len(rows) == 5
+    assert batcher.batches == 3
+    assert batcher.last_batch_size == 1
+
+
+def test_tuple_outputs_are_split_per_caller():
+    batcher = MicroBatcher("pair", lambda batch: (batch.sum(axis=1), batch * 2), max_wait_ms=20)
+
+    async def submit_all():
+        return await asyncio.gather(
+            batcher.submit(np.array([1.0, 2.0])), batcher.submit(np.array([3.0, 4.0]))
+        )
+
+    (first_sum, first_double), (second_sum, _) = asyncio.run(submit_all())
+
+    assert first_sum == 3.0
+    assert second_sum == 7.0
+    np.testing.assert_array_equal(first_double, [2.0, 4.0])
+
+
+def test_full_queue_rejects_and_errors_reach_every_caller():
+    def failing(batch):
+        raise RuntimeError("model exploded")
+
+    batcher = MicroBatcher("failing", failing, max_wait_ms=20, max_queue_depth=2)
+
+    async def scenario():
+        pending = [asyncio.ensure_future(batcher.submit(np.zeros(2))) for _ in range(3)]
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert sum(isinstance(r, BatchQueueFull) for r in results) == 1
+    assert sum(isinstance(r, RuntimeError) for r in results) == 2
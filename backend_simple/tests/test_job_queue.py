@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from backend_simple import job_queue
+
+
+@pytest.fixture
+def jobs_db(monkeypatch):
+    """Runs the queue against an in-memory Mongo; JOB_LEASE_SECONDS is short so leases renew quickly."""
+    db = mongomock_motor.AsyncMongoMockClient()["neuroai_test"]
+    monkeypatch.setattr(job_queue, "db", db)
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 0.3)
+    return db
+
+
+def _expire_lease(db, job_id):
+    return db.jobs.update_one({"_id": job_id}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+
+
+def test_claim_takes_the_oldest_queued_job_once(jobs_db):
+    async def scenario():
+        first = await job_queue.enqueue("analysis", {"n": 1})
+        await job_queue.enqueue("analysis", {"n": 2})
+        job = await job_queue.claim("worker-a")
+        other = await job_queue.claim("worker-b")
+        left = await job_queue.claim("worker-c")
+        return first, job, other, left
+
+    first, job, other, left = asyncio.run(scenario())
+
+    assert str(job["_id"]) == first
+    assert job["status"] == job_queue.STATUS_RUNNING
+    assert job["worker_id"] == "worker-a"
+    assert job["attempts"] == 1
+    assert other["payload"] == {"n": 2}
+    assert left is None
+
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_cannot_finish_it(jobs_db):
+    async def scenario():
+        await job_queue.enqueue("analysis", {})
+        job = await job_queue.claim("worker-a")
+        assert await job_queue.claim("worker-b") is None  # lease still held
+        await _expire_lease(jobs_db, job["_id"])
+        reclaimed = await job_queue.claim("worker-b")
+        await job_queue._finish(job["_id"], "worker-a", {"status": job_queue.STATUS_DONE})
+        return reclaimed, await jobs_db.jobs.find_one({"_id": job["_id"]})
+
+    reclaimed, stored = asyncio.run(scenario())
+
+    assert reclaimed["worker_id"] == "worker-b"
+    assert reclaimed["attempts"] == 2
+    assert stored["status"] == job_queue.STATUS_RUNNING
+    assert stored["worker_id"] == "worker-b"
+
+
+def test_job_out_of_attempts_is_failed_not_reclaimed(jobs_db, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 1)
+
+    async def scenario():
+        await job_queue.enqueue("analysis", {})
+        job = await job_queue.claim("worker-a")
+        await _expire_lease(jobs_db, job["_id"])
+        reclaimed = await job_queue.claim("worker-b")
+        await job_queue.fail_exhausted()
+        return reclaimed, await jobs_db.jobs.find_one({"_id": job["_id"]})
+
+    reclaimed, stored = asyncio.run(scenario())
+
+    assert reclaimed is None
+    assert stored["status"] == job_queue.STATUS_FAILED
+
+
+def test_handler_is_cancelled_when_another_worker_takes_the_lease(jobs_db):
+    cancelled = []
+
+    async def handler(job):
+        # Simulate worker-b re-claiming the job while this one is still running.
+        await jobs_db.jobs.update_one({"_id": job["_id"]}, {"$set": {"worker_id": "worker-b"}})
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(job["_id"])
+            raise
+        return {}
+
+    async def scenario():
+        await job_queue.enqueue("analysis", {})
+        job = await job_queue.claim("worker-a")
+        await asyncio.wait_for(job_queue._run_job(job, "worker-a", handler), timeout=5)
+        return job, await jobs_db.jobs.find_one({"_id": job["_id"]})
+
+    job, stored = asyncio.run(scenario())
+
+    assert cancelled == [job["_id"]]
+    assert stored["status"] == job_queue.STATUS_RUNNING
+    assert stored["worker_id"] == "worker-b"
+
+
+def test_renewer_survives_transient_errors_and_gives_up_at_expiry(jobs_db, monkeypatch):
+    calls = []
+    update_one = jobs_db.jobs.update_one
+
+    class _FlakyJobs:
+        def __init__(self, failures):
+            self.failures = failures
+
+        async def update_one(self, *args, **kwargs):
+            calls.append(len(calls))
+            if len(calls) <= self.failures:
+                raise ConnectionError("mongo unreachable")
+            return await update_one(*args, **kwargs)
+
+    class _FlakyDb:
+        def __init__(self, failures):
+            self.jobs = _FlakyJobs(failures)
+
+    async def renew(failures, job_id):
+        monkeypatch.setattr(job_queue, "db", _FlakyDb(failures))
+        renewer = asyncio.create_task(job_queue._renew_lease(job_id, "worker-a"))
+        await asyncio.sleep(job_queue.JOB_LEASE_SECONDS * 1.2)
+        lost = renewer.done()
+        renewer.cancel()
+        await asyncio.gather(renewer, return_exceptions=True)
+        monkeypatch.setattr(job_queue, "db", jobs_db)
+        return lost
+
+    async def scenario():
+        await job_queue.enqueue("analysis", {})
+        job = await job_queue.claim("worker-a")
+        recovered = await renew(1, job["_id"])
+        calls.clear()
+        expired = await renew(10, job["_id"])
+        return recovered, expired
+
+    recovered, expired = asyncio.run(scenario())
+
+    assert recovered is False
+    assert expired is True
+
+
+def test_rerun_job_reuses_its_study(jobs_db, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("aiofiles")
+    pytest.importorskip("jose")
+    from backend_simple import patient_routes
+
+    monkeypatch.setattr(patient_routes, "db", jobs_db)
+    analysis = {
+        "ai_facts": {"tumor_type": "glioma", "tumor_present": True, "tumor_area_cm2": 2.0, "location": "left"},
+        "image_paths": {"seg_mask": "/static/seg.png", "grad_cam": "/static/cam.png"},
+        "prediction": {"predicted_class": "glioma"},
+        "timings_ms": {},
+    }
+
+    async def scenario():
+        save = lambda job_id: patient_routes._save_study(
+            "P-1", "/static/mri.png", analysis, "Unknown", "Unknown", None, job_id
+        )
+        first, again = await save("job-1"), await save("job-1")
+        await save(None)
+        return first, again, await jobs_db.studies.count_documents({})
+
+    first, again, count = asyncio.run(scenario())
+
+    assert first["study_id"] == again["study_id"]
+    assert count == 2
@@ -0,0 +1,16 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("tensorflow")
+
+from backend_simple.keras_inference import CompiledKerasModel
+
+
+def test_compiled_predict_matches_the_model_in_any_chunking(random_backend):
+    model = random_backend.segmenter
+    compiled = CompiledKerasModel(model)
+    batch = np.random.default_rng(0).random((5, 256, 256, 3), dtype=np.float32)
+
+    expected = model(batch, training=False).numpy()
+    np.testing.assert_allclose(compiled.predict(batch), expected, atol=1e-6)
+    np.testing.assert_allclose(compiled.predict(batch, batch_size=2), expected, atol=1e-6)
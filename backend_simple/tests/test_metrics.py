@@ -0,0 +1,57 @@
+from backend_simple.metrics import Histogram, Registry, server_timing
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("stage_seconds", "Stage time.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage="decode")
+
+    assert histogram.samples() == [
+        'stage_seconds_bucket{stage="decode",le="0.1"} 1',
+        'stage_seconds_bucket{stage="decode",le="1.0"} 3',
+        'stage_seconds_bucket{stage="decode",le="+Inf"} 4',
+        'stage_seconds_sum{stage="decode"} 6.05',
+        'stage_seconds_count{stage="decode"} 4',
+    ]
+
+
+def test_histogram_boundary_value_lands_in_its_bucket():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.1)
+
+    assert histogram.samples()[:2] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 1',
+    ]
+
+
+def test_histogram_keeps_label_sets_apart():
+    histogram = Histogram("stage_seconds", "Stage time.", ("stage",), buckets=(1.0,))
+    histogram.observe(0.5, stage="decode")
+    histogram.observe(2.0, stage="segmentation")
+
+    samples = histogram.samples()
+    assert 'stage_seconds_count{stage="decode"} 1' in samples
+    assert 'stage_seconds_bucket{stage="segmentation",le="1.0"} 0' in samples
+    assert 'stage_seconds_bucket{stage="segmentation",le="+Inf"} 1' in samples
+
+
+def test_registry_renders_help_type_and_callback_gauges():
+    registry = Registry()
+    registry.gauge("queue_depth", "Pending jobs.", collect=lambda: 3)
+    registry.gauge("batcher_depth", "Pending samples.", ("model",), collect=lambda: {("segmentation",): 2})
+
+    assert registry.render().splitlines() == [
+        "# HELP queue_depth Pending jobs.",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3",
+        "# HELP batcher_depth Pending samples.",
+        "# TYPE batcher_depth gauge",
+        'batcher_depth{model="segmentation"} 2',
+    ]
+
+
+def test_server_timing_header():
+    assert server_timing({"decode": 1.5, "segmentation": 20.25}, 30.004) == (
+        "decode;dur=1.5, segmentation;dur=20.25, total;dur=30.0"
+    )
@@ -0,0 +1,102 @@
+import asyncio
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from backend_simple.app_simple import ai_pipeline_simple
+from backend_simple.app_simple.ai_pipeline_simple import CLASSES, NO_TUMOR_INDEX, run_simple_analysis
+from backend_simple.app_simple.xai_simple import classify_with_grad_cam
+from backend_simple.inference_backends import RandomBackend
+from backend_simple.inference_batcher import MicroBatcher
+
+
+@pytest.fixture(autouse=True)
+def xai_output_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_pipeline_simple, "XAI_OUTPUT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _backend_predicting(class_name):
+    """A RandomBackend whose classifier output bias makes `class_name` win for any input."""
+    backend = RandomBackend(seed=0)
+    bias = np.zeros(len(CLASSES), dtype=np.float32)
+    bias[CLASSES.index(class_name)] = 8.0
+    backend.classifier.layers[-1].bias.assign(bias)
+    return backend
+
+
+def _scan(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(180, 200, 3), dtype=np.uint8)
+
+
+def test_tumor_case_runs_every_stage(xai_output_dir):
+    backend = _backend_predicting("glioma")
+
+    result = asyncio.run(run_simple_analysis("scan.png", "case.png", backend, image=_scan()))
+
+    assert result["prediction"]["predicted_class"] == "glioma"
+    assert result["image_paths"] == {
+        "original": "scan.png",
+        "grad_cam": "/uploads/xai_outputs/gradcam_case.png",
+        "seg_mask": "/uploads/xai_outputs/segmask_case.png",
+    }
+    assert (xai_output_dir / "gradcam_case.png").exists()
+    assert (xai_output_dir / "segmask_case.png").exists()
+    assert {"classification", "segmentation", "mask_morphology", "fact_extraction", "reasoning"} <= set(result["timings_ms"])
+    assert "decode" not in result["timings_ms"]
+    assert result["ai_facts"]["predicted_class"] == "glioma"
+    assert result["explanation"]
+    assert result["cache_hit"] is False
+
+
+def test_no_tumor_skips_segmentation(xai_output_dir):
+    backend = _backend_predicting("notumor")
+
+    result = asyncio.run(run_simple_analysis("scan.png", "clear.png", backend, image=_scan()))
+
+    assert result["prediction"]["predicted_class"] == "notumor"
+    assert result["image_paths"]["grad_cam"] == "null"
+    assert result["image_paths"]["seg_mask"] == "null"
+    assert "segmentation" not in result["timings_ms"]
+    assert not os.listdir(xai_output_dir)
+
+
+def test_decodes_from_path(tmp_path):
+    backend = _backend_predicting("pituitary")
+    path = tmp_path / "upload.png"
+    cv2.imwrite(str(path), _scan())
+
+    result = asyncio.run(run_simple_analysis(str(path), "upload.png", backend))
+
+    assert result["prediction"]["predicted_class"] == "pituitary"
+    assert "decode" in result["timings_ms"]
+
+
+def test_batched_analyses_match_direct_calls():
+    backend = _backend_predicting("meningioma")
+    scans = [_scan(seed) for seed in range(3)]
+    direct = [
+        asyncio.run(run_simple_analysis("scan.png", f"direct_{i}.png", backend, image=scan))
+        for i, scan in enumerate(scans)
+    ]
+
+    clf_batcher = MicroBatcher("classification", lambda batch: classify_with_grad_cam(backend, batch, NO_TUMOR_INDEX), max_wait_ms=50)
+    seg_batcher = MicroBatcher("segmentation", backend.segment, max_wait_ms=50)
+
+    async def analyze_all():
+        return await asyncio.gather(*(
+            run_simple_analysis("scan.png", f"batched_{i}.png", backend, clf_batcher, seg_batcher, image=scan)
+            for i, scan in enumerate(scans)
+        ))
+
+    batched = asyncio.run(analyze_all())
+
+    assert clf_batcher.requests == 3
+    for one, other in zip(direct, batched):
+        assert other["prediction"]["predicted_class"] == one["prediction"]["predicted_class"]
+        assert other["prediction"]["confidence"] == pytest.approx(one["prediction"]["confidence"], rel=1e-4)
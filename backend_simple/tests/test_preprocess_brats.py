@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("tqdm")
+nib = pytest.importorskip("nibabel")
+
+import preprocess_brats
+
+
+def _patient(brats_path, patient_id, tumor_slices=(1, 2)):
+    """A tiny BraTS patient folder: 16 x 16 x 4 FLAIR and SEG volumes, tumor on `tumor_slices`."""
+    folder = brats_path / patient_id
+    folder.mkdir(parents=True)
+    rng = np.random.default_rng(len(patient_id))
+    flair = rng.uniform(0, 500, size=(16, 16, 4)).astype(np.float32)
+    seg = np.zeros((16, 16, 4), dtype=np.uint8)
+    for z in tumor_slices:
+        seg[4:8, 4:8, z] = 4
+    nib.save(nib.Nifti1Image(flair, np.eye(4)), str(folder / f"{patient_id}_flair.nii.gz"))
+    nib.save(nib.Nifti1Image(seg, np.eye(4)), str(folder / f"{patient_id}_seg.nii.gz"))
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """Runs the CLI in-process and returns the patient ids it converted."""
+    brats_path, output = tmp_path / "brats", tmp_path / "data_2d"
+    for patient_id in ("BraTS2021_00001", "BraTS2021_00002"):
+        _patient(brats_path, patient_id)
+
+    converted = []
+    process_patient = preprocess_brats.process_patient
+
+    def recording(folder_path, *args):
+        converted.append(os.path.basename(folder_path))
+        return process_patient(folder_path, *args)
+
+    monkeypatch.setattr(preprocess_brats, "process_patient", recording)
+
+    def main(*extra):
+        converted.clear()
+        monkeypatch.setattr(sys, "argv", [
+            "preprocess_brats.py", "--brats-path", str(brats_path), "--output", str(output),
+            "--size", "32", "--workers", "1", *extra,
+        ])
+        preprocess_brats.main()
+        return sorted(converted)
+
+    main.output = output
+    return main
+
+
+def test_rerun_skips_patients_already_in_the_manifest(run):
+    assert run() == ["BraTS2021_00001", "BraTS2021_00002"]
+    assert run() == []
+
+    manifest = run.output / preprocess_brats.MANIFEST_NAME
+    records = [json.loads(line) for line in manifest.read_text().splitlines()]
+    assert [r["patient_id"] for r in records] == ["BraTS2021_00001", "BraTS2021_00002"]
+    assert records[0]["slices"] == [1, 2]
+    assert all(r["tumor_pixels"][0] > 0 for r in records)
+
+
+def test_patient_with_missing_output_or_other_settings_is_redone(run):
+    run()
+    os.remove(run.output / "images" / "BraTS2021_00002_1.png")
+
+    assert run() == ["BraTS2021_00002"]
+    assert run("--size", "64") == ["BraTS2021_00001", "BraTS2021_00002"]
+    assert run("--no-resume") == ["BraTS2021_00001", "BraTS2021_00002"]
+
+
+def test_truncated_manifest_line_is_ignored(run):
+    run()
+    manifest = run.output / preprocess_brats.MANIFEST_NAME
+    with open(manifest, "a") as f:
+        f.write('{"patient_id": "BraTS2021_00001", "status": "do')
+
+    completed = preprocess_brats.load_completed(str(manifest), 32)
+
+    assert sorted(completed) == ["BraTS2021_00001", "BraTS2021_00002"]
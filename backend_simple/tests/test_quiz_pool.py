@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from backend_simple import quiz_pool
+from backend_simple.analysis_executor import AnalysisOverloaded
+from backend_simple.quiz_pool import QuizCasePool
+
+CLASSES = ["glioma", "meningioma", "pituitary"]
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(quiz_pool, "REFILL_BACKOFF_SECONDS", 0.01)
+
+
+async def _until(condition, timeout=2.0):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_pool_fills_every_class_and_refills_after_pop():
+    built, refreshes = [], []
+
+    async def builder(cls):
+        built.append(cls)
+        return {"class": cls, "n": len(built)}
+
+    async def scenario():
+        pool = QuizCasePool(builder, per_class=2, refresh=lambda: refreshes.append(1))
+        pool.start(CLASSES)
+        await _until(lambda: pool.built == 6)
+        full = dict(pool.stats()["levels"])
+        case = pool.pop()
+        await _until(lambda: pool.built == 7)
+        stats = pool.stats()
+        await pool.stop()
+        return full, case, stats, pool.stats()
+
+    full, case, stats, stopped = asyncio.run(scenario())
+
+    assert full == {cls: 2 for cls in CLASSES}
+    assert sorted(built[:3]) == CLASSES  # lowest level first, so classes fill evenly
+    assert built[-1] == case["class"]    # the popped class is the one rebuilt
+    assert len(refreshes) == len(built)
+    assert stats["levels"] == full
+    assert stats["served_from_pool"] == 1 and stats["build_failures"] == 0
+    assert stopped["refilling"] is False
+
+
+def test_overloaded_builds_back_off_and_failures_are_counted():
+    attempts = []
+
+    async def builder(cls):
+        attempts.append(cls)
+        if len(attempts) == 1:
+            raise AnalysisOverloaded()
+        if len(attempts) == 2:
+            raise ValueError("unreadable image")
+        return {"class": cls}
+
+    async def scenario():
+        pool = QuizCasePool(builder, per_class=1)
+        pool.start(["glioma"])
+        await _until(lambda: pool.built == 1)
+        await pool.stop()
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert len(attempts) == 3
+    assert stats["build_failures"] == 1
+    assert stats["levels"] == {"glioma": 1}
+
+
+def test_empty_or_disabled_pool_serves_nothing():
+    async def builder(cls):
+        raise AssertionError("a disabled pool never builds")
+
+    async def scenario():
+        pool = QuizCasePool(builder, per_class=0)
+        pool.start(CLASSES)
+        return pool.pop(), pool.stats()
+
+    case, stats = asyncio.run(scenario())
+
+    assert case is None
+    assert stats["refilling"] is False and stats["levels"] == {}
@@ -0,0 +1,18 @@
+from backend_simple.app_simple.reasoner_simple import simple_reasoner
+
+
+def test_treatment_is_scored_on_the_slice_area_not_the_3d_volume():
+    slice_facts = {"predicted_class": "meningioma", "confidence": 0.9, "tumor_volume_cm2": 2.0}
+    volume_facts = {**slice_facts, "tumor_volume_cm3": 14.5}
+
+    assert simple_reasoner.generate_treatment_plan(volume_facts) == simple_reasoner.generate_treatment_plan(slice_facts)
+    assert simple_reasoner.generate_treatment_plan(volume_facts)["action"] == "Active Surveillance"
+
+
+def test_explanation_reports_both_measurements():
+    explanation = simple_reasoner.generate_explanation(
+        {"predicted_class": "glioma", "confidence": 0.8, "tumor_volume_cm2": 3.1, "tumor_volume_cm3": 12.4}
+    )
+
+    assert "3.1 cm²" in explanation
+    assert "12.4 cm³" in explanation
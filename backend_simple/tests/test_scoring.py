@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from backend_simple.app_simple.scoring_simple import score_stack
+
+
+def _square(top, left, size=4, shape=(10, 10)):
+    mask = np.zeros(shape, dtype=bool)
+    mask[top:top + size, left:left + size] = True
+    return mask
+
+
+def _score(ai, student, **kwargs):
+    scores = score_stack(np.stack(ai), np.stack(student), **kwargs)
+    return {name: values.tolist() for name, values in scores.items()}
+
+
+def test_identical_masks_score_one():
+    scores = _score([_square(2, 2)], [_square(2, 2)])
+    assert scores == {"iou": [1.0], "dice": [1.0], "boundary_f1": [1.0]}
+
+
+def test_shifted_square():
+    # 4x4 squares two columns apart: 8 shared pixels, 24 in the union.
+    ai, student = [_square(2, 2)], [_square(2, 4)]
+    scores = _score(ai, student)
+    assert scores["iou"] == [pytest.approx(1 / 3)]
+    assert scores["dice"] == [pytest.approx(0.5)]
+    # Every outline pixel is within 2 px of the other outline...
+    assert scores["boundary_f1"] == [pytest.approx(1.0)]
+    # ...but only the 4 pixels shared by the top and bottom edges match exactly (4 of 12 each).
+    assert _score(ai, student, tolerance=0)["boundary_f1"] == [pytest.approx(1 / 3)]
+
+
+def test_disjoint_and_empty_masks_score_zero():
+    empty = np.zeros((10, 10), dtype=bool)
+    scores = _score([_square(0, 0), empty], [_square(6, 6), empty])
+    assert scores == {"iou": [0.0, 0.0], "dice": [0.0, 0.0], "boundary_f1": [0.0, 0.0]}
+
+
+def test_pairs_in_a_stack_are_scored_independently():
+    scores = _score([_square(2, 2), _square(2, 2)], [_square(2, 2), _square(2, 4)])
+    assert scores["iou"] == [pytest.approx(1.0), pytest.approx(1 / 3)]
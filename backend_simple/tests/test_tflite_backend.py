@@ -0,0 +1,67 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+tf = pytest.importorskip("tensorflow")
+
+from backend_simple.app_simple.ai_pipeline_simple import CLASSES, NO_TUMOR_INDEX
+from backend_simple.app_simple.xai_simple import classify_with_grad_cam
+from backend_simple.inference_backends import RandomBackend, TFLiteBackend
+from backend_simple.tflite_backend import TFLiteModel
+
+
+class _Recording:
+    """Wraps a model's predict() and counts the rows it was given."""
+
+    def __init__(self, model):
+        self.model, self.model_path, self.rows = model, model.model_path, 0
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        self.rows += len(batch)
+        return self.model.predict(batch)
+
+
+def _export(model, path):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    path.write_bytes(converter.convert())
+    return TFLiteModel(str(path))
+
+
+def _tflite_backend(tmp_path, class_name):
+    keras = RandomBackend(seed=0)
+    bias = np.zeros(len(CLASSES), dtype=np.float32)
+    bias[CLASSES.index(class_name)] = 8.0
+    keras.classifier.layers[-1].bias.assign(bias)
+    classifier = _Recording(_export(keras.classifier, tmp_path / "classification.tflite"))
+    segmenter = _export(keras.segmenter, tmp_path / "segmentation.tflite")
+    return TFLiteBackend(keras.classifier, segmenter, classifier), classifier
+
+
+def _inputs(count):
+    return np.random.default_rng(0).random((count, 128, 128, 3), dtype=np.float32)
+
+
+def test_classification_is_served_by_the_tflite_classifier(tmp_path):
+    backend, classifier = _tflite_backend(tmp_path, "glioma")
+    keras_calls = []
+    backend._classify_fn = lambda batch: keras_calls.append(batch)
+
+    predictions, heatmaps = classify_with_grad_cam(backend, _inputs(3), NO_TUMOR_INDEX)
+
+    assert classifier.rows == 3
+    assert not keras_calls
+    assert (predictions.argmax(axis=1) == CLASSES.index("glioma")).all()
+    assert heatmaps.shape[0] == 3 and heatmaps.any(axis=(1, 2)).all()
+    assert backend.describe()["classifier"].endswith("classification.tflite")
+
+
+def test_no_tumor_predictions_never_touch_the_keras_classifier(tmp_path):
+    backend, classifier = _tflite_backend(tmp_path, "notumor")
+    explained = []
+    explain = backend.explain
+    backend.explain = lambda batch, classes: explained.append(len(batch)) or explain(batch, classes)
+
+    _, heatmaps = classify_with_grad_cam(backend, _inputs(2), NO_TUMOR_INDEX)
+
+    assert classifier.rows == 2
+    assert not explained
+    assert not heatmaps.any()
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+nib = pytest.importorskip("nibabel")
+
+from backend_simple.app_simple import volume_pipeline_simple
+from backend_simple.app_simple.volume_pipeline_simple import run_volume_analysis
+from backend_simple.inference_backends import RandomBackend
+
+
+@pytest.fixture
+def output_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(volume_pipeline_simple, "UPLOADS_DIR", str(tmp_path))
+    monkeypatch.setattr(volume_pipeline_simple, "XAI_OUTPUT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _segmenting_everything():
+    """A RandomBackend whose U-Net output is ~1 everywhere, so every non-blank slice is all tumor."""
+    backend = RandomBackend(seed=0)
+    head = backend.segmenter.layers[-1]
+    head.kernel.assign(np.zeros(head.kernel.shape, dtype=np.float32))
+    head.bias.assign(np.full(head.bias.shape, 8.0, dtype=np.float32))
+    return backend
+
+
+def test_tumor_volume_uses_the_header_voxel_spacing(tmp_path, output_dirs):
+    rng = np.random.default_rng(0)
+    data = rng.uniform(1, 100, size=(32, 24, 6)).astype(np.float32)
+    data[..., 0] = data[..., 5] = 0  # blank slices are skipped, not segmented
+    image = nib.Nifti1Image(data, np.diag([1.5, 2.0, 3.0, 1.0]))  # 1.5 x 2 x 3 mm voxels
+    path = tmp_path / "case.nii.gz"
+    nib.save(image, str(path))
+
+    result = asyncio.run(run_volume_analysis(str(path), "case.nii.gz", _segmenting_everything(), batch_size=4))
+
+    facts = result["ai_facts"]
+    assert facts["voxel_volume_mm3"] == pytest.approx(9.0)
+    assert facts["slices_segmented"] == facts["slices_with_tumor"] == 4
+    assert facts["tumor_voxels"] == 32 * 24 * 4
+    assert facts["tumor_volume_cm3"] == pytest.approx(32 * 24 * 4 * 9.0 / 1000.0, abs=0.01)
+    mask = nib.load(os.path.join(output_dirs, os.path.basename(result["image_paths"]["volume_mask"])))
+    assert mask.header.get_zooms()[:3] == pytest.approx((1.5, 2.0, 3.0))
+    assert np.asarray(mask.dataobj).sum() == facts["tumor_voxels"]
@@ -0,0 +1,47 @@
+"""
+TFLite inference for the exported models (see export_models.py).
+
+TFLiteModel wraps a tf.lite.Interpreter behind the small part of the Keras API the pipeline
+uses: `predict(batch)` on a float32 (N, H, W, 3) batch. The interpreter is resized to the
+incoming batch size when it changes, and calls are serialized because an interpreter is not
+thread-safe. Quantized models keep float32 inputs/outputs, so callers see no difference.
+"""
+
+import threading
+import numpy as np
+import tensorflow as tf
+
+
+class TFLiteModel:
+    def __init__(self, model_path: str, num_threads: int = 1):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self._interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        return tuple(int(d) for d in self._input["shape"][1:])
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        if len(batch) != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input["index"], [len(batch), *self.input_shape])
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = len(batch)
+        self._interpreter.set_tensor(self._input["index"], batch)
+        self._interpreter.invoke()
+        return self._interpreter.get_tensor(self._output["index"]).copy()
+
+    def predict(self, batch: np.ndarray, batch_size=None, verbose=0) -> np.ndarray:
+        """Same contract as keras Model.predict for a single input; `verbose` is ignored."""
+        batch = np.asarray(batch, dtype=np.float32)
+        step = batch_size or len(batch)
+        with self._lock:
+            outputs = [self._run(batch[i:i + step]) for i in range(0, len(batch), step)]
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
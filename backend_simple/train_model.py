@@ -1,138 +1,184 @@
 # train_model.py
+"""
+Trains the VGG16 brain tumor classifier and saves it as models/model.h5.
+
+Input pipeline (tf.data): parallel decode + resize of each image once, a cache of the decoded
+uint8 base images, a fresh shuffle every epoch, and brightness / contrast jitter applied to
+whole batches with tensor ops (same semantics as the old per-image PIL ImageEnhance code).
+
+Usage:
+    python train_model.py --train-dir "MRI Images/Training/" --epochs 5 --batch-size 20
+"""
 import os
+import argparse
 import numpy as np
-import random
-from PIL import Image, ImageEnhance
-from tensorflow.keras.preprocessing.image import load_img
+import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Input, Flatten, Dropout, Dense
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.applications import VGG16
-from sklearn.utils import shuffle
 
-# --- SETTINGS ---
+# --- SETTINGS (defaults; override on the command line) ---
 # This MUST match the folder you downloaded from Google Drive
-train_dir = 'MRI Images/Training/'
-test_dir = 'MRI Images/Testing/' # Not used for training, but good to define
+TRAIN_DIR = 'MRI Images/Training/'
+TEST_DIR = 'MRI Images/Testing/' # Only used with --validate
 IMAGE_SIZE = 128 # From your original script
-batch_size = 20
-epochs = 5 # Set to 5 for speed, can increase later if needed
+BATCH_SIZE = 20
+EPOCHS = 5 # Set to 5 for speed, can increase later if needed
+JITTER = (0.8, 1.2) # Brightness / contrast factor range
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
 
 # --- 1. Load Data Paths ---
-print("Loading image paths...")
-if not os.path.exists(train_dir):
-    print(f"ERROR: Training directory not found at '{train_dir}'. Make sure 'MRI Images' folder is inside 'backend_simple'.")
-    exit()
-
-train_paths = []
-train_labels= []
-
-for label in os.listdir(train_dir):
-  # Skip non-directory files if any
-  label_path = os.path.join(train_dir, label)
-  if not os.path.isdir(label_path):
-      continue
-  for image in os.listdir(label_path):
-    train_paths.append(os.path.join(train_dir, label, image))
-    train_labels.append(label)
-
-if not train_paths:
-    print(f"ERROR: No images found in '{train_dir}'. Check the subfolders.")
-    exit()
-
-train_paths, train_labels = shuffle(train_paths, train_labels)
-
-# Get unique labels for the output layer
-unique_labels = sorted([d for d in os.listdir(train_dir) if os.path.isdir(os.path.join(train_dir, d))]) # Ensure consistent order
-num_classes = len(unique_labels)
-print(f"Found {num_classes} classes: {unique_labels}")
-
-# --- 2. Image Augmentation & Loading ---
-def augment_image(image):
-    image = Image.fromarray(np.uint8(image))
-    image = ImageEnhance.Brightness(image).enhance(random.uniform(0.8, 1.2))
-    image = ImageEnhance.Contrast(image).enhance(random.uniform(0.8, 1.2))
-    image = np.array(image) / 255.0 # Normalize
-    return image
-
-def open_images(paths):
-    images = []
-    for path in paths:
-        try:
-            image = load_img(path, target_size=(IMAGE_SIZE, IMAGE_SIZE))
-            image = augment_image(image)
-            images.append(image)
-        except Exception as e:
-            print(f"Warning: Could not load image {path}. Error: {e}")
-            continue # Skip corrupted images
-    return np.array(images)
-
-def encode_label(labels):
-    encoded = [unique_labels.index(label) for label in labels]
-    return np.array(encoded)
-
-# --- 3. Data Generator ---
-def datagen(paths, labels, batch_size=12, epochs=1):
-    num_samples = len(paths)
-    if num_samples == 0:
-        raise ValueError("No valid image paths found for the data generator.")
-    for _ in range(epochs):
-      indices = np.arange(num_samples)
-      np.random.shuffle(indices)
-      paths_shuffled = np.array(paths)[indices]
-      labels_shuffled = np.array(labels)[indices]
-      for i in range(0, num_samples, batch_size):
-          batch_paths = paths_shuffled[i:i + batch_size]
-          batch_images = open_images(batch_paths)
-          if len(batch_images) == 0: # Handle cases where a whole batch fails to load
-              print(f"Warning: Batch starting at index {i} failed to load any images.")
-              continue
-          batch_labels = labels_shuffled[i:i + batch_size]
-          batch_labels = encode_label(batch_labels)
-          yield batch_images, batch_labels
-
-# --- 4. Define Model Architecture ---
-print("Building VGG16 model...")
-base_model = VGG16(input_shape=(IMAGE_SIZE, IMAGE_SIZE, 3), include_top=False, weights='imagenet')
-
-for layer in base_model.layers:
-    layer.trainable = False
-
-# Make sure enough layers exist before trying to unfreeze
-if len(base_model.layers) >= 4:
-    base_model.layers[-2].trainable = True
-    base_model.layers[-3].trainable = True
-    base_model.layers[-4].trainable = True
-else:
-    print("Warning: VGG16 base model has fewer than 4 layers, cannot unfreeze last few.")
-
-model = Sequential()
-model.add(Input(shape=(IMAGE_SIZE, IMAGE_SIZE, 3)))
-model.add(base_model)
-model.add(Flatten())
-model.add(Dropout(0.3))
-model.add(Dense(128, activation='relu'))
-model.add(Dropout(0.2))
-model.add(Dense(num_classes, activation='softmax')) # Use num_classes
-
-# --- 5. Compile Model ---
-model.compile(optimizer=Adam(learning_rate=0.0001),
-              loss='sparse_categorical_crossentropy',
-              metrics=['sparse_categorical_accuracy'])
-
-model.summary()
-print("\nStarting model training...")
-
-# --- 6. Train Model ---
-steps = max(1, len(train_paths) // batch_size) # Ensure at least 1 step
-history = model.fit(datagen(train_paths, train_labels, batch_size=batch_size, epochs=epochs),
-                    epochs=epochs, steps_per_epoch=steps)
-
-print("\nTraining complete!")
-
-# --- 7. Save the New, Compatible Model ---
-# Ensure the models directory exists
-os.makedirs("models", exist_ok=True)
-model_save_path = 'models/model.h5'
-model.save(model_save_path)
-print(f"\nSuccessfully saved new, compatible model as '{model_save_path}'")
\ No newline at end of file
+def list_images(data_dir, unique_labels=None):
+    """Returns (paths, integer labels, class names) for a <data_dir>/<class>/<image> tree."""
+    if unique_labels is None:
+        unique_labels = sorted([d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d))]) # Ensure consistent order
+    paths, labels = [], []
+    for class_index, label in enumerate(unique_labels):
+        label_path = os.path.join(data_dir, label)
+        if not os.path.isdir(label_path):
+            continue
+        for image in sorted(os.listdir(label_path)):
+            if image.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(label_path, image))
+                labels.append(class_index)
+    return paths, np.array(labels, dtype=np.int32), unique_labels
+
+# --- 2. Image Loading & Batched Augmentation ---
+def decode_image(path, label, image_size):
+    """
+    Same result as keras load_img(path, target_size=...): RGB, nearest-neighbour resize, uint8.
+    """
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(image, (image_size, image_size), method="nearest")
+    return tf.cast(image, tf.uint8), label
+
+def augment_batch(images, labels):
+    """
+    Brightness then contrast jitter for a whole uint8 batch, one random factor per image,
+    matching PIL ImageEnhance:
+      Brightness(f): blend with black             -> img * f
+      Contrast(f):   blend with the grayscale mean -> mean + f * (img - mean)
+    Each step is clipped to 0..255 like PIL's uint8 images, then scaled to 0..1.
+    """
+    batch = tf.shape(images)[0]
+    brightness = tf.random.uniform((batch, 1, 1, 1), JITTER[0], JITTER[1])
+    contrast = tf.random.uniform((batch, 1, 1, 1), JITTER[0], JITTER[1])
+
+    images = tf.cast(images, tf.float32)
+    images = tf.clip_by_value(tf.floor(images * brightness), 0.0, 255.0)
+
+    # PIL's Contrast uses the mean of the "L" (ITU-R 601-2 luma) version of the image, rounded.
+    luma = tf.tensordot(images, tf.constant([0.299, 0.587, 0.114]), axes=[[3], [0]])
+    mean = tf.round(tf.reduce_mean(luma, axis=[1, 2], keepdims=True))[..., tf.newaxis]
+    images = tf.clip_by_value(tf.floor(mean + contrast * (images - mean)), 0.0, 255.0)
+    return images / 255.0, labels
+
+def make_dataset(paths, labels, image_size, batch_size, training, cache=""):
+    """
+    cache: "" keeps decoded base images in RAM, a path caches them on disk, None disables.
+    Corrupted images are skipped, as before.
+    """
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(lambda p, l: decode_image(p, l, image_size), num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.ignore_errors(log_warning=True)
+    if cache is not None:
+        ds = ds.cache(cache)
+    if training:
+        ds = ds.shuffle(len(paths), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    if training:
+        ds = ds.map(augment_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) / 255.0, y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+# --- 3. Define Model Architecture ---
+def build_model(image_size, num_classes):
+    print("Building VGG16 model...")
+    base_model = VGG16(input_shape=(image_size, image_size, 3), include_top=False, weights='imagenet')
+
+    for layer in base_model.layers:
+        layer.trainable = False
+
+    # Make sure enough layers exist before trying to unfreeze
+    if len(base_model.layers) >= 4:
+        base_model.layers[-2].trainable = True
+        base_model.layers[-3].trainable = True
+        base_model.layers[-4].trainable = True
+    else:
+        print("Warning: VGG16 base model has fewer than 4 layers, cannot unfreeze last few.")
+
+    model = Sequential()
+    model.add(Input(shape=(image_size, image_size, 3)))
+    model.add(base_model)
+    model.add(Flatten())
+    model.add(Dropout(0.3))
+    model.add(Dense(128, activation='relu'))
+    model.add(Dropout(0.2))
+    model.add(Dense(num_classes, activation='softmax')) # Use num_classes
+    return model
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the VGG16 brain tumor classifier.")
+    parser.add_argument("--train-dir", default=TRAIN_DIR, help="Folder with one subfolder per class.")
+    parser.add_argument("--test-dir", default=TEST_DIR, help="Held-out folder, same layout (used with --validate).")
+    parser.add_argument("--validate", action="store_true", help="Evaluate on --test-dir after every epoch.")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--image-size", type=int, default=IMAGE_SIZE)
+    parser.add_argument("--cache", default="",
+                        help='Where to cache decoded images: "" = RAM (default), a file path = disk.')
+    parser.add_argument("--no-cache", action="store_true", help="Decode every image on every epoch.")
+    parser.add_argument("--output", default="models/model.h5", help="Where to save the trained model.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    print("Loading image paths...")
+    if not os.path.exists(args.train_dir):
+        print(f"ERROR: Training directory not found at '{args.train_dir}'. Make sure 'MRI Images' folder is inside 'backend_simple'.")
+        return
+
+    train_paths, train_labels, unique_labels = list_images(args.train_dir)
+    if not train_paths:
+        print(f"ERROR: No images found in '{args.train_dir}'. Check the subfolders.")
+        return
+    num_classes = len(unique_labels)
+    print(f"Found {num_classes} classes: {unique_labels}")
+
+    cache = None if args.no_cache else args.cache
+    train_ds = make_dataset(train_paths, train_labels, args.image_size, args.batch_size, training=True, cache=cache)
+
+    valid_ds = None
+    if args.validate:
+        test_paths, test_labels, _ = list_images(args.test_dir, unique_labels)
+        test_cache = None if args.no_cache else (args.cache + ".test" if args.cache else "")
+        valid_ds = make_dataset(test_paths, test_labels, args.image_size, args.batch_size, training=False, cache=test_cache)
+        print(f"Validating on {len(test_paths)} images from '{args.test_dir}'.")
+
+    model = build_model(args.image_size, num_classes)
+
+    # --- 4. Compile Model ---
+    model.compile(optimizer=Adam(learning_rate=0.0001),
+                  loss='sparse_categorical_crossentropy',
+                  metrics=['sparse_categorical_accuracy'])
+
+    model.summary()
+    print("\nStarting model training...")
+
+    # --- 5. Train Model ---
+    # Every epoch is one full pass over the (reshuffled) training set.
+    model.fit(train_ds, epochs=args.epochs, validation_data=valid_ds)
+
+    print("\nTraining complete!")
+
+    # --- 6. Save the New, Compatible Model ---
+    # Ensure the models directory exists
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    model.save(args.output)
+    print(f"\nSuccessfully saved new, compatible model as '{args.output}'")
+
+if __name__ == "__main__":
+    main()
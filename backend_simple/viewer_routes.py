@@ -0,0 +1,48 @@
+"""
+Handles /viewer endpoints: images rendered on demand for display.
+
+No auth dependency, matching the /uploads static mount: these URLs are loaded by <img> tags.
+"""
+
+import os
+from pathlib import Path
+
+import cv2
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from . import dicom_io
+from .analysis_executor import analysis_executor
+
+BASE_DIR = Path(__file__).resolve().parent
+UPLOADS_DIR = BASE_DIR / "uploads"
+RENDERED_DIR = UPLOADS_DIR / "rendered"
+
+os.makedirs(RENDERED_DIR, exist_ok=True)
+
+router = APIRouter(tags=["Viewer"])
+
+def _render_dicom_png(source: str, output_path: str):
+    image = dicom_io.load_dicom_image(source)
+    tmp_path = f"{output_path}.tmp.png"
+    if not cv2.imwrite(tmp_path, image):
+        raise ValueError("Failed to encode PNG")
+    os.replace(tmp_path, output_path)
+
+@router.get("/viewer/dicom/{filename}")
+async def view_dicom(filename: str):
+    """
+    Windowed PNG of a stored DICOM upload. Rendered on the first request, then served from disk.
+    """
+    name = os.path.basename(filename)
+    source = UPLOADS_DIR / name
+    if not name.lower().endswith(".dcm") or not os.path.exists(source):
+        raise HTTPException(404, "DICOM image not found")
+
+    rendered = RENDERED_DIR / (os.path.splitext(name)[0] + ".png")
+    if not os.path.exists(rendered):
+        try:
+            await analysis_executor.run(_render_dicom_png, str(source), str(rendered))
+        except Exception as e:
+            raise HTTPException(500, f"Failed to render DICOM: {e}")
+    return FileResponse(rendered, media_type="image/png")
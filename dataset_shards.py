@@ -0,0 +1,206 @@
+"""
+Sharded 2D BraTS Dataset Format
+
+A compact alternative to the ~80k loose PNGs in 'data_2d'. Each patient becomes one pair of
+.npy shards holding fixed-shape uint8 arrays:
+
+    <root>/shards/<patient_id>_images.npy   (N, IMAGE_SIZE, IMAGE_SIZE)  grayscale FLAIR slices
+    <root>/shards/<patient_id>_masks.npy    (N, IMAGE_SIZE, IMAGE_SIZE)  0 / 255 tumor masks
+    <root>/index.json                       shard list, slice indices and counts
+
+Shards are opened with np.load(mmap_mode="r"), so reading a slice is a zero-copy view into
+the page cache and a pass over a shard is one sequential read.
+
+Usage (convert an existing PNG folder written by preprocess_brats.py):
+    python dataset_shards.py data_2d data_2d_shards --workers 8
+"""
+
+import os
+import re
+import json
+import hashlib
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+INDEX_NAME = "index.json"
+SHARDS_DIR = "shards"
+FORMAT_VERSION = 1
+
+# preprocess_brats.py names slices "<patient_id>_<z>.png"
+_SLICE_NAME = re.compile(r"^(?P<patient>.+)_(?P<z>\d+)\.png$")
+
+
+def _save_npy(path: str, array: np.ndarray):
+    # Write to a temp file first so an interrupted run never leaves a truncated shard behind.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def write_shard(root: str, patient_id: str, images: np.ndarray, masks: np.ndarray, slices) -> dict:
+    """
+    Writes one patient's (N, H, W) uint8 image and mask arrays and returns its index entry.
+    """
+    if images.shape != masks.shape or images.dtype != np.uint8 or masks.dtype != np.uint8:
+        raise ValueError(f"{patient_id}: images and masks must be uint8 arrays of the same shape")
+    os.makedirs(os.path.join(root, SHARDS_DIR), exist_ok=True)
+    images_rel = os.path.join(SHARDS_DIR, f"{patient_id}_images.npy")
+    masks_rel = os.path.join(SHARDS_DIR, f"{patient_id}_masks.npy")
+    _save_npy(os.path.join(root, images_rel), images)
+    _save_npy(os.path.join(root, masks_rel), masks)
+
+    digest = hashlib.sha256()
+    digest.update(images.tobytes())
+    digest.update(masks.tobytes())
+    return {
+        "patient_id": patient_id,
+        "images": images_rel,
+        "masks": masks_rel,
+        "count": int(images.shape[0]),
+        "slices": [int(z) for z in slices],
+        "checksum": digest.hexdigest(),
+    }
+
+
+def write_index(root: str, image_size: int, entries) -> str:
+    """Writes index.json for `entries` (sorted by patient id) and returns its path."""
+    entries = sorted((e for e in entries if e["count"] > 0), key=lambda e: e["patient_id"])
+    index = {
+        "format": "npy-shards",
+        "version": FORMAT_VERSION,
+        "image_size": image_size,
+        "dtype": "uint8",
+        "total": sum(e["count"] for e in entries),
+        "shards": entries,
+    }
+    path = os.path.join(root, INDEX_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def is_sharded(root: str) -> bool:
+    return os.path.exists(os.path.join(root, INDEX_NAME))
+
+
+class ShardedDataset:
+    """
+    Read side of the format. Slices are addressed globally (0 .. len-1) in index order or by
+    key "<patient_id>_<z>"; shards are memory-mapped on first use.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        with open(os.path.join(root, INDEX_NAME)) as f:
+            self.index = json.load(f)
+        self.image_size = self.index["image_size"]
+        self.shards = self.index["shards"]
+        self._offsets = np.cumsum([0] + [s["count"] for s in self.shards])
+        self._open = {}
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def keys(self):
+        """Slice keys in global order, named like the PNGs preprocess_brats.py writes."""
+        return [f"{s['patient_id']}_{z}" for s in self.shards for z in s["slices"]]
+
+    def patient_ids(self):
+        """Patient id of every slice, in global order (for splitting by patient)."""
+        return np.repeat([s["patient_id"] for s in self.shards], [s["count"] for s in self.shards])
+
+    def shard_arrays(self, shard_number: int):
+        """(images, masks) memmaps of one shard."""
+        if shard_number not in self._open:
+            shard = self.shards[shard_number]
+            self._open[shard_number] = (
+                np.load(os.path.join(self.root, shard["images"]), mmap_mode="r"),
+                np.load(os.path.join(self.root, shard["masks"]), mmap_mode="r"),
+            )
+        return self._open[shard_number]
+
+    def locate(self, i: int):
+        """Global slice index -> (shard number, row inside the shard)."""
+        shard_number = int(np.searchsorted(self._offsets, i, side="right") - 1)
+        return shard_number, int(i - self._offsets[shard_number])
+
+    def get(self, i: int):
+        """(image, mask) uint8 views for global slice index `i`."""
+        shard_number, row = self.locate(i)
+        images, masks = self.shard_arrays(shard_number)
+        return images[row], masks[row]
+
+
+# --- Converter for existing PNG folders ---
+
+def _group_png_folder(data_path: str):
+    """{patient_id: [(z, image path, mask path), ...]} for every image that has a mask."""
+    groups = defaultdict(list)
+    image_dir = os.path.join(data_path, "images")
+    mask_dir = os.path.join(data_path, "masks")
+    with os.scandir(image_dir) as entries:
+        for entry in entries:
+            match = _SLICE_NAME.match(entry.name)
+            if not match:
+                continue
+            mask_path = os.path.join(mask_dir, entry.name)
+            if os.path.exists(mask_path):
+                groups[match.group("patient")].append((int(match.group("z")), entry.path, mask_path))
+    return groups
+
+
+def _convert_patient(root: str, patient_id: str, slices, image_size: int) -> dict:
+    slices = sorted(slices)
+    images = np.empty((len(slices), image_size, image_size), dtype=np.uint8)
+    masks = np.empty_like(images)
+    for row, (_, image_path, mask_path) in enumerate(slices):
+        for target, path in ((images, image_path), (masks, mask_path)):
+            data = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if data is None:
+                raise ValueError(f"Could not read {path}")
+            if data.shape != (image_size, image_size):
+                data = cv2.resize(data, (image_size, image_size), interpolation=cv2.INTER_NEAREST)
+            target[row] = data
+    return write_shard(root, patient_id, images, masks, [z for z, _, _ in slices])
+
+
+def convert_png_folder(data_path: str, output_path: str, image_size: int = 256, workers: int = 1) -> str:
+    """Packs a data_2d PNG folder into per-patient shards; returns the index path."""
+    groups = _group_png_folder(data_path)
+    if not groups:
+        raise ValueError(f"No '<patient>_<z>.png' images with masks found under '{data_path}'.")
+    print(f"Converting {sum(len(v) for v in groups.values())} slices from {len(groups)} patients...")
+
+    entries = []
+    if workers <= 1:
+        for patient_id, slices in tqdm(groups.items(), desc="Packing Patients"):
+            entries.append(_convert_patient(output_path, patient_id, slices, image_size))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_convert_patient, output_path, p, s, image_size) for p, s in groups.items()]
+            for future in tqdm(futures, desc="Packing Patients"):
+                entries.append(future.result())
+    return write_index(output_path, image_size, entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a data_2d PNG folder into memory-mappable .npy shards.")
+    parser.add_argument("data_path", help="Folder with images/ and masks/ written by preprocess_brats.py.")
+    parser.add_argument("output", help="Output folder for shards/ and index.json.")
+    parser.add_argument("--size", type=int, default=256, help="Slice size in pixels (square).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Patients packed in parallel.")
+    args = parser.parse_args()
+
+    index_path = convert_png_folder(args.data_path, args.output, args.size, args.workers)
+    print(f"Done. Index written to {index_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,23 +6,34 @@ This script does the following:
 2.  Loads the 3D FLAIR (input) and SEG (mask) .nii.gz files.
 3.  Slices them along the Z-axis.
 4.  Filters out any slices that do not contain a tumor.
-5.  Normalizes and saves the "good" slices as 2D PNG files.
+5.  Normalizes and saves the "good" slices as 2D PNG files, or packs each patient's slices
+    into memory-mappable .npy shards with --format shards (see dataset_shards.py).
+
+Patients are processed in parallel (--workers) and every finished patient is appended to
+<output>/manifest.jsonl. A rerun skips patients already in the manifest whose files are all
+still on disk, so an interrupted run resumes where it stopped.
+
+Usage:
+    python preprocess_brats.py --brats-path /data/BraTS2021_Training_Data --output data_2d --workers 8
 """
 
 import os
 import glob
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import nibabel as nib  # The library for .nii.gz files
 import cv2  # OpenCV for saving images
 from tqdm import tqdm  # The progress bar library
+import dataset_shards  # Compact .npy shard output (--format shards)
 
-# --- 1. CONFIGURATION ---
+# --- 1. CONFIGURATION (defaults; override on the command line) ---
 
-# --- ⚠️ UPDATE THIS PATH ---
 # Point this to the folder you unzipped, e.g., "C:/Users/jayanth/Downloads/BraTS2021_Task1/TrainingData"
 # It should be the folder that CONTAINS all the BraTS2021_XXXXX patient folders.
 BRATS_DATA_PATH = "C:/Users/jayanth/Downloads/archive (8)/BraTS2021_Training_Data"
-# --- ⚠️ ---
 
 # The output folder where we will save the 2D slices
 OUTPUT_PATH = "data_2d"
@@ -30,6 +41,8 @@ OUTPUT_PATH = "data_2d"
 # The 2D size we want for our images
 IMAGE_SIZE = 256
 
+MANIFEST_NAME = "manifest.jsonl"
+
 # --- 2. HELPER FUNCTIONS ---
 
 def normalize(data: np.ndarray) -> np.ndarray:
@@ -42,89 +55,231 @@ def normalize(data: np.ndarray) -> np.ndarray:
     data = (data * 255).astype(np.uint8)
     return data
 
-def process_and_save_slice(image_slice, mask_slice, patient_id, slice_num, output_path):
+def prepare_slice(image_slice, mask_slice, image_size=IMAGE_SIZE):
+    """
+    Turns one raw FLAIR / SEG slice pair into (uint8 image, uint8 0/255 mask) at image_size.
+    """
+    # 1. Normalize the input image slice
+    image_slice = normalize(image_slice)
+
+    # 2. Process the mask
+    # The BraTS masks have values 0, 1, 2, 4. We want a simple binary mask (0 or 255).
+    # We'll make any pixel that is NOT 0 (background) into 255 (tumor).
+    mask_slice = (mask_slice > 0).astype(np.uint8) * 255
+
+    # 3. Resize both to our target image_size
+    image_slice = cv2.resize(image_slice, (image_size, image_size), interpolation=cv2.INTER_AREA)
+    mask_slice = cv2.resize(mask_slice, (image_size, image_size), interpolation=cv2.INTER_NEAREST)
+    return image_slice, mask_slice
+
+def process_and_save_slice(image_slice, mask_slice, patient_id, slice_num, output_path, image_size=IMAGE_SIZE):
     """
     Saves a single 2D image slice and its corresponding mask.
+    Returns (image path, mask path, tumor pixels in the saved mask, sha256 of both PNGs).
     """
     # 1. Get the paths
     img_save_path = os.path.join(output_path, "images", f"{patient_id}_{slice_num}.png")
     mask_save_path = os.path.join(output_path, "masks", f"{patient_id}_{slice_num}.png")
 
-    # 2. Normalize the input image slice
-    image_slice = normalize(image_slice)
-    
-    # 3. Process the mask
-    # The BraTS masks have values 0, 1, 2, 4. We want a simple binary mask (0 or 255).
-    # We'll make any pixel that is NOT 0 (background) into 255 (tumor).
-    mask_slice = (mask_slice > 0).astype(np.uint8) * 255
+    # 2. Normalize, binarize and resize
+    image_slice, mask_slice = prepare_slice(image_slice, mask_slice, image_size)
+
+    # 3. Save the 2D .png files (encoded once, so the manifest checksum covers the exact bytes written)
+    digest = hashlib.sha256()
+    for save_path, data in ((img_save_path, image_slice), (mask_save_path, mask_slice)):
+        ok, encoded = cv2.imencode(".png", data)
+        if not ok:
+            raise ValueError(f"Failed to encode {save_path}")
+        encoded = encoded.tobytes()
+        with open(save_path, "wb") as f:
+            f.write(encoded)
+        digest.update(encoded)
+
+    return img_save_path, mask_save_path, int(np.count_nonzero(mask_slice)), digest.hexdigest()
+
+def process_patient(folder_path: str, output_path: str, image_size: int, output_format: str = "png") -> dict:
+    """
+    Converts one patient folder and returns its manifest record.
+    Runs in a worker process, so it only takes and returns plain picklable values.
+    With output_format="shards" the slices go into one pair of .npy shards (see dataset_shards.py).
+    """
+    patient_id = os.path.basename(folder_path)
+
+    # 4. Find the required files (FLAIR and SEG)
+    try:
+        flair_path = glob.glob(os.path.join(folder_path, "*_flair.nii.gz"))[0]
+        seg_path = glob.glob(os.path.join(folder_path, "*_seg.nii.gz"))[0]
+    except IndexError:
+        return {"patient_id": patient_id, "status": "skipped", "reason": "missing flair or seg file"}
+
+    # 5. Open the 3D files. Only the label volume is read whole, in its native integer dtype;
+    #    FLAIR stays on disk behind nibabel's array proxy until a slice is needed.
+    flair_nii = nib.load(flair_path)
+    seg_img = np.asanyarray(nib.load(seg_path).dataobj) # This is a 3D (X, Y, Z) array
+
+    # 6. --- THIS IS THE CRITICAL STEP ---
+    # Find every slice with tumor in one reduction over the "Z" axis. This is the same test as
+    # the old per-slice `np.sum(mask_slice) > 0`, accumulated in float64 as before, so uint8
+    # labels can't overflow and float label files behave exactly as they did.
+    tumor_slices = np.flatnonzero(seg_img.sum(axis=(0, 1), dtype=np.float64) > 0)
+
+    record = {
+        "patient_id": patient_id,
+        "status": "done",
+        "format": output_format,
+        "image_size": image_size,
+        "slices": [],
+        "tumor_pixels": [],
+        "images": [],
+        "masks": [],
+    }
+
+    if output_format == "shards":
+        images = np.empty((len(tumor_slices), image_size, image_size), dtype=np.uint8)
+        masks = np.empty_like(images)
+        for row, z in enumerate(tumor_slices):
+            image_slice = np.asarray(flair_nii.dataobj[:, :, int(z)], dtype=np.float64)
+            images[row], masks[row] = prepare_slice(image_slice, seg_img[:, :, int(z)], image_size)
+        record["slices"] = [int(z) for z in tumor_slices]
+        record["tumor_pixels"] = [int(n) for n in np.count_nonzero(masks, axis=(1, 2))]
+        if len(tumor_slices):
+            shard = dataset_shards.write_shard(output_path, patient_id, images, masks, tumor_slices)
+            record["images"] = [os.path.join(output_path, shard["images"])]
+            record["masks"] = [os.path.join(output_path, shard["masks"])]
+            record["checksum"] = shard["checksum"]
+            record["shard"] = shard
+        return record
+
+    patient_digest = hashlib.sha256()
+
+    # 7. Read and save only the tumor-bearing slices
+    for z in tumor_slices:
+        z = int(z)
+        # float64, exactly what get_fdata() gave for this slice, without loading the volume
+        image_slice = np.asarray(flair_nii.dataobj[:, :, z], dtype=np.float64)
+        mask_slice = seg_img[:, :, z]
+
+        img_path, mask_path, tumor_pixels, slice_digest = process_and_save_slice(
+            image_slice=image_slice,
+            mask_slice=mask_slice,
+            patient_id=patient_id,
+            slice_num=z,
+            output_path=output_path,
+            image_size=image_size
+        )
+        record["slices"].append(z)
+        record["tumor_pixels"].append(tumor_pixels)
+        record["images"].append(img_path)
+        record["masks"].append(mask_path)
+        patient_digest.update(slice_digest.encode())
+
+    record["checksum"] = patient_digest.hexdigest()
+    return record
 
-    # 4. Resize both to our target IMAGE_SIZE
-    image_slice = cv2.resize(image_slice, (IMAGE_SIZE, IMAGE_SIZE), interpolation=cv2.INTER_AREA)
-    mask_slice = cv2.resize(mask_slice, (IMAGE_SIZE, IMAGE_SIZE), interpolation=cv2.INTER_NEAREST)
+def load_completed(manifest_path: str, image_size: int, output_format: str = "png") -> dict:
+    """
+    Reads the manifest and returns {patient_id: record} for patients that finished at this
+    image size and format and whose output files all still exist. Later lines win over earlier ones.
+    """
+    completed = {}
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            completed.pop(record.get("patient_id"), None)
+            if record.get("status") != "done" or record.get("image_size") != image_size:
+                continue
+            if record.get("format", "png") != output_format:
+                continue
+            if all(os.path.exists(p) for p in record["images"] + record["masks"]):
+                completed[record["patient_id"]] = record
+    return completed
 
-    # 5. Save the 2D .png files
-    cv2.imwrite(img_save_path, image_slice)
-    cv2.imwrite(mask_save_path, mask_slice)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert BraTS 2021 3D volumes into 2D tumor slices.")
+    parser.add_argument("--brats-path", default=BRATS_DATA_PATH,
+                        help="Folder that contains the BraTS2021_XXXXX patient folders.")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="Output folder for images/, masks/ and the manifest.")
+    parser.add_argument("--size", type=int, default=IMAGE_SIZE, help="Output slice size in pixels (square).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Patients processed in parallel (1 = run in this process).")
+    parser.add_argument("--format", choices=["png", "shards"], default="png",
+                        help="png: one file per slice (images/, masks/). shards: per-patient .npy shards + index.json.")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Reprocess every patient even if the manifest says it is complete.")
+    return parser.parse_args()
 
 # --- 3. MAIN SCRIPT ---
 def main():
+    args = parse_args()
     print("Starting 3D to 2D preprocessing...")
-    
+
     # 1. Create output directories
-    os.makedirs(os.path.join(OUTPUT_PATH, "images"), exist_ok=True)
-    os.makedirs(os.path.join(OUTPUT_PATH, "masks"), exist_ok=True)
-    
+    if args.format == "png":
+        os.makedirs(os.path.join(args.output, "images"), exist_ok=True)
+        os.makedirs(os.path.join(args.output, "masks"), exist_ok=True)
+    else:
+        os.makedirs(os.path.join(args.output, dataset_shards.SHARDS_DIR), exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST_NAME)
+
     # 2. Find all patient folders
-    patient_folders = glob.glob(os.path.join(BRATS_DATA_PATH, "BraTS2021_*"))
-    
+    patient_folders = sorted(glob.glob(os.path.join(args.brats_path, "BraTS2021_*")))
+
     if not patient_folders:
-        print(f"ERROR: No patient folders found at '{BRATS_DATA_PATH}'.")
-        print("Please check the 'BRATS_DATA_PATH' variable in this script.")
+        print(f"ERROR: No patient folders found at '{args.brats_path}'.")
+        print("Please check the --brats-path argument.")
         return
 
-    print(f"Found {len(patient_folders)} patient folders. Starting conversion...")
-    
-    total_slices_saved = 0
-    
-    # 3. Loop through each patient
-    for folder_path in tqdm(patient_folders, desc="Processing Patients"):
-        patient_id = os.path.basename(folder_path)
-        
-        # 4. Find the required files (FLAIR and SEG)
-        try:
-            flair_path = glob.glob(os.path.join(folder_path, "*_flair.nii.gz"))[0]
-            seg_path = glob.glob(os.path.join(folder_path, "*_seg.nii.gz"))[0]
-        except IndexError:
-            print(f"Warning: Skipping {patient_id}, missing flair or seg file.")
-            continue
-            
-        # 5. Load the 3D files
-        flair_img = nib.load(flair_path).get_fdata() # This is a 3D (X, Y, Z) array
-        seg_img = nib.load(seg_path).get_fdata()
-        
-        # 6. Iterate through the "Z" axis (the slices)
-        # flair_img.shape[2] gives us the number of slices
-        for z in range(flair_img.shape[2]):
-            image_slice = flair_img[:, :, z]
-            mask_slice = seg_img[:, :, z]
-            
-            # 7. --- THIS IS THE CRITICAL STEP ---
-            # We check if the mask slice has any tumor in it.
-            # If np.sum(mask_slice) is 0, it's an empty slice and we skip it.
-            if np.sum(mask_slice) > 0:
-                # This slice has a tumor, so we save it
-                process_and_save_slice(
-                    image_slice=image_slice,
-                    mask_slice=mask_slice,
-                    patient_id=patient_id,
-                    slice_num=z,
-                    output_path=OUTPUT_PATH
-                )
-                total_slices_saved += 1
-                
+    completed = {} if args.no_resume else load_completed(manifest_path, args.size, args.format)
+    pending = [f for f in patient_folders if os.path.basename(f) not in completed]
+    print(f"Found {len(patient_folders)} patient folders, {len(completed)} already complete. "
+          f"Converting {len(pending)} with {args.workers} worker(s)...")
+
+    total_slices_saved = sum(len(r["slices"]) for r in completed.values())
+    shard_entries = [r["shard"] for r in completed.values() if "shard" in r]
+
+    # 3. Fan patients out over the pool; the manifest is only written here, by the parent.
+    with open(manifest_path, "a") as manifest:
+        def record_result(record):
+            nonlocal total_slices_saved
+            if record["status"] == "skipped":
+                print(f"Warning: Skipping {record['patient_id']}, {record['reason']}.")
+            else:
+                total_slices_saved += len(record["slices"])
+                if "shard" in record:
+                    shard_entries.append(record["shard"])
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+
+        if args.workers <= 1:
+            for folder_path in tqdm(pending, desc="Processing Patients"):
+                try:
+                    record_result(process_patient(folder_path, args.output, args.size, args.format))
+                except Exception as e:
+                    print(f"Warning: {os.path.basename(folder_path)} failed: {e}")
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                futures = {pool.submit(process_patient, f, args.output, args.size, args.format): f for f in pending}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Processing Patients"):
+                    try:
+                        record_result(future.result())
+                    except Exception as e:
+                        print(f"Warning: {os.path.basename(futures[future])} failed: {e}")
+
+    if args.format == "shards":
+        print(f"Shard index: {dataset_shards.write_index(args.output, args.size, shard_entries)}")
+
     print("\n--- Preprocessing Complete! ---")
     print(f"Total 2D slices saved: {total_slices_saved}")
-    print(f"Your 2D dataset is ready in the '{OUTPUT_PATH}' folder.")
+    print(f"Your 2D dataset is ready in the '{args.output}' folder.")
+    print(f"Manifest: {manifest_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
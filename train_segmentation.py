@@ -2,9 +2,12 @@
 BraTS 2021 2D U-Net Training Script
 
 This script does the following:
-1.  Loads all image and mask file paths from the 'data_2d' folder.
-2.  Splits them into training (90%) and validation (10%) sets.
-3.  Creates a data generator to feed images to the model in batches.
+1.  Loads all image and mask file paths from the 'data_2d' folder
+    (or the memory-mapped shards, if it holds a dataset_shards index.json).
+2.  Pairs images with masks by file name and splits the pairs into training (90%) and
+    validation (10%) sets.
+3.  Builds tf.data pipelines (parallel decode, optional cache, seeded shuffle, prefetch)
+    to feed images to the model in batches.
 4.  Defines the 2D U-Net model architecture.
 5.  Defines the Dice Loss function (critical for segmentation).
 6.  Trains the model.
@@ -12,66 +15,153 @@ This script does the following:
 """
 
 import os
+import time
 import numpy as np
-import cv2
 import tensorflow as tf
 from sklearn.model_selection import train_test_split
 from glob import glob
+from dataset_shards import ShardedDataset, is_sharded
 
 # --- 1. Configuration ---
-DATA_PATH = "data_2d" # The folder created by preprocess_brats.py
+DATA_PATH = "data_2d" # The folder created by preprocess_brats.py (PNG folder, or shards with an index.json)
 IMAGE_SIZE = 256 # Must match the size from the preprocessing script
 BATCH_SIZE = 16   # How many images to train on at once. Lower if you run out of memory.
 EPOCHS = 10       # How many times to loop over the data. 10 is a good start.
+SEED = 42         # Train/validation split and shuffle order
+SHUFFLE_BUFFER = 4096  # Shuffle window over cached slices (only used with CACHE_DIR)
+CACHE_DIR = None  # Cache decoded slices: None = off, "" = in RAM, or a folder for on-disk cache files
 
 # --- 2. Data Loading ---
 
-def load_data(data_path):
+def pair_by_key(data_path):
     """
-    Loads all file paths and splits them into train/validation sets.
+    Matches images/<key>.png with masks/<key>.png by file name (key = "<patient>_<z>"),
+    so an image can never be paired with another slice's mask. Images without a mask are dropped.
     """
+    masks = {os.path.basename(p): p for p in glob(os.path.join(data_path, "masks", "*.png"))}
     images = sorted(glob(os.path.join(data_path, "images", "*.png")))
-    masks = sorted(glob(os.path.join(data_path, "masks", "*.png")))
+    pairs = [(p, masks[os.path.basename(p)]) for p in images if os.path.basename(p) in masks]
+    if len(pairs) < len(images):
+        print(f"Warning: {len(images) - len(pairs)} images have no matching mask and were skipped.")
+    return pairs
+
+def load_data(data_path):
+    """
+    Loads all image/mask pairs and splits them into train/validation sets with one split.
+    """
+    pairs = pair_by_key(data_path)
     
     # We have 81,437 images. Let's use 10% for validation.
-    test_size = int(len(images) * 0.1)
+    test_size = int(len(pairs) * 0.1)
     
-    train_x, valid_x = train_test_split(images, test_size=test_size, random_state=42)
-    train_y, valid_y = train_test_split(masks, test_size=test_size, random_state=42)
+    train_pairs, valid_pairs = train_test_split(pairs, test_size=test_size, random_state=SEED)
+    train_x, train_y = [list(t) for t in zip(*train_pairs)]
+    valid_x, valid_y = [list(t) for t in zip(*valid_pairs)]
     
     return (train_x, train_y), (valid_x, valid_y)
 
-def data_generator(image_paths, mask_paths, batch_size):
+def load_shard_data(data_path):
+    """
+    Same 90/10 split for a sharded dataset (see dataset_shards.py).
+    Returns the dataset plus the global slice indices of each split.
     """
-    A Python generator to feed data to model.fit() in batches.
-    This is necessary because we can't load 80,000 images into RAM.
+    dataset = ShardedDataset(data_path)
+    indices = np.arange(len(dataset))
+    test_size = int(len(indices) * 0.1)
+    train_idx, valid_idx = train_test_split(indices, test_size=test_size, random_state=SEED)
+    return dataset, np.sort(train_idx), np.sort(valid_idx)
+
+def _decode_png_pair(image_path, mask_path):
+    """PNG paths -> (uint8 image (H, W, 1), uint8 mask (H, W, 1)) at IMAGE_SIZE."""
+    image = tf.io.decode_png(tf.io.read_file(image_path), channels=1)
+    mask = tf.io.decode_png(tf.io.read_file(mask_path), channels=1)
+    # No-op for slices already at IMAGE_SIZE (what preprocess_brats.py writes).
+    image = tf.cast(tf.round(tf.image.resize(image, (IMAGE_SIZE, IMAGE_SIZE))), tf.uint8)
+    mask = tf.cast(tf.image.resize(mask, (IMAGE_SIZE, IMAGE_SIZE), method="nearest"), tf.uint8)
+    image = tf.ensure_shape(image, (IMAGE_SIZE, IMAGE_SIZE, 1))
+    mask = tf.ensure_shape(mask, (IMAGE_SIZE, IMAGE_SIZE, 1))
+    return image, mask
+
+def _shard_reader(dataset):
+    def read(index):
+        image, mask = dataset.get(int(index))
+        return image[..., np.newaxis], mask[..., np.newaxis]
+
+    def decode(index):
+        image, mask = tf.numpy_function(read, [index], (tf.uint8, tf.uint8))
+        image.set_shape((IMAGE_SIZE, IMAGE_SIZE, 1))
+        mask.set_shape((IMAGE_SIZE, IMAGE_SIZE, 1))
+        return image, mask
+    return decode
+
+def _to_model_inputs(image, mask):
+    # Grayscale slices go in as 3 equal channels, exactly like cv2.imread(..., IMREAD_COLOR) did.
+    image = tf.tile(tf.cast(image, tf.float32) / 255.0, [1, 1, 3])
+    mask = tf.cast(mask, tf.float32) / 255.0
+    return image, mask
+
+def make_dataset(source, batch_size, training, cache_path=None, seed=SEED):
     """
-    L = len(image_paths)
-    while True:
-        # Create empty arrays to hold one batch
-        batch_img = np.zeros((batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
-        batch_mask = np.zeros((batch_size, IMAGE_SIZE, IMAGE_SIZE, 1), dtype=np.float32)
-        
-        # Get a batch of random indices
-        indices = np.random.choice(L, batch_size)
-        
-        for i, index in enumerate(indices):
-            # Load image
-            img = cv2.imread(image_paths[index], cv2.IMREAD_COLOR)
-            img = cv2.resize(img, (IMAGE_SIZE, IMAGE_SIZE))
-            img = img / 255.0 # Normalize to 0-1
-            
-            # Load mask
-            mask = cv2.imread(mask_paths[index], cv2.IMREAD_GRAYSCALE)
-            mask = cv2.resize(mask, (IMAGE_SIZE, IMAGE_SIZE))
-            mask = mask / 255.0 # Normalize to 0-1
-            mask = np.expand_dims(mask, axis=-1) # Add channel dimension
-            
-            batch_img[i] = img
-            batch_mask[i] = mask
-            
-        # yield returns the data and pauses the function
-        yield batch_img, batch_mask
+    tf.data input pipeline over either (image paths, mask paths) or (ShardedDataset, indices).
+
+    Each epoch visits every slice exactly once. Training order is a seeded shuffle that
+    changes every epoch; validation keeps a fixed order. Decoding runs in parallel and
+    batches are prefetched so the accelerator never waits on Python.
+
+    cache_path: decoded uint8 slices are cached there after the first epoch
+    ("" = in memory, None = no cache). With a cache, shuffling uses a SHUFFLE_BUFFER window
+    over the cached stream instead of a full permutation of the file list.
+    """
+    if isinstance(source[0], ShardedDataset):
+        dataset, indices = source
+        ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+        decode = _shard_reader(dataset)
+        count = len(indices)
+    else:
+        image_paths, mask_paths = source
+        ds = tf.data.Dataset.from_tensor_slices((list(image_paths), list(mask_paths)))
+        decode = _decode_png_pair
+        count = len(image_paths)
+
+    if training and cache_path is None:
+        # Shuffle the (cheap) file list before decoding: a full permutation, no replacement.
+        ds = ds.shuffle(count, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(decode, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    if cache_path is not None:
+        ds = ds.cache(cache_path)
+        if training:
+            ds = ds.shuffle(min(count, SHUFFLE_BUFFER), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(_to_model_inputs, num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.batch(batch_size, drop_remainder=training)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+class InputStallMonitor(tf.keras.callbacks.Callback):
+    """
+    Reports how long each epoch spent waiting for input: the gap between the end of one
+    training step and the start of the next, which is where model.fit pulls the next batch.
+    """
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+        self.last_batch_end = None
+        self.stall_seconds = 0.0
+        self.steps = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.last_batch_end is not None:
+            self.stall_seconds += time.perf_counter() - self.last_batch_end
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.last_batch_end = time.perf_counter()
+        self.steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.epoch_start
+        per_step_ms = 1000 * self.stall_seconds / max(self.steps - 1, 1)
+        print(f"\nInput pipeline: {self.stall_seconds:.1f}s of {elapsed:.1f}s waiting for data "
+              f"({100 * self.stall_seconds / max(elapsed, 1e-9):.1f}%, {per_step_ms:.1f} ms/step)")
+        if logs is not None:
+            logs["input_stall_seconds"] = self.stall_seconds
 
 # --- 3. U-Net Model Architecture ---
 # This is our "algorithm reference"
@@ -136,12 +226,25 @@ def dice_loss(y_true, y_pred, smooth=1e-6):
 # --- 5. Main Training Function ---
 def main():
     print("Loading and splitting data...")
-    (train_x, train_y), (valid_x, valid_y) = load_data(DATA_PATH)
-    print(f"Data loaded: {len(train_x)} training, {len(valid_x)} validation.")
+    if is_sharded(DATA_PATH):
+        dataset, train_idx, valid_idx = load_shard_data(DATA_PATH)
+        train_source, valid_source = (dataset, train_idx), (dataset, valid_idx)
+        print(f"Sharded data loaded: {len(train_idx)} training, {len(valid_idx)} validation.")
+    else:
+        (train_x, train_y), (valid_x, valid_y) = load_data(DATA_PATH)
+        train_source, valid_source = (train_x, train_y), (valid_x, valid_y)
+        print(f"Data loaded: {len(train_x)} training, {len(valid_x)} validation.")
 
-    print("Creating data generators...")
-    train_gen = data_generator(train_x, train_y, BATCH_SIZE)
-    valid_gen = data_generator(valid_x, valid_y, BATCH_SIZE)
+    print("Creating tf.data pipelines...")
+    train_cache = valid_cache = None
+    if CACHE_DIR is not None:
+        if CACHE_DIR:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            train_cache, valid_cache = os.path.join(CACHE_DIR, "train"), os.path.join(CACHE_DIR, "valid")
+        else:
+            train_cache = valid_cache = ""
+    train_ds = make_dataset(train_source, BATCH_SIZE, training=True, cache_path=train_cache)
+    valid_ds = make_dataset(valid_source, BATCH_SIZE, training=False, cache_path=valid_cache)
 
     print("Building U-Net model...")
     model = build_unet((IMAGE_SIZE, IMAGE_SIZE, 3))
@@ -153,17 +256,12 @@ def main():
     
     print("\n--- Starting Model Training ---")
     
-    # Calculate steps per epoch
-    train_steps = len(train_x) // BATCH_SIZE
-    valid_steps = len(valid_x) // BATCH_SIZE
-
-    # Train the model
+    # Train the model (each epoch is one full pass over the data, so no steps_per_epoch needed)
     model.fit(
-        train_gen,
-        validation_data=valid_gen,
-        steps_per_epoch=train_steps,
-        validation_steps=valid_steps,
-        epochs=EPOCHS
+        train_ds,
+        validation_data=valid_ds,
+        epochs=EPOCHS,
+        callbacks=[InputStallMonitor()]
     )
     
     print("\n--- Training Complete ---")